@@ -4,21 +4,42 @@ from .transaction_manager import TransactionManager
 db = TransactionManager()
 
 # 导出常用函数，方便直接使用
-def add_image(image_data: dict, description: str) -> str:
+def add_image(image_data: dict, description: str) -> int:
     """添加图片到数据库"""
     return db.add_image(image_data, description)
 
+def add_images(items: list) -> list:
+    """批量添加图片到数据库"""
+    return db.add_images(items)
+
 def delete_image(file_path: str):
     """删除图片"""
     db.delete_image(file_path)
 
-def get_image_by_id(image_id: str) -> dict:
+def delete_images(file_paths: list):
+    """批量删除图片"""
+    db.delete_images(file_paths)
+
+def rename_image(old_path: str, new_path: str) -> int:
+    """文件改名或移动后更新路径，原路径没有记录时返回 None"""
+    return db.rename_image(old_path, new_path)
+
+def get_image_by_id(image_id: int) -> dict:
     """根据ID获取图片信息"""
     return db.get_image_by_id(image_id)
 
-def search_similar_images(query: str, limit: int = 10) -> list:
+def get_images_by_ids(image_ids: list) -> list:
+    """根据ID批量获取图片信息，保持传入顺序"""
+    return db.get_images_by_ids(image_ids)
+
+def search_similar_images(query: str, limit: int = 10, filters: dict = None, mode: str = None) -> list:
     """搜索相似图片"""
-    return db.search_similar_images(query, limit)
+    return db.search_similar_images(query, limit, filters, mode)
+
+def search_page(query: str, page_size: int = 20, cursor: str = None, filters: dict = None,
+                mode: str = None, max_distance: float = None, max_image_distance: float = None) -> dict:
+    """分页搜索图片"""
+    return db.search_page(query, page_size, cursor, filters, mode, max_distance, max_image_distance)
 
 def transaction():
     """获取事务上下文管理器"""
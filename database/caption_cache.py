@@ -0,0 +1,102 @@
+import threading
+from array import array
+from typing import Dict, List, Optional
+from utils.logger import Logger
+from .db_manager import DatabaseManager
+
+
+class CaptionCache:
+    """按文件内容哈希缓存的图片描述
+
+    以 (md5, 模型标识, 生成档位) 为键，复制、备份恢复或重新添加目录后，
+    同样字节的图片直接复用已有描述和向量，不再重新推理。
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._init_cache()
+        return cls._instance
+
+    def _init_cache(self):
+        """初始化缓存"""
+        self.logger = Logger()
+        self.db_manager = DatabaseManager()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def encode_embedding(embedding) -> Optional[bytes]:
+        """向量编码为 float32 字节串"""
+        if embedding is None:
+            return None
+        return array('f', embedding).tobytes()
+
+    @staticmethod
+    def decode_embedding(blob: Optional[bytes]) -> Optional[List[float]]:
+        """float32 字节串解码为向量"""
+        if not blob:
+            return None
+        vector = array('f')
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    def lookup(self, md5s: List[str], model_id: str, profile: str) -> Dict[str, tuple]:
+        """批量查询缓存
+
+        Args:
+            md5s: 文件 MD5 列表
+            model_id: 描述模型标识
+            profile: 生成档位
+
+        Returns:
+            dict: md5 -> (caption, embedding, embedding_model)，未命中的 md5 不在结果中
+        """
+        unique_md5s = list(dict.fromkeys(md5 for md5 in md5s if md5))
+        if not unique_md5s:
+            return {}
+        try:
+            results = self.db_manager.get_cached_captions(unique_md5s, model_id, profile)
+        except Exception as e:
+            # 缓存不可用时退化为重新推理
+            self.logger.error(f"[CaptionCache.lookup] 查询描述缓存失败: {str(e)}")
+            results = {}
+        with self._lock:
+            self.hits += len(results)
+            self.misses += len(unique_md5s) - len(results)
+        return results
+
+    def store(self, entries: List[tuple], model_id: str, profile: str, embedding_model: str = None):
+        """批量写入缓存
+
+        Args:
+            entries: (md5, caption, embedding) 列表，embedding 为向量或 None
+            model_id: 描述模型标识
+            profile: 生成档位
+            embedding_model: 计算向量所用的模型
+        """
+        rows = [(md5, model_id, profile, caption, self.encode_embedding(embedding),
+                 embedding_model if embedding is not None else None)
+                for md5, caption, embedding in entries if md5 and caption]
+        try:
+            self.db_manager.put_cached_captions(rows)
+        except Exception as e:
+            self.logger.error(f"[CaptionCache.store] 写入描述缓存失败: {str(e)}")
+
+    def get_stats(self) -> dict:
+        """获取缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+    def reset_stats(self):
+        """清零命中统计"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,59 @@
+import sqlite3
+import threading
+from typing import List
+from utils.logger import Logger
+
+
+class ConnectionPool:
+    """SQLite 连接池：每个线程一个长期保持的连接
+
+    数据库使用 WAL 日志，读连接不会被索引线程的写事务阻塞。
+    sqlite3 连接不能跨线程使用，线程结束后连接随线程局部存储一起释放。
+    """
+
+    def __init__(self, db_path: str, cache_size_mb: int = 64, mmap_size_mb: int = 256,
+                 busy_timeout_ms: int = 5000, functions: List[tuple] = None):
+        """
+        Args:
+            db_path: 数据库文件路径
+            cache_size_mb: 每个连接的页缓存大小（MB）
+            mmap_size_mb: 内存映射读取的大小上限（MB），0 表示不使用
+            busy_timeout_ms: 等待其他连接释放写锁的时间（毫秒）
+            functions: 每个连接注册的 SQL 函数，(名称, 参数个数, 函数) 列表
+        """
+        self.db_path = db_path
+        self.cache_size_mb = cache_size_mb
+        self.mmap_size_mb = mmap_size_mb
+        self.busy_timeout_ms = busy_timeout_ms
+        self.functions = functions or []
+        self.logger = Logger()
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        """获取当前线程的连接，第一次调用时创建"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000)
+        # 写语句前自动开始 IMMEDIATE 事务，避免读事务升级为写事务时死锁
+        conn.isolation_level = 'IMMEDIATE'
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = {-self.cache_size_mb * 1024}')
+        conn.execute(f'PRAGMA mmap_size = {self.mmap_size_mb * 1024 * 1024}')
+        conn.execute(f'PRAGMA busy_timeout = {self.busy_timeout_ms}')
+        for name, num_params, func in self.functions:
+            conn.create_function(name, num_params, func, deterministic=True)
+        self.logger.info(f"[ConnectionPool._open] 线程 {threading.current_thread().name} 已打开数据库连接")
+        return conn
+
+    def close(self):
+        """关闭当前线程的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
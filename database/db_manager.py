@@ -1,7 +1,37 @@
-import sqlite3
 import os
+import re
+import json
+import threading
+from contextlib import contextmanager
 from utils.logger import Logger
-from typing import List
+from utils.config_manager import ConfigManager
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from .connection_pool import ConnectionPool
+from .migrations import migrate
+from .search_filters import build_sql_conditions, file_directory
+
+
+def build_fts_query(text: str) -> str:
+    """查询文本转为 FTS5 MATCH 表达式：每个词作为前缀匹配的短语，词之间为 AND
+
+    只保留词字符，用户输入不会被解析为 FTS5 语法。
+    """
+    tokens = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+# 分页读取记录时每页的条数
+RECORD_CHUNK_SIZE = 1000
+
+
+class ImageRecord(NamedTuple):
+    """同步比对用的精简图片记录"""
+    id: int
+    file_path: str
+    file_size: int
+    md5: str
+    modified_time: str
+
 
 class DatabaseManager:
     _instance = None
@@ -16,26 +46,39 @@ class DatabaseManager:
         """初始化数据库"""
         self.db_path = "everypic.db"
         self.logger = Logger()
-        self.conn = None
+        # 每个线程各自的事务连接
+        self._local = threading.local()
+        config = ConfigManager()
+        self.pool = ConnectionPool(
+            self.db_path,
+            cache_size_mb=config.get_sqlite_cache_size_mb(),
+            mmap_size_mb=config.get_sqlite_mmap_size_mb(),
+            busy_timeout_ms=config.get_sqlite_busy_timeout_ms()
+        )
         self.create_tables()
+
+    @property
+    def conn(self):
+        """当前线程进行中的事务连接，没有事务时为 None"""
+        return getattr(self._local, 'transaction', None)
+
+    @contextmanager
+    def _connect(self):
+        """获取当前线程的连接
+
+        不在事务中时，退出时提交（出错时回滚）；在事务中时由事务统一提交。
+        """
+        conn = self.pool.connection()
+        if self.conn is not None:
+            yield conn
+            return
+        with conn:
+            yield conn
     
     def create_tables(self):
-        """创建数据库表"""
+        """创建数据库表，已有数据库按版本执行迁移"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS images (
-                        id TEXT PRIMARY KEY,
-                        file_path TEXT NOT NULL UNIQUE,
-                        file_name TEXT NOT NULL,
-                        file_size INTEGER,
-                        md5 TEXT,
-                        created_time TEXT,
-                        modified_time TEXT
-                    )
-                ''')
-                conn.commit()
+            migrate(self.pool.connection())
         except Exception as e:
             self.logger.error(f"[DatabaseManager.create_tables] 创建数据库表失败: {str(e)}")
             raise
@@ -45,8 +88,9 @@ class DatabaseManager:
         if self.conn is not None:
             self.logger.warning("[DatabaseManager.begin_transaction] 已有未完成的事务")
             return
-        self.conn = sqlite3.connect(self.db_path)
-        self.conn.isolation_level = 'IMMEDIATE'  # 设置隔离级别
+        conn = self.pool.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        self._local.transaction = conn
     
     def commit_transaction(self):
         """提交事务"""
@@ -59,10 +103,10 @@ class DatabaseManager:
             return True
         except Exception as e:
             self.logger.error(f"[DatabaseManager.commit_transaction] 提交事务失败: {str(e)}")
+            self.conn.rollback()
             raise
         finally:
-            self.conn.close()
-            self.conn = None
+            self._local.transaction = None
     
     def rollback_transaction(self):
         """回滚事务"""
@@ -73,92 +117,202 @@ class DatabaseManager:
             self.conn.rollback()
             self.logger.info("[DatabaseManager.rollback_transaction] 事务已回滚")
         finally:
-            self.conn.close()
-            self.conn = None
+            self._local.transaction = None
+
+    def add_image(self, image_data: dict, in_transaction=False) -> int:
+        """添加图片信息到数据库，返回图片ID"""
+        return self.add_images([image_data], in_transaction)[image_data['file_path']]
+
+    def add_images(self, rows: List[dict], in_transaction=False) -> Dict[str, int]:
+        """批量添加或更新图片信息
+
+        已存在的图片只在文件大小、修改时间、描述、描述模型、描述档位或拍摄时间变化时更新，
+        写入和全文索引更新都按批执行。
 
-    def add_image(self, image_data: dict, in_transaction=False):
-        """添加图片信息到数据库"""
+        Args:
+            rows: 图片信息字典列表，字段同 add_image；同一路径出现多次时以最后一条为准
+            in_transaction: 是否在已开始的事务中执行
+
+        Returns:
+            Dict[str, int]: 文件路径 -> 图片ID，包括没有变化的图片
+        """
+        if not rows:
+            return {}
+        rows = list({image_data['file_path']: image_data for image_data in rows}.values())
         try:
             if not in_transaction:
                 self.begin_transaction()
-            
+
             cursor = self.conn.cursor()
-            # 添加日志
-            self.logger.info(f"[DatabaseManager.add_image] 尝试添加/更新图片: {image_data['file_path']}")
-            self.logger.info(f"[DatabaseManager.add_image] 图片ID: {image_data['id']}")
-            
+            paths = json.dumps([image_data['file_path'] for image_data in rows])
             cursor.execute('''
-                SELECT id, file_size, modified_time 
-                FROM images WHERE file_path = ?
-            ''', (image_data['file_path'],))
-            existing = cursor.fetchone()
-            
-            if existing:
-                self.logger.info(f"[DatabaseManager.add_image] 找到已存在记录: {existing}")
-                # 只有当文件大小或修改时间发生变化时才更新
-                if (existing[1] != image_data['file_size'] or 
-                    existing[2] != image_data['modified_time']):
-                    cursor.execute('''
-                        UPDATE images SET
-                            file_name = ?, file_size = ?, md5 = ?,
-                            created_time = ?, modified_time = ?
-                        WHERE id = ?
-                    ''', (
-                        image_data['file_name'],
-                        image_data['file_size'],
-                        image_data['md5'],
-                        image_data['created_time'],
-                        image_data['modified_time'],
-                        existing[0]
-                    ))
-            else:
-                # 插入新记录
-                cursor.execute('''
+                SELECT file_path, file_size, modified_time, caption_profile, capture_time,
+                       caption, caption_model
+                FROM json_each(?) AS paths
+                JOIN images ON images.file_path = paths.value
+            ''', (paths,))
+            existing = {row[0]: row[1:] for row in cursor.fetchall()}
+            changed = [
+                image_data for image_data in rows
+                if existing.get(image_data['file_path']) != (
+                    image_data['file_size'], image_data['modified_time'],
+                    image_data.get('caption_profile'), image_data.get('capture_time'),
+                    image_data.get('caption'), image_data.get('caption_model')
+                )
+            ]
+
+            if changed:
+                # 新图片由 SQLite 分配整数ID；冲突时保留原有ID，只在属性变化时更新
+                cursor.executemany('''
                     INSERT INTO images (
-                        id, file_path, file_name, file_size, md5,
-                        created_time, modified_time
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    image_data['id'],
+                        file_path, file_name, file_size, md5,
+                        created_time, modified_time, caption_profile,
+                        capture_time, extension, directory, caption, caption_model
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (file_path) DO UPDATE SET
+                        file_name = excluded.file_name,
+                        file_size = excluded.file_size,
+                        md5 = excluded.md5,
+                        created_time = excluded.created_time,
+                        modified_time = excluded.modified_time,
+                        caption_profile = excluded.caption_profile,
+                        capture_time = excluded.capture_time,
+                        extension = excluded.extension,
+                        directory = excluded.directory,
+                        caption = excluded.caption,
+                        caption_model = excluded.caption_model
+                    WHERE images.file_size IS NOT excluded.file_size
+                       OR images.modified_time IS NOT excluded.modified_time
+                       OR images.caption_profile IS NOT excluded.caption_profile
+                       OR images.capture_time IS NOT excluded.capture_time
+                       OR images.caption IS NOT excluded.caption
+                       OR images.caption_model IS NOT excluded.caption_model
+                ''', [(
                     image_data['file_path'],
                     image_data['file_name'],
                     image_data['file_size'],
                     image_data['md5'],
                     image_data['created_time'],
-                    image_data['modified_time']
-                ))
-            
+                    image_data['modified_time'],
+                    image_data.get('caption_profile'),
+                    image_data.get('capture_time'),
+                    os.path.splitext(image_data['file_path'])[1].lower(),
+                    file_directory(image_data['file_path']),
+                    image_data.get('caption'),
+                    image_data.get('caption_model')
+                ) for image_data in changed])
+
+                # 有变化的图片重写全文索引，全文索引的 rowid 即图片ID
+                cursor.executemany('''
+                    DELETE FROM images_fts WHERE rowid = (SELECT id FROM images WHERE file_path = ?)
+                ''', [(image_data['file_path'],) for image_data in changed])
+                cursor.executemany('''
+                    INSERT INTO images_fts (rowid, file_name, caption)
+                    SELECT id, ?, ? FROM images WHERE file_path = ?
+                ''', [(image_data['file_name'], image_data.get('caption') or '', image_data['file_path'])
+                      for image_data in changed])
+
+            cursor.execute('''
+                SELECT file_path, images.id FROM json_each(?) AS paths
+                JOIN images ON images.file_path = paths.value
+            ''', (paths,))
+            image_ids = dict(cursor.fetchall())
+
             if not in_transaction:
                 self.commit_transaction()
-                
+            self.logger.info(f"[DatabaseManager.add_images] 写入图片记录: {len(changed)}/{len(rows)} 条有变化")
+            return image_ids
+
         except Exception as e:
             if not in_transaction:
                 self.rollback_transaction()
-            self.logger.error(f"[DatabaseManager.add_image] 添加图片记录失败: {str(e)}")
+            self.logger.error(f"[DatabaseManager.add_images] 批量添加图片记录失败: {str(e)}")
             raise
 
-    def delete_image_by_path(self, file_path: str, in_transaction=False):
+    def delete_image_by_path(self, file_path: str, in_transaction=False) -> List[int]:
         """根据文件路径删除图片记录"""
+        return self.delete_images_by_paths([file_path], in_transaction)
+
+    def delete_images_by_paths(self, file_paths: List[str], in_transaction=False) -> List[int]:
+        """根据文件路径批量删除图片记录和全文索引
+
+        Returns:
+            List[int]: 被删除的图片ID，没有记录的路径不出现
+        """
+        if not file_paths:
+            return []
         try:
             if not in_transaction:
                 self.begin_transaction()
-                
+
             cursor = self.conn.cursor()
-            cursor.execute('DELETE FROM images WHERE file_path = ?', (file_path,))
-            
+            cursor.execute('''
+                SELECT images.id FROM json_each(?) AS paths
+                JOIN images ON images.file_path = paths.value
+            ''', (json.dumps(list(file_paths)),))
+            image_ids = [row[0] for row in cursor.fetchall()]
+            ids = json.dumps(image_ids)
+            cursor.execute('DELETE FROM images_fts WHERE rowid IN (SELECT value FROM json_each(?))', (ids,))
+            cursor.execute('DELETE FROM images WHERE id IN (SELECT value FROM json_each(?))', (ids,))
+
             if not in_transaction:
                 self.commit_transaction()
-                
+            return image_ids
+
         except Exception as e:
             if not in_transaction:
                 self.rollback_transaction()
-            self.logger.error(f"[DatabaseManager.delete_image_by_path] 删除图片记录失败: {str(e)}")
+            self.logger.error(f"[DatabaseManager.delete_images_by_paths] 删除图片记录失败: {str(e)}")
             raise
 
-    def get_image_by_id(self, image_id: str) -> dict:
+    def rename_image(self, old_path: str, new_path: str, in_transaction=False) -> Optional[dict]:
+        """文件改名或移动后原地更新路径，图片ID和描述不变
+
+        目标路径已有记录时先删除该记录。
+
+        Returns:
+            dict: id、file_size、capture_time，以及被替换记录的 replaced_id（没有时为 None）；
+                原路径没有记录时返回 None
+        """
+        try:
+            if not in_transaction:
+                self.begin_transaction()
+
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT id, file_size, capture_time, caption FROM images WHERE file_path = ?',
+                           (old_path,))
+            row = cursor.fetchone()
+            result = None
+            if row is not None:
+                image_id, file_size, capture_time, caption = row
+                replaced = self.delete_images_by_paths([new_path], in_transaction=True)
+                file_name = os.path.basename(new_path)
+                cursor.execute('''
+                    UPDATE images SET file_path = ?, file_name = ?, extension = ?, directory = ?
+                    WHERE id = ?
+                ''', (new_path, file_name, os.path.splitext(new_path)[1].lower(),
+                      file_directory(new_path), image_id))
+                # 全文索引包含文件名，随之重写
+                cursor.execute('DELETE FROM images_fts WHERE rowid = ?', (image_id,))
+                cursor.execute('INSERT INTO images_fts (rowid, file_name, caption) VALUES (?, ?, ?)',
+                               (image_id, file_name, caption or ''))
+                result = {'id': image_id, 'file_size': file_size, 'capture_time': capture_time,
+                          'replaced_id': replaced[0] if replaced else None}
+
+            if not in_transaction:
+                self.commit_transaction()
+            return result
+
+        except Exception as e:
+            if not in_transaction:
+                self.rollback_transaction()
+            self.logger.error(f"[DatabaseManager.rename_image] 更新图片路径失败: {str(e)}")
+            raise
+
+    def get_image_by_id(self, image_id: int) -> dict:
         """根据ID获取图片信息"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT id, file_path, file_name, file_size, md5, 
@@ -181,22 +335,339 @@ class DatabaseManager:
             self.logger.error(f"[DatabaseManager.get_image_by_id] 获取图片记录失败: {str(e)}")
             raise 
     
+    def get_images_by_ids(self, image_ids: List[int]) -> List[dict]:
+        """根据ID批量获取图片信息，一次查询完成
+
+        Args:
+            image_ids: 图片ID列表，通常是按相关度排好的检索结果
+
+        Returns:
+            List[dict]: 图片信息，顺序与 image_ids 一致，不存在的ID被跳过
+        """
+        if not image_ids:
+            return []
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                # 整个ID列表作为一个 JSON 参数传入，不受 SQLite 参数个数上限影响
+                cursor.execute('''
+                    SELECT images.id, file_path, file_name, file_size, md5,
+                           created_time, modified_time
+                    FROM json_each(?) AS ids
+                    JOIN images ON images.id = ids.value
+                    ORDER BY ids.key
+                ''', (json.dumps(list(image_ids)),))
+                return [{
+                    'id': row[0],
+                    'file_path': row[1],
+                    'file_name': row[2],
+                    'file_size': row[3],
+                    'md5': row[4],
+                    'created_time': row[5],
+                    'modified_time': row[6]
+                } for row in cursor.fetchall()]
+        except Exception as e:
+            self.logger.error(f"[DatabaseManager.get_images_by_ids] 批量获取图片记录失败: {str(e)}")
+            raise
+
+    def get_paths_by_caption_profile(self, exclude_profile: str, limit: int) -> List[str]:
+        """获取描述档位不是 exclude_profile 的图片路径，用于后台升级描述"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT file_path FROM images
+                    WHERE caption_profile IS NULL OR caption_profile != ?
+                    LIMIT ?
+                ''', (exclude_profile, limit))
+                return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            self.logger.error(f"[DatabaseManager.get_paths_by_caption_profile] 获取待升级图片失败: {str(e)}")
+            raise
+
+    def get_image_ids_by_filters(self, filters: dict, limit: int) -> List[int]:
+        """按拍摄时间、扩展名、文件大小条件筛选图片ID（走索引）
+
+        Args:
+            filters: search_filters.normalize_filters 的结果，只使用 SQLite 可处理的条件
+            limit: 返回数量上限
+        """
+        clauses, params = build_sql_conditions(filters)
+        sql = 'SELECT id FROM images'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' LIMIT ?'
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(sql, (*params, limit))
+                return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            self.logger.error(f"[DatabaseManager.get_image_ids_by_filters] 按条件筛选图片失败: {str(e)}")
+            raise
+
+    def search_keywords(self, query: str, limit: int, filters: dict = None) -> List[int]:
+        """在描述和文件名的全文索引中检索，按 BM25 相关度返回图片ID
+
+        Args:
+            query: 查询文本
+            limit: 返回数量上限
+            filters: search_filters.normalize_filters 的结果（可选）
+        """
+        match = build_fts_query(query)
+        if not match:
+            return []
+        clauses, params = build_sql_conditions(filters or {})
+        sql = '''
+            SELECT images.id FROM images_fts
+            JOIN images ON images.id = images_fts.rowid
+            WHERE images_fts MATCH ?
+        '''
+        if clauses:
+            sql += ' AND ' + ' AND '.join(clauses)
+        sql += ' ORDER BY bm25(images_fts) LIMIT ?'
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(sql, (match, *params, limit))
+                return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            self.logger.error(f"[DatabaseManager.search_keywords] 全文检索失败: {str(e)}")
+            raise
+
+    def get_keyword_captions(self, image_ids: List[int]) -> dict:
+        """从全文索引批量读取图片描述
+
+        Returns:
+            dict: 图片ID -> 描述，没有描述的图片不出现
+        """
+        if not image_ids:
+            return {}
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                # ID列表作为一个 JSON 参数传入，不受 SQLite 参数个数上限影响
+                cursor.execute('''
+                    SELECT images.id, images_fts.caption FROM json_each(?) AS ids
+                    JOIN images ON images.id = ids.value
+                    JOIN images_fts ON images_fts.rowid = images.id
+                ''', (json.dumps([int(image_id) for image_id in image_ids]),))
+                return {image_id: caption for image_id, caption in cursor.fetchall() if caption}
+        except Exception as e:
+            self.logger.error(f"[DatabaseManager.get_keyword_captions] 查询描述失败: {str(e)}")
+            raise
+
+    def get_cached_captions(self, md5s: List[str], model_id: str, profile: str) -> dict:
+        """批量查询描述缓存
+
+        Returns:
+            dict: md5 -> (caption, embedding, embedding_model)，embedding 可能为 None
+        """
+        results = {}
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                # 分段查询，避免超过 SQLite 参数个数上限
+                for i in range(0, len(md5s), 500):
+                    chunk = md5s[i:i + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    cursor.execute(f'''
+                        SELECT md5, caption, embedding, embedding_model FROM caption_cache
+                        WHERE model_id = ? AND profile = ? AND md5 IN ({placeholders})
+                    ''', (model_id, profile, *chunk))
+                    for md5, caption, embedding, embedding_model in cursor.fetchall():
+                        results[md5] = (caption, embedding, embedding_model)
+            return results
+        except Exception as e:
+            self.logger.error(f"[DatabaseManager.get_cached_captions] 查询描述缓存失败: {str(e)}")
+            raise
+
+    def put_cached_captions(self, rows: List[tuple]):
+        """批量写入描述缓存
+
+        Args:
+            rows: (md5, model_id, profile, caption, embedding, embedding_model) 列表
+        """
+        if not rows:
+            return
+        try:
+            with self._connect() as conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO caption_cache (
+                        md5, model_id, profile, caption, embedding, embedding_model, created_time
+                    ) VALUES (?, ?, ?, ?, ?, ?, datetime('now', 'localtime'))
+                ''', rows)
+        except Exception as e:
+            self.logger.error(f"[DatabaseManager.put_cached_captions] 写入描述缓存失败: {str(e)}")
+            raise
+
+    def clear_images(self):
+        """清空图片记录和全文索引，保留表结构"""
+        try:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM images_fts')
+                conn.execute('DELETE FROM images')
+            self.logger.info("[DatabaseManager.clear_images] 已清空图片记录")
+        except Exception as e:
+            self.logger.error(f"[DatabaseManager.clear_images] 清空图片记录失败: {str(e)}")
+            raise
+
     def drop_table(self, table_name: str):
         """删除指定的表"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute(f'DROP TABLE IF EXISTS {table_name}')
-                conn.commit()
                 self.logger.info(f"[DatabaseManager.drop_table] 已删除表: {table_name}")
         except Exception as e:
             self.logger.error(f"[DatabaseManager.drop_table] 删除表失败: {str(e)}")
             raise
 
+    def iter_records(self, chunk_size: int = RECORD_CHUNK_SIZE) -> Iterator[List[ImageRecord]]:
+        """按文件路径顺序分页读取全部图片记录
+
+        每页是一次独立的查询，按 file_path 索引从上一页最后的路径往后取，
+        翻页之间不占用游标，调用方可以在两页之间写库。
+
+        Yields:
+            List[ImageRecord]: 每页的记录
+        """
+        last_path = ''
+        while True:
+            try:
+                with self._connect() as conn:
+                    cursor = conn.execute('''
+                        SELECT id, file_path, file_size, md5, modified_time FROM images
+                        WHERE file_path > ? ORDER BY file_path LIMIT ?
+                    ''', (last_path, chunk_size))
+                    chunk = [ImageRecord(*row) for row in cursor.fetchmany(chunk_size)]
+            except Exception as e:
+                self.logger.error(f"[DatabaseManager.iter_records] 分页读取记录失败: {str(e)}")
+                raise
+            if not chunk:
+                return
+            yield chunk
+            last_path = chunk[-1].file_path
+
+    def iter_captions(self, chunk_size: int = RECORD_CHUNK_SIZE) -> Iterator[List[tuple]]:
+        """按文件路径顺序分页读取有描述的图片，用于重建描述向量
+
+        Yields:
+            List[tuple]: 每页的 (图片ID, 文件路径, 描述, 文件大小, 拍摄时间)
+        """
+        last_path = ''
+        while True:
+            try:
+                with self._connect() as conn:
+                    cursor = conn.execute('''
+                        SELECT id, file_path, caption, file_size, capture_time FROM images
+                        WHERE file_path > ? AND caption IS NOT NULL
+                        ORDER BY file_path LIMIT ?
+                    ''', (last_path, chunk_size))
+                    chunk = cursor.fetchmany(chunk_size)
+            except Exception as e:
+                self.logger.error(f"[DatabaseManager.iter_captions] 分页读取描述失败: {str(e)}")
+                raise
+            if not chunk:
+                return
+            yield chunk
+            last_path = chunk[-1][1]
+
+    def iter_ids_without_caption(self, chunk_size: int = RECORD_CHUNK_SIZE) -> Iterator[List[int]]:
+        """按ID顺序分页读取 images 中没有描述的图片ID
+
+        Yields:
+            List[int]: 每页的图片ID
+        """
+        last_id = 0
+        while True:
+            try:
+                with self._connect() as conn:
+                    cursor = conn.execute('''
+                        SELECT id FROM images WHERE id > ? AND caption IS NULL ORDER BY id LIMIT ?
+                    ''', (last_id, chunk_size))
+                    chunk = [row[0] for row in cursor.fetchall()]
+            except Exception as e:
+                self.logger.error(f"[DatabaseManager.iter_ids_without_caption] 分页读取图片ID失败: {str(e)}")
+                raise
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1]
+
+    def set_captions(self, captions: Dict[int, str]):
+        """补写图片描述，同时更新全文索引；已有描述的图片不覆盖
+
+        Args:
+            captions: 图片ID -> 描述
+        """
+        if not captions:
+            return
+        try:
+            with self._connect() as conn:
+                for image_id, caption in captions.items():
+                    cursor = conn.execute('UPDATE images SET caption = ? WHERE id = ? AND caption IS NULL',
+                                          (caption, image_id))
+                    if not cursor.rowcount:
+                        continue
+                    # 只重写本次补上描述的图片的全文索引，与其他写入一样先删除再插入
+                    conn.execute('DELETE FROM images_fts WHERE rowid = ?', (image_id,))
+                    conn.execute('''
+                        INSERT INTO images_fts (rowid, file_name, caption)
+                        SELECT id, file_name, caption FROM images WHERE id = ?
+                    ''', (image_id,))
+        except Exception as e:
+            self.logger.error(f"[DatabaseManager.set_captions] 补写图片描述失败: {str(e)}")
+            raise
+
+    def get_existing_ids(self, image_ids: List[int]) -> set:
+        """image_ids 中在 images 表里有记录的ID"""
+        if not image_ids:
+            return set()
+        try:
+            with self._connect() as conn:
+                cursor = conn.execute('''
+                    SELECT images.id FROM json_each(?) AS ids
+                    JOIN images ON images.id = ids.value
+                ''', (json.dumps(list(image_ids)),))
+                return {row[0] for row in cursor.fetchall()}
+        except Exception as e:
+            self.logger.error(f"[DatabaseManager.get_existing_ids] 查询记录失败: {str(e)}")
+            raise
+
+    def has_legacy_ids(self) -> bool:
+        """是否还有迁移留下的旧图片ID对照表，见 migrations._v4_integer_ids"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'legacy_image_ids'")
+            return cursor.fetchone() is not None
+
+    def count_legacy_ids(self) -> int:
+        """旧图片ID对照表中的记录数，没有对照表时为 0"""
+        if not self.has_legacy_ids():
+            return 0
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM legacy_image_ids').fetchone()[0]
+
+    def get_legacy_id_map(self, legacy_ids: List[str]) -> Dict[str, int]:
+        """迁移前的十六进制图片ID -> 整数图片ID，对照表中没有的ID不出现"""
+        if not legacy_ids:
+            return {}
+        try:
+            with self._connect() as conn:
+                cursor = conn.execute('''
+                    SELECT legacy_id, legacy_image_ids.id FROM json_each(?) AS ids
+                    JOIN legacy_image_ids ON legacy_image_ids.legacy_id = ids.value
+                ''', (json.dumps(list(legacy_ids)),))
+                return dict(cursor.fetchall())
+        except Exception as e:
+            self.logger.error(f"[DatabaseManager.get_legacy_id_map] 查询旧图片ID失败: {str(e)}")
+            raise
+
     def get_all_records(self) -> List[dict]:
         """获取所有图片记录"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT id, file_path, file_name, file_size, md5, 
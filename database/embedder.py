@@ -0,0 +1,76 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
+import numpy as np
+from chromadb.utils import embedding_functions
+from utils.logger import Logger
+
+# 与 ChromaDB 默认向量函数相同的模型（all-MiniLM-L6-v2 ONNX）
+DEFAULT_EMBEDDING_MODEL = 'default'
+
+
+class TextEmbedder:
+    """描述文本向量化
+
+    写入和查询使用同一个向量模型，保证索引向量与查询向量一致。
+    向量模型在首次使用时加载；可选单独的工作线程，向量计算与调用方的其他工作重叠。
+    """
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL, batch_size: int = 64,
+                 use_worker: bool = False):
+        """
+        Args:
+            model_name: 向量模型，default 为 ChromaDB 默认模型，其他值按 sentence-transformers 模型名加载
+            batch_size: 单次前向计算的文本数
+            use_worker: 是否在单独的工作线程中计算向量
+        """
+        self.logger = Logger()
+        self.model_name = model_name or DEFAULT_EMBEDDING_MODEL
+        self.batch_size = max(1, batch_size)
+        self._function = None
+        self._load_lock = threading.Lock()
+        self._executor = None
+        if use_worker:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='text_embedder')
+
+    def _get_function(self):
+        with self._load_lock:
+            if self._function is None:
+                if self.model_name == DEFAULT_EMBEDDING_MODEL:
+                    self._function = embedding_functions.DefaultEmbeddingFunction()
+                else:
+                    self._function = embedding_functions.SentenceTransformerEmbeddingFunction(
+                        model_name=self.model_name
+                    )
+                self.logger.info(f"[TextEmbedder._get_function] 向量模型已加载: {self.model_name}")
+            return self._function
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """按批计算文本向量"""
+        if not texts:
+            return []
+        function = self._get_function()
+        embeddings = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = function(list(texts[i:i + self.batch_size]))
+            embeddings.extend(np.asarray(batch, dtype=np.float32).tolist())
+        return embeddings
+
+    def warm_up(self):
+        """加载向量模型并完成一次前向计算，首次查询不再等待模型加载"""
+        try:
+            self.embed(["warm up"])
+            self.logger.info(f"[TextEmbedder.warm_up] 向量模型预热完成: {self.model_name}")
+        except Exception as e:
+            self.logger.error(f"[TextEmbedder.warm_up] 向量模型预热失败: {str(e)}")
+
+    def embed_async(self, texts: List[str]) -> Future:
+        """提交向量计算，启用工作线程时异步执行，否则在当前线程计算后返回已完成的 Future"""
+        if self._executor is not None:
+            return self._executor.submit(self.embed, texts)
+        future = Future()
+        try:
+            future.set_result(self.embed(texts))
+        except Exception as e:
+            future.set_exception(e)
+        return future
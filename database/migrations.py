@@ -0,0 +1,216 @@
+"""everypic.db 的表结构版本和迁移
+
+数据库版本记录在 PRAGMA user_version 中。启动时按顺序执行版本号之后的迁移，
+每个迁移在单独的事务中完成并同时更新版本号，中途失败时该迁移整体回滚，下次启动重试。
+
+新增列或索引时在 MIGRATIONS 末尾追加一个迁移函数，不要修改已发布的迁移。
+"""
+import sqlite3
+from utils.logger import Logger
+from .search_filters import file_directory
+
+
+def ensure_column(cursor, table: str, column: str, column_type: str) -> bool:
+    """列不存在时添加
+
+    Returns:
+        bool: 是否新添加了该列
+    """
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column in {row[1] for row in cursor.fetchall()}:
+        return False
+    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+    Logger().info(f"[migrations.ensure_column] 已为 {table} 添加 {column} 列")
+    return True
+
+
+def _v1_base_schema(cursor):
+    """基础表结构
+
+    引入版本号之前的数据库可能缺少后来补充的列，这里逐一补齐。
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS images (
+            id TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL UNIQUE,
+            file_name TEXT NOT NULL,
+            file_size INTEGER,
+            md5 TEXT,
+            created_time TEXT,
+            modified_time TEXT,
+            caption_profile TEXT,
+            capture_time TEXT,
+            extension TEXT
+        )
+    ''')
+    # 旧版本的描述都使用束搜索参数生成，对应 quality 档位
+    if ensure_column(cursor, 'images', 'caption_profile', 'TEXT'):
+        cursor.execute("UPDATE images SET caption_profile = 'quality'")
+    # 搜索过滤条件：EXIF 拍摄时间、扩展名、文件大小
+    ensure_column(cursor, 'images', 'capture_time', 'TEXT')
+    ensure_column(cursor, 'images', 'extension', 'TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_capture_time ON images (capture_time)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_extension ON images (extension)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_file_size ON images (file_size)')
+
+    # 描述和文件名的 FTS5 全文索引，rowid 与 images 表的 rowid 对应；
+    # 新建索引时先写入已有图片的文件名，描述在图片重新生成描述时补齐
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images_fts'")
+    if not cursor.fetchone():
+        cursor.execute('''
+            CREATE VIRTUAL TABLE images_fts USING fts5(
+                file_name, caption, tokenize = 'unicode61 remove_diacritics 2'
+            )
+        ''')
+        cursor.execute("INSERT INTO images_fts (rowid, file_name, caption) SELECT rowid, file_name, '' FROM images")
+
+    # 按文件内容哈希缓存描述，同样的字节无需再次推理
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS caption_cache (
+            md5 TEXT NOT NULL,
+            model_id TEXT NOT NULL,
+            profile TEXT NOT NULL,
+            caption TEXT NOT NULL,
+            embedding BLOB,
+            embedding_model TEXT,
+            created_time TEXT,
+            PRIMARY KEY (md5, model_id, profile)
+        )
+    ''')
+    ensure_column(cursor, 'caption_cache', 'embedding_model', 'TEXT')
+
+
+def _v2_lookup_indexes(cursor):
+    """移动检测按 md5 查找、同步按修改时间扫描、按目录过滤都走索引"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_md5 ON images (md5)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_modified_time ON images (modified_time)')
+    ensure_column(cursor, 'images', 'directory', 'TEXT')
+    cursor.execute('UPDATE images SET directory = file_directory(file_path)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_directory ON images (directory)')
+
+
+def _v3_stored_captions(cursor):
+    """images 保存描述文本和生成模型，向量库可以直接从 SQLite 重建
+
+    已有图片的描述从全文索引恢复，生成模型按哈希和描述从描述缓存中查出；
+    全文索引中没有描述的图片再按哈希和档位从描述缓存恢复，并补进全文索引。
+    """
+    ensure_column(cursor, 'images', 'caption', 'TEXT')
+    ensure_column(cursor, 'images', 'caption_model', 'TEXT')
+    cursor.execute('''
+        UPDATE images SET caption = (
+            SELECT NULLIF(caption, '') FROM images_fts WHERE images_fts.rowid = images.rowid
+        )
+    ''')
+    cursor.execute('''
+        UPDATE images SET caption_model = (
+            SELECT model_id FROM caption_cache
+            WHERE caption_cache.md5 = images.md5 AND caption_cache.caption = images.caption
+            ORDER BY created_time DESC LIMIT 1
+        )
+        WHERE caption IS NOT NULL
+    ''')
+    cursor.execute('''
+        UPDATE images SET (caption, caption_model) = (
+            SELECT caption, model_id FROM caption_cache
+            WHERE caption_cache.md5 = images.md5 AND caption_cache.profile = images.caption_profile
+            ORDER BY created_time DESC LIMIT 1
+        )
+        WHERE caption IS NULL AND EXISTS (
+            SELECT 1 FROM caption_cache
+            WHERE caption_cache.md5 = images.md5 AND caption_cache.profile = images.caption_profile
+        )
+    ''')
+    # 从描述缓存恢复的描述同时补进全文索引
+    cursor.execute('''
+        UPDATE images_fts SET caption = (SELECT caption FROM images WHERE images.rowid = images_fts.rowid)
+        WHERE caption = '' AND rowid IN (SELECT rowid FROM images WHERE caption IS NOT NULL)
+    ''')
+
+
+def _v4_integer_ids(cursor):
+    """图片ID由路径的 SHA-256 十六进制串改为整数主键
+
+    新表的 id 取原来的 rowid，全文索引的 rowid 不变；AUTOINCREMENT 保证删除的ID不再分配，
+    向量库中残留的旧向量不会对应到新图片。旧ID到新ID的对照存入 legacy_image_ids，
+    启动时据此改写向量库中的记录ID，完成后删除该表。
+    """
+    cursor.execute('''
+        CREATE TABLE images_v4 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_path TEXT NOT NULL UNIQUE,
+            file_name TEXT NOT NULL,
+            file_size INTEGER,
+            md5 TEXT,
+            created_time TEXT,
+            modified_time TEXT,
+            caption_profile TEXT,
+            capture_time TEXT,
+            extension TEXT,
+            directory TEXT,
+            caption TEXT,
+            caption_model TEXT
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO images_v4 (
+            id, file_path, file_name, file_size, md5, created_time, modified_time,
+            caption_profile, capture_time, extension, directory, caption, caption_model
+        )
+        SELECT rowid, file_path, file_name, file_size, md5, created_time, modified_time,
+               caption_profile, capture_time, extension, directory, caption, caption_model
+        FROM images
+    ''')
+    cursor.execute('''
+        CREATE TABLE legacy_image_ids (
+            legacy_id TEXT PRIMARY KEY,
+            id INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('INSERT INTO legacy_image_ids (legacy_id, id) SELECT id, rowid FROM images')
+    cursor.execute('DROP TABLE images')
+    cursor.execute('ALTER TABLE images_v4 RENAME TO images')
+    for column in ('capture_time', 'extension', 'file_size', 'md5', 'modified_time', 'directory'):
+        cursor.execute(f'CREATE INDEX idx_images_{column} ON images ({column})')
+
+
+# 按版本顺序排列，第 N 个迁移把数据库升级到版本 N
+MIGRATIONS = [
+    _v1_base_schema,
+    _v2_lookup_indexes,
+    _v3_stored_captions,
+    _v4_integer_ids,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """把数据库升级到最新版本
+
+    Returns:
+        int: 升级后的版本号
+    """
+    logger = Logger()
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version > SCHEMA_VERSION:
+        logger.warning(f"[migrations.migrate] 数据库版本 {version} 高于程序支持的版本 {SCHEMA_VERSION}")
+        return version
+    # 迁移中计算列值用到的函数
+    conn.create_function('file_directory', 1, file_directory, deterministic=True)
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        migration = MIGRATIONS[target - 1]
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 拿到写锁后再确认一次，其他进程可能已完成同一迁移
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= target:
+                conn.commit()
+                continue
+            migration(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {target}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(f"[migrations.migrate] 数据库已升级到版本 {target}: {migration.__name__}")
+    return SCHEMA_VERSION
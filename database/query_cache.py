@@ -0,0 +1,39 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存，超出容量时淘汰最久未使用的条目"""
+
+    def __init__(self, max_size: int = 128):
+        self.max_size = max(0, max_size)
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        if self.max_size == 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+def normalize_query(query: str) -> str:
+    """查询文本归一化：去除首尾空白、合并连续空白、转小写"""
+    return ' '.join(query.split()).lower()
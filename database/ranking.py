@@ -0,0 +1,21 @@
+from typing import Dict, List
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """倒数排名融合
+
+    不同检索方式的分数不可直接比较，只按各自的名次融合：
+    每个结果的得分为其在各排名中 1 / (k + 名次) 之和。
+
+    Args:
+        rankings: 多个按相关度从高到低排列的 ID 列表
+        k: 平滑常数，越大越弱化头部名次的优势
+
+    Returns:
+        List[str]: 融合后按得分从高到低排列的 ID 列表
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
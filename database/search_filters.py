@@ -0,0 +1,205 @@
+import os
+from datetime import date, datetime, time
+from typing import List, Optional
+
+# 可用的过滤条件：
+#   directory   目录，只返回该目录及其子目录下的图片
+#   date_from   拍摄日期下限（含），datetime / date / 'YYYY-MM-DD' 字符串
+#   date_to     拍摄日期上限（含），只给日期时包含当天全天
+#   extensions  扩展名列表，如 ['.jpg', '.png']
+#   min_size    文件大小下限（字节，含）
+#   max_size    文件大小上限（字节，含）
+FILTER_KEYS = ('directory', 'date_from', 'date_to', 'extensions', 'min_size', 'max_size')
+
+# SQLite 中可按索引预先筛选的条件
+SQLITE_FILTER_KEYS = ('directory', 'date_from', 'date_to', 'extensions', 'min_size', 'max_size')
+
+
+def directory_ancestors(directory: str) -> List[str]:
+    """目录及其所有上级目录，从根目录到自身排列"""
+    directory = os.path.normcase(os.path.normpath(directory))
+    ancestors = [directory]
+    while True:
+        parent = os.path.dirname(directory)
+        if parent == directory or not parent:
+            break
+        ancestors.append(parent)
+        directory = parent
+    return list(reversed(ancestors))
+
+
+def file_directory(file_path: str) -> str:
+    """文件所在目录的规范形式，写入 images.directory 列"""
+    return directory_ancestors(os.path.dirname(file_path))[-1]
+
+
+def directory_metadata(file_path: str) -> dict:
+    """向量元数据中的目录字段：dir_N 为第 N 层上级目录，按目录过滤时只需一次等值匹配"""
+    ancestors = directory_ancestors(os.path.dirname(file_path))
+    return {f"dir_{depth}": ancestor for depth, ancestor in enumerate(ancestors)}
+
+
+def directory_condition(directory: str) -> dict:
+    ancestors = directory_ancestors(directory)
+    return {f"dir_{len(ancestors) - 1}": ancestors[-1]}
+
+
+# 拍摄时间没有时区，按字面时间换算成距该时刻的秒数；不经过本地时区换算，1970 年以前的日期也能表示
+EPOCH = datetime(1970, 1, 1)
+
+
+def capture_timestamp(value: datetime) -> int:
+    """拍摄时间转为向量元数据 capture_ts 使用的整数秒"""
+    return int((value.replace(tzinfo=None) - EPOCH).total_seconds())
+
+
+def _to_datetime(value, end_of_day: bool = False) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+        if end_of_day and value.time() == time():
+            value = datetime.combine(value.date(), time.max)
+        return value
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time.max if end_of_day else time.min)
+    raise ValueError(f"无法识别的日期: {value}")
+
+
+def normalize_filters(filters: Optional[dict]) -> dict:
+    """去掉空条件并统一格式：日期转为 datetime，扩展名转为小写带点的元组
+
+    Raises:
+        ValueError: 包含未知的过滤条件
+    """
+    if not filters:
+        return {}
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"未知的过滤条件: {', '.join(sorted(unknown))}")
+
+    normalized = {}
+    if filters.get('directory'):
+        normalized['directory'] = directory_ancestors(filters['directory'])[-1]
+    if filters.get('date_from') is not None:
+        normalized['date_from'] = _to_datetime(filters['date_from'])
+    if filters.get('date_to') is not None:
+        normalized['date_to'] = _to_datetime(filters['date_to'], end_of_day=True)
+    if filters.get('extensions'):
+        normalized['extensions'] = tuple(sorted(
+            ext.lower() if ext.startswith('.') else f".{ext.lower()}" for ext in filters['extensions']
+        ))
+    for key in ('min_size', 'max_size'):
+        if filters.get(key) is not None:
+            normalized[key] = int(filters[key])
+    return normalized
+
+
+def filters_cache_key(filters: dict) -> tuple:
+    """已归一化的过滤条件转为可哈希的缓存键"""
+    return tuple(sorted(filters.items()))
+
+
+def build_where(filters: dict, candidate_ids: Optional[List[str]] = None) -> Optional[dict]:
+    """已归一化的过滤条件转为向量库 where 子句
+
+    Args:
+        filters: normalize_filters 的结果
+        candidate_ids: SQLite 预先筛出的图片ID（可选），给出时代替全部 SQLite 可处理的条件
+    """
+    conditions = []
+    if candidate_ids is not None:
+        conditions.append({"image_id": {"$in": list(candidate_ids)}})
+    else:
+        if 'directory' in filters:
+            conditions.append(directory_condition(filters['directory']))
+        if 'date_from' in filters:
+            conditions.append({"capture_ts": {"$gte": capture_timestamp(filters['date_from'])}})
+        if 'date_to' in filters:
+            conditions.append({"capture_ts": {"$lte": capture_timestamp(filters['date_to'])}})
+        if 'extensions' in filters:
+            conditions.append({"ext": {"$in": list(filters['extensions'])}})
+        if 'min_size' in filters:
+            conditions.append({"file_size": {"$gte": filters['min_size']}})
+        if 'max_size' in filters:
+            conditions.append({"file_size": {"$lte": filters['max_size']}})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def build_sql_conditions(filters: dict):
+    """已归一化过滤条件中 SQLite 可处理的部分转为 WHERE 条件和参数"""
+    clauses, params = [], []
+    if 'directory' in filters:
+        # 目录本身或以 "目录/" 开头的子目录，按前缀范围扫描 directory 索引
+        directory = filters['directory']
+        prefix = directory if directory.endswith(os.sep) else directory + os.sep
+        clauses.append('(directory = ? OR (directory >= ? AND directory < ?))')
+        params.extend([directory, prefix, prefix[:-1] + chr(ord(os.sep) + 1)])
+    if 'date_from' in filters:
+        clauses.append('capture_time >= ?')
+        params.append(filters['date_from'].strftime('%Y-%m-%d %H:%M:%S'))
+    if 'date_to' in filters:
+        clauses.append('capture_time <= ?')
+        params.append(filters['date_to'].strftime('%Y-%m-%d %H:%M:%S'))
+    if 'extensions' in filters:
+        clauses.append(f"extension IN ({', '.join('?' * len(filters['extensions']))})")
+        params.extend(filters['extensions'])
+    if 'min_size' in filters:
+        clauses.append('file_size >= ?')
+        params.append(filters['min_size'])
+    if 'max_size' in filters:
+        clauses.append('file_size <= ?')
+        params.append(filters['max_size'])
+    return clauses, params
+
+
+def match_where(metadata: Optional[dict], where: Optional[dict]) -> bool:
+    """在内存中按 where 子句匹配元数据，语义与 ChromaDB 一致"""
+    if not where:
+        return True
+    if metadata is None:
+        return False
+    for key, condition in where.items():
+        if key == '$and':
+            if not all(match_where(metadata, sub) for sub in condition):
+                return False
+        elif key == '$or':
+            if not any(match_where(metadata, sub) for sub in condition):
+                return False
+        elif not _match_value(metadata.get(key), condition):
+            return False
+    return True
+
+
+def _match_value(value, condition) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+    for op, operand in condition.items():
+        if op == '$eq':
+            ok = value == operand
+        elif op == '$ne':
+            ok = value != operand
+        elif op == '$in':
+            ok = value in operand
+        elif op == '$nin':
+            ok = value not in operand
+        elif value is None:
+            ok = False
+        elif op == '$gt':
+            ok = value > operand
+        elif op == '$gte':
+            ok = value >= operand
+        elif op == '$lt':
+            ok = value < operand
+        elif op == '$lte':
+            ok = value <= operand
+        else:
+            raise ValueError(f"不支持的条件运算符: {op}")
+        if not ok:
+            return False
+    return True
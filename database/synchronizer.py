@@ -1,10 +1,13 @@
 import os
+import time
+import heapq
 import hashlib
 from datetime import datetime
-from typing import Dict, List, Set
+from typing import Dict, Iterator, List
 from utils.logger import Logger
 from utils.config_manager import ConfigManager
 from utils.image_scanner import ImageScanner
+from utils.batch_sizer import AdaptiveBatchSizer
 from database import db
 
 class DatabaseSynchronizer:
@@ -14,29 +17,59 @@ class DatabaseSynchronizer:
         self.config_manager = ConfigManager()
         self.image_scanner = ImageScanner()
         self.supported_formats = self.config_manager.get_supported_formats()
-        self.batch_size = 100  # 批处理大小
+        self.batch_size = 100  # 删除、改名和缓存命中写入的批处理大小
+        # 描述生成的批大小按实测延迟和内存自动调整
+        self.caption_batch_sizer = AdaptiveBatchSizer(
+            initial_size=self.config_manager.get_caption_batch_size(),
+            max_size=self.config_manager.get_caption_batch_max()
+        )
+        # 本次同步中写库失败的文件：事务已回滚，SQLite 和向量库都没有这些文件的新记录，下次同步重新处理
+        self.failed_files: List[str] = []
     
     def sync_database(self, directories: List[str]):
-        """同步数据库和文件系统"""
+        """同步数据库和文件系统
+
+        文件系统按路径顺序遍历，与按路径分页读取的数据库记录归并比对，两边都不整体载入内存；
+        内存占用只随新文件、修改的文件和丢失的记录增长。
+        """
         try:
             self.logger.info("[DatabaseSynchronizer.sync_database] 开始数据库同步...")
+            self.failed_files = []
             # 0. 先检查两个数据库的一致性
             self._check_database_consistency()
             
-            # 1. 获取数据库中所有记录
-            db_records = {record['file_path']: record for record in db.get_all_records()}
-            db_md5s = {record['md5']: record for record in db_records.values() 
-                      if record['md5'] is not None}
-            
-            # 2. 获取文件系统中的所有图片（不计算MD5）
-            fs_files = self.scan_directories(directories)
-            
-            # 3. 处理已删除的文件
-            self._process_deleted_files(db_records.keys(), fs_files.keys())
+            # 1-2. 按路径归并文件系统中的图片（不计算MD5）和数据库记录：
+            #      只在数据库中的是丢失的记录，只在文件系统中的是新文件，两边都有且修改过的待处理
+            to_process = []
+            missing = []
+            new_files = {}
+            fs_files = self.iter_directory_files(directories)
+            records = (record for chunk in db.iter_records() for record in chunk)
+            fs_item = next(fs_files, None)
+            record = next(records, None)
+            while fs_item is not None or record is not None:
+                if record is None or (fs_item is not None and fs_item[0] < record.file_path):
+                    new_files[fs_item[0]] = fs_item[1]
+                    fs_item = next(fs_files, None)
+                elif fs_item is None or record.file_path < fs_item[0]:
+                    missing.append(record)
+                    record = next(records, None)
+                else:
+                    if self._is_file_modified_quick(fs_item[1], record):
+                        to_process.append((record.file_path, fs_item[1], False))
+                    fs_item = next(fs_files, None)
+                    record = next(records, None)
+            # 丢失的记录先与新文件配对，移动的文件只改路径，其余按批删除
+            self._process_deleted_files(self._process_moved_files(missing, new_files, to_process))
+            to_process.extend((file_path, file_info, True) for file_path, file_info in new_files.items())
+            new_files.clear()
             
-            # 4. 处理新文件和修改的文件（分批处理）
-            self._process_changed_files(db_records, db_md5s, fs_files)
+            # 3. 处理新文件和修改的文件（分批处理）
+            self._process_changed_files(to_process)
             
+            if self.failed_files:
+                self.logger.warning(f"[DatabaseSynchronizer.sync_database] {len(self.failed_files)} 个文件写入失败，"
+                                    f"下次同步时重试")
             self.logger.info("数据库同步完成")
             
         except Exception as e:
@@ -44,33 +77,37 @@ class DatabaseSynchronizer:
             raise
     
     def _check_database_consistency(self):
-        """检查 SQLite 和 ChromaDB 数据一致性"""
+        """检查 SQLite 和 ChromaDB 数据一致性
+
+        两边都分页读取ID，每页到另一边批量查询是否存在，只保留不一致的记录。
+        """
         try:
-            # 获取 SQLite 中的所有记录
-            sqlite_records = db.get_all_records()
-            sqlite_ids = {record['id'] for record in sqlite_records}
+            # SQLite 中有、向量库中没有的记录
+            only_in_sqlite = []
+            for chunk in db.iter_records():
+                existing = db.get_existing_vector_ids([record.id for record in chunk])
+                only_in_sqlite.extend(record.file_path for record in chunk if record.id not in existing)
             
-            # 获取 ChromaDB 中的所有记录
+            # 向量库中有、SQLite 中没有的记录；向量库记录ID是图片ID的字符串形式
+            only_in_chroma = set()
             try:
-                chroma_ids = set(db.get_all_records_ids())
+                for chunk in db.iter_records_ids():
+                    existing = db.get_existing_record_ids([int(record_id) for record_id in chunk
+                                                           if record_id.isdigit()])
+                    only_in_chroma.update(record_id for record_id in chunk
+                                          if not record_id.isdigit() or int(record_id) not in existing)
             except Exception as e:
                 self.logger.error(f"获取 ChromaDB 记录失败: {str(e)}")
                 raise
             
-            # 检查不一致
-            only_in_sqlite = sqlite_ids - chroma_ids
-            only_in_chroma = chroma_ids - sqlite_ids
-            
             if only_in_sqlite or only_in_chroma:
                 self.logger.warning("检测到数据库不一致:")
                 if only_in_sqlite:
                     self.logger.warning(f"仅在 SQLite 中存在的记录: {len(only_in_sqlite)} 条")
                     # 可以选择从 SQLite 中删除这些记录
                     with db.transaction():
-                        for image_id in only_in_sqlite:
-                            record = next(r for r in sqlite_records if r['id'] == image_id)
-                            db.delete_image(record['file_path'])
-                            self.logger.info(f"从 SQLite 删除不一致记录: {record['file_path']}")
+                        db.delete_images(only_in_sqlite)
+                    self.logger.info(f"从 SQLite 删除 {len(only_in_sqlite)} 条不一致记录")
                 
                 if only_in_chroma:
                     self.logger.warning(f"仅在 ChromaDB 中存在的记录: {len(only_in_chroma)} 条")
@@ -86,113 +123,233 @@ class DatabaseSynchronizer:
             self.logger.error(f"数据库一致性检查失败: {str(e)}")
             raise
     
-    def _process_deleted_files(self, db_paths: Set[str], fs_paths: Set[str]):
+    def _process_moved_files(self, missing: List, new_files: Dict, to_process: List[tuple]) -> List[str]:
+        """把文件已不存在的记录与新文件按大小和MD5配对，配对成功的按移动处理
+
+        移动只更新记录的路径，图片ID、描述和向量保留，不重新生成描述。
+
+        Args:
+            missing: 文件已不存在的 ImageRecord 列表
+            new_files: 新文件路径 -> (文件大小, 修改时间)，配对成功的文件从中移除
+            to_process: 待处理文件列表，移动后内容有变化的文件追加到其中
+
+        Returns:
+            List[str]: 没有配对、需要删除的记录路径
+        """
+        by_size = {}
+        for file_path, (size, _) in new_files.items():
+            by_size.setdefault(size, []).append(file_path)
+
+        deleted_paths = []
+        moves = []
+        for record in missing:
+            match = None
+            for file_path in by_size.get(record.file_size, ()) if record.md5 else ():
+                try:
+                    if self.image_scanner.get_file_md5_cached(file_path) == record.md5:
+                        match = file_path
+                        break
+                except Exception as e:
+                    self.logger.error(f"计算文件 {file_path} 的MD5时出错: {str(e)}")
+            if match is None:
+                deleted_paths.append(record.file_path)
+            else:
+                by_size[record.file_size].remove(match)
+                moves.append((record, match))
+
+        for i in range(0, len(moves), self.batch_size):
+            batch = moves[i:i + self.batch_size]
+            try:
+                with db.transaction():
+                    for record, file_path in batch:
+                        db.rename_image(record.file_path, file_path)
+            except Exception as e:
+                # 改名失败时退回删除旧记录、按新文件处理
+                self.logger.error(f"处理移动文件批次时出错: {str(e)}")
+                deleted_paths.extend(record.file_path for record, _ in batch)
+                continue
+            for record, file_path in batch:
+                self.logger.info(f"处理移动的文件: {record.file_path} -> {file_path}")
+                file_info = new_files.pop(file_path)
+                if self._is_file_modified_quick(file_info, record):
+                    to_process.append((file_path, file_info, False))
+                else:
+                    # 只改了路径的文件不再写库，配对时算出的 MD5 不再需要
+                    self.image_scanner.discard([file_path])
+        return deleted_paths
+
+    def _process_deleted_files(self, deleted_paths: List[str]):
         """处理已删除的文件（批量处理）"""
-        deleted_paths = db_paths - fs_paths
         if not deleted_paths:
             return
             
-        # 分批处理删除操作
+        # 分批处理删除操作，每批一次批量删除
         for i in range(0, len(deleted_paths), self.batch_size):
-            batch = list(deleted_paths)[i:i + self.batch_size]
+            batch = deleted_paths[i:i + self.batch_size]
             try:
                 with db.transaction():
-                    for file_path in batch:
-                        self.logger.info(f"删除数据库中的丢失文件记录: {file_path}")
-                        db.delete_image(file_path)
+                    db.delete_images(batch)
+                self.logger.info(f"删除数据库中的丢失文件记录: {len(batch)} 条")
             except Exception as e:
                 self.logger.error(f"处理删除文件批次时出错: {str(e)}")
                 raise
     
-    def _process_changed_files(self, db_records, db_md5s, fs_files):
-        """处理新文件和修改的文件"""
+    def _process_changed_files(self, to_process: List[tuple]):
+        """处理新文件和修改的文件
+
+        Args:
+            to_process: (文件路径, 文件信息, 是否新文件) 列表
+        """
+        all_paths = [file_path for file_path, _, _ in to_process]
         try:
-            # 收集需要处理的文件
-            to_process = []
-            for file_path, file_info in fs_files.items():
-                if file_path not in db_records:
-                    to_process.append((file_path, file_info, True))
-                else:
-                    if self._is_file_modified_quick(file_info, db_records[file_path]):
-                        to_process.append((file_path, file_info, False))
-            
-            # 每个文件单独事务
+            # 内容已缓存描述的文件无需解码和推理，按批直接写入，每批一个事务，向量库在提交时批量写入
+            misses = []
+            hits = 0
+            for i in range(0, len(to_process), self.batch_size):
+                chunk = to_process[i:i + self.batch_size]
+                cached = self.image_scanner.lookup_cached_descriptions([file_path for file_path, _, _ in chunk])
+                if cached:
+                    # 缓存中没有向量的描述整批计算
+                    self.image_scanner.embed_descriptions(cached)
+                    self._write_batch([item for item in chunk if item[0] in cached], cached)
+                    hits += len(cached)
+                misses.extend(item for item in chunk if item[0] not in cached)
+            if hits:
+                self.logger.info(f"[DatabaseSynchronizer._process_changed_files] 描述缓存命中: {hits} 个文件")
+            to_process = misses
+            self.logger.info(f"[DatabaseSynchronizer._process_changed_files] 描述缓存统计: "
+                             f"{self.image_scanner.caption_cache.get_stats()}")
+
+            # 按批生成描述，每批一个事务写入，向量库在提交时批量写入
+            # 解码在预取线程或描述进程中进行，与模型推理重叠
             total = len(to_process)
-            for i, (file_path, file_info, is_new) in enumerate(to_process):
+            done = 0
+            batches = self.image_scanner.iter_image_batches([file_path for file_path, _, _ in to_process],
+                                                            lambda: self.caption_batch_sizer.batch_size)
+            for batch_paths, images in batches:
+                batch = to_process[done:done + len(batch_paths)]
+                ImageScanner.mark_activity()
+
+                memory_before = self.caption_batch_sizer.current_memory_mb()
+                start_time = time.time()
                 try:
-                    self.logger.info(f"[DatabaseSynchronizer._process_changed_files] 开始处理第 {i+1}/{total} 个文件: {file_path}")
-                    
-                    with db.transaction():
-                        self._process_single_file(file_path, file_info, is_new, db_records, db_md5s)
-                        
-                    self.logger.info(f"[DatabaseSynchronizer._process_changed_files] 完成第 {i+1}/{total} 个文件")
-                    
+                    descriptions = self.image_scanner.get_image_descriptions(batch_paths, images)
                 except Exception as e:
-                    self.logger.error(f"[DatabaseSynchronizer._process_changed_files] 处理文件 {file_path} 失败: {str(e)}")
-                    # 记录错误但继续处理下一个文件
-                    continue
+                    self.logger.error(f"[DatabaseSynchronizer._process_changed_files] 批量生成描述失败: {str(e)}")
+                    self.caption_batch_sizer.shrink()
+                    descriptions = {}
+                elapsed = time.time() - start_time
+                self.caption_batch_sizer.record(
+                    len(descriptions), elapsed,
+                    self.caption_batch_sizer.current_memory_mb() - memory_before
+                )
+
+                self._write_batch(batch, descriptions)
+                self.image_scanner.discard(batch_paths)
+                done += len(batch)
+                self.logger.info(f"[DatabaseSynchronizer._process_changed_files] 已处理 {done}/{total} 个文件")
                 
         except Exception as e:
             self.logger.error(f"[DatabaseSynchronizer._process_changed_files] 处理文件列表时出错: {str(e)}")
             raise
+        finally:
+            # 中途出错时清理尚未处理的文件在配对和缓存查询阶段算出的 MD5 和向量
+            self.image_scanner.discard(all_paths)
     
-    def _process_single_file(self, file_path: str, file_info: Dict, is_new: bool, 
-                           db_records: Dict, db_md5s: Dict):
-        """处理单个文件"""
+    def _write_batch(self, batch: List[tuple], descriptions: Dict):
+        """一个事务批量写入一批文件
+
+        移动的文件已在 _process_moved_files 中按路径更新，这里不再按MD5删除其他路径的记录：
+        同样内容的其他文件是副本，各自保留记录。
+
+        Args:
+            batch: (文件路径, 文件信息, 是否新文件) 列表
+            descriptions: 文件路径 -> 描述，缺少描述的文件跳过
+        """
+        records = []
+        for file_path, _, _ in batch:
+            if file_path not in descriptions:
+                self.logger.error(f"[DatabaseSynchronizer._write_batch] 无法生成图片描述，跳过: {file_path}")
+                continue
+            try:
+                records.append(self.image_scanner.build_image_record(file_path, descriptions[file_path]))
+            except Exception as e:
+                # 记录错误但继续处理下一个文件
+                self.logger.error(f"[DatabaseSynchronizer._write_batch] 处理文件 {file_path} 失败: {str(e)}")
+
+        if not records:
+            return
         try:
-            if is_new:
-                self.logger.info(f"[DatabaseSynchronizer._process_single_file] 处理新文件: {file_path}")
-                # 计算MD5，检查是否是移动的文件
-                md5 = self.get_file_md5(file_path)
-                if md5 in db_md5s:
-                    # 文件被移动
-                    old_record = db_md5s[md5]
-                    self.logger.info(f"处理移动的文件: {old_record['file_path']} -> {file_path}")
-                    db.delete_image(old_record['file_path'])
-                
-            self.logger.info(f"{'处理新文件' if is_new else '更新修改的文件'}: {file_path}")
-            self.image_scanner.process_single_image(file_path)
-            
+            with db.transaction():
+                db.add_images(records)
         except Exception as e:
-            self.logger.error(f"处理文件 {file_path} 时出错: {str(e)}")
-            raise
+            # 向量库写入失败时整个事务回滚，SQLite 中不会留下没有向量的记录；记录失败的文件，继续处理下一批
+            failed = [image_data['file_path'] for image_data, _, _, _ in records]
+            self.failed_files.extend(failed)
+            self.logger.error(f"[DatabaseSynchronizer._write_batch] 批量写入 {len(records)} 个文件失败，"
+                              f"已回滚，下次同步重试: {str(e)}; 文件: {failed[:10]}")
     
-    def _is_file_modified_quick(self, file_info: Dict, db_record: Dict) -> bool:
+    def _is_file_modified_quick(self, file_info: tuple, db_record) -> bool:
         """快速检查文件是否被修改（不计算MD5）"""
+        size, file_mtime = file_info
         # 1. 比较文件大小
-        if file_info['size'] != db_record['file_size']:
+        if size != db_record.file_size:
             return True
             
         # 2. 比较修改时间
-        file_mtime = file_info['mtime']
-        db_mtime = datetime.fromisoformat(db_record['modified_time'])
+        db_mtime = datetime.fromisoformat(db_record.modified_time)
         return file_mtime > db_mtime
     
-    def scan_directories(self, directories: List[str]) -> Dict:
-        """扫描目录获取所有图片文件信息（不计算MD5）"""
-        fs_files = {}
-        for directory in directories:
+    def iter_directory_files(self, directories: List[str]) -> Iterator[tuple]:
+        """按路径顺序遍历各目录下的图片文件（不计算MD5），与 db.iter_records 的顺序一致
+
+        重叠的目录中的文件只返回一次。
+
+        Yields:
+            tuple: (文件路径, (文件大小, 修改时间))
+        """
+        walks = []
+        for directory in sorted(set(directories)):
             if not os.path.exists(directory):
                 self.logger.warning(f"目录不存在: {directory}")
                 continue
-                
-            for root, _, files in os.walk(directory):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    if not any(file_path.lower().endswith(fmt) for fmt in self.supported_formats):
-                        continue
-                    
+            walks.append(self._walk_sorted(directory))
+        previous = None
+        for file_path, file_info in heapq.merge(*walks, key=lambda item: item[0]):
+            if file_path != previous:
+                previous = file_path
+                yield file_path, file_info
+
+    def _walk_sorted(self, directory: str) -> Iterator[tuple]:
+        """按完整路径的字符串顺序递归遍历一个目录
+
+        子目录中的文件都以 "子目录" + 分隔符开头，按该前缀与同级文件一起排序后依次展开，
+        得到的路径整体有序。
+        """
+        try:
+            with os.scandir(directory) as it:
+                entries = []
+                for entry in it:
                     try:
-                        fs_files[file_path] = {
-                            'size': os.path.getsize(file_path),
-                            'mtime': datetime.fromtimestamp(os.path.getmtime(file_path)),
-                            'md5': None  # 延迟计算MD5
-                        }
-                    except Exception as e:
-                        self.logger.error(f"获取文件 {file_path} 信息时出错: {str(e)}")
-                        continue
-                        
-        return fs_files
+                        if entry.is_dir(follow_symlinks=False):
+                            entries.append((entry.path + os.sep, entry.path, True))
+                        elif any(entry.name.lower().endswith(fmt) for fmt in self.supported_formats):
+                            entries.append((entry.path, entry.path, False))
+                    except OSError as e:
+                        self.logger.error(f"获取文件 {entry.path} 信息时出错: {str(e)}")
+        except OSError as e:
+            self.logger.error(f"读取目录 {directory} 时出错: {str(e)}")
+            return
+        entries.sort()
+        for _, path, is_dir in entries:
+            if is_dir:
+                yield from self._walk_sorted(path)
+                continue
+            try:
+                stat = os.stat(path)
+                yield path, (stat.st_size, datetime.fromtimestamp(stat.st_mtime))
+            except Exception as e:
+                self.logger.error(f"获取文件 {path} 信息时出错: {str(e)}")
     
     def get_file_md5(self, filepath: str) -> str:
         """计算文件的MD5值"""
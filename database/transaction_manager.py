@@ -1,8 +1,32 @@
-from typing import Optional, List, Set
+import threading
+from typing import Optional, List, NamedTuple, Set, Iterator
 from contextlib import contextmanager
 from utils.logger import Logger
+from utils.config_manager import ConfigManager
 from .db_manager import DatabaseManager
 from .vector_store import VectorStore
+from .ranking import reciprocal_rank_fusion
+from .query_cache import LRUCache, normalize_query
+from .search_filters import SQLITE_FILTER_KEYS, build_where, filters_cache_key, normalize_filters
+
+# 检索方式：vector 向量检索 / keyword 全文检索 / hybrid 两者按名次融合
+SEARCH_MODES = ('vector', 'keyword', 'hybrid')
+
+# SQLite 预筛出的候选不超过该数量时，以ID列表下推到向量库；超过时下推元数据条件
+PRERESOLVE_MAX_IDS = 2000
+
+# 每个查询融合排名的深度：排名只计算一次，翻页在同一排名中切片，最多翻到这么多条
+SEARCH_RANK_DEPTH = 500
+
+
+class SearchHit(NamedTuple):
+    """融合排名中的一条结果"""
+    image_id: int
+    caption_distance: Optional[float]  # 描述向量的余弦距离，描述向量未命中时为 None
+    image_distance: Optional[float]    # CLIP 图片向量的余弦距离，图片向量未命中时为 None
+    caption: Optional[str]             # 描述向量集合中的描述，其余命中为 None，取页时从全文索引补齐
+    keyword: bool                      # 是否为全文命中
+
 
 class TransactionManager:
     _instance = None
@@ -19,18 +43,53 @@ class TransactionManager:
         self.logger = Logger()
         self.db_manager = DatabaseManager()
         self.vector_store = VectorStore()
-        self._transaction_active = False
-        self._pending_operations = []
-        self._transaction_level = 0
+        # 事务嵌套层数和待执行的向量操作按线程保存，与 DatabaseManager 的线程事务连接对应
+        self._local = threading.local()
+        # 查询向量缓存：(归一化查询, 向量模型) -> 向量
+        # 排名缓存：(归一化查询, 过滤条件, 检索方式, 深度, 数据版本) -> 融合排名，写入或删除后版本号递增，旧排名不再命中
+        config_manager = ConfigManager()
+        self.search_mode = config_manager.get_search_mode()
+        cache_size = config_manager.get_query_cache_size()
+        self._query_embeddings = LRUCache(cache_size)
+        self._search_results = LRUCache(cache_size)
+        self._generation = 0
         
         # 确保数据库初始化
         if not self._initialized:
             self._init_database()
             self._initialized = True
     
+    @property
+    def _transaction_active(self) -> bool:
+        """当前线程是否在事务中"""
+        return getattr(self._local, 'active', False)
+
+    @_transaction_active.setter
+    def _transaction_active(self, value: bool):
+        self._local.active = value
+
+    @property
+    def _transaction_level(self) -> int:
+        """当前线程的事务嵌套层数"""
+        return getattr(self._local, 'level', 0)
+
+    @_transaction_level.setter
+    def _transaction_level(self, value: int):
+        self._local.level = value
+
+    @property
+    def _pending_operations(self) -> list:
+        """当前线程事务中待执行的向量操作"""
+        if not hasattr(self._local, 'pending'):
+            self._local.pending = []
+        return self._local.pending
+
     def _init_database(self):
         """初始化数据库，创建必要的表"""
         try:
+            self._migrate_vector_ids()
+            self._backfill_captions()
+            self._reembed_mismatched_captions()
             with self.transaction():
                 # SQLite表已经在DatabaseManager中创建
                 self.logger.info("[TransactionManager._init_database] 数据库初始化成功")
@@ -38,6 +97,71 @@ class TransactionManager:
             self.logger.error(f"[TransactionManager._init_database] 数据库初始化失败: {str(e)}")
             raise
     
+    def _migrate_vector_ids(self):
+        """SQLite 迁移到整数图片ID后，按对照表改写向量库中的旧记录ID，完成后删除对照表
+
+        已是整数ID的记录原样保留，对照表中没有的旧记录丢弃；中途失败时下次启动重新改写。
+        对照表只在改写完成、且向量库没有因中断而变空时删除。
+        """
+        if not self.db_manager.has_legacy_ids():
+            return
+
+        def transform(vector_ids, metadatas):
+            legacy = self.db_manager.get_legacy_id_map(vector_ids)
+            items = []
+            for vector_id, metadata in zip(vector_ids, metadatas):
+                image_id = legacy.get(vector_id)
+                if image_id is None and vector_id.isdigit():
+                    image_id = int(vector_id)
+                if image_id is None:
+                    items.append(None)
+                else:
+                    items.append((self.vector_store.vector_id(image_id), {**(metadata or {}), 'image_id': image_id}))
+            return items
+
+        self.logger.info("[TransactionManager._migrate_vector_ids] 开始改写向量库中的图片ID")
+        kept = self.vector_store.rekey_collections(transform)
+        if kept == 0 and self.db_manager.count_legacy_ids() > 0:
+            self.logger.warning("[TransactionManager._migrate_vector_ids] 改写后向量库为空，保留旧图片ID对照表，"
+                                "下次启动重试")
+            return
+        self.db_manager.drop_table('legacy_image_ids')
+        self.logger.info("[TransactionManager._migrate_vector_ids] 向量库图片ID改写完成")
+
+    def _backfill_captions(self) -> int:
+        """images 中没有描述的图片从描述向量集合的文档补齐
+
+        引入描述列之前，描述只保存在向量库的文档中，迁移无法从 SQLite 恢复；
+        只建了图片向量的图片在描述向量集合中没有记录，保持为空。
+
+        Returns:
+            int: 补齐的描述数
+        """
+        total = 0
+        for chunk in self.db_manager.iter_ids_without_caption():
+            captions = self.vector_store.get_captions(chunk)
+            self.db_manager.set_captions(captions)
+            total += len(captions)
+        if total:
+            self.logger.info(f"[TransactionManager._backfill_captions] 从向量库补齐描述: {total} 条")
+        return total
+
+    def _reembed_mismatched_captions(self):
+        """描述向量集合由其他向量模型建成时，用 SQLite 中的描述按当前模型重建
+
+        重建失败（如仍有描述只在向量库中）时向量库继续拒绝写入描述向量，等待手动重建。
+        """
+        collection_model = self.vector_store.caption_model_mismatch
+        if collection_model is None:
+            return
+        self.logger.warning(f"[TransactionManager._reembed_mismatched_captions] 描述向量集合由 {collection_model} "
+                            f"建成，按 {self.vector_store.embedding_model} 重建")
+        try:
+            self.reindex_vectors(clear=True)
+        except Exception as e:
+            self.logger.error(f"[TransactionManager._reembed_mismatched_captions] 重建描述向量失败，"
+                              f"暂停写入描述向量: {str(e)}")
+
     def _record_operation(self, operation_type: str, **kwargs):
         """记录待执行的操作"""
         if self._transaction_active:
@@ -46,21 +170,61 @@ class TransactionManager:
                 'params': kwargs
             })
     
+    def _bump_generation(self):
+        """数据变更生效后递增版本号，使已缓存的搜索结果失效
+
+        SQLite 的变更只在 transaction 提交成功后递增；提交前递增时，并发的搜索可能把
+        提交前的结果缓存到新版本号下。只改向量库的维护操作在写入完成后递增。
+        """
+        self._generation += 1
+
     def _execute_pending_operations(self):
-        """执行所有待处理的操作"""
+        """执行所有待处理的操作，出错时抛出异常
+
+        同一图片只保留最后一次写入或删除，删除、写入和改名各合并为一次批量调用。
+        按删除、写入、改名的顺序执行：同一事务中先写入后改名的图片最终使用新路径。
+        """
         try:
+            caption_ops = {}
+            image_ops = {}
+            renamed = {}
             for operation in self._pending_operations:
+                image_id = operation['params']['image_id']
                 if operation['type'] == 'add_vector':
-                    self.vector_store.add_image(
-                        operation['params']['file_path'],
-                        operation['params']['description']
-                    )
+                    caption_ops[image_id] = operation
+                elif operation['type'] == 'add_image_vector':
+                    image_ops[image_id] = operation
                 elif operation['type'] == 'delete_vector':
-                    self.vector_store.delete_image(
-                        operation['params']['file_path']
-                    )
+                    caption_ops[image_id] = operation
+                    image_ops[image_id] = operation
+                elif operation['type'] == 'rename_vector':
+                    renamed[image_id] = operation
+
+            deleted = {image_id for ops in (caption_ops, image_ops)
+                       for image_id, operation in ops.items()
+                       if operation['type'] == 'delete_vector'}
+            self.vector_store.delete_images(list(deleted))
+            self.vector_store.upsert_images([
+                (image_id, operation['params']['file_path'], operation['params']['description'],
+                 operation['params'].get('embedding'), operation['params'].get('attributes'))
+                for image_id, operation in caption_ops.items()
+                if operation['type'] == 'add_vector'
+            ])
+            self.vector_store.upsert_image_embeddings([
+                (image_id, operation['params']['file_path'], operation['params']['image_embedding'],
+                 operation['params'].get('attributes'))
+                for image_id, operation in image_ops.items()
+                if operation['type'] == 'add_image_vector'
+            ])
+            self.vector_store.rename_images([
+                (image_id, operation['params']['file_path'], operation['params'].get('attributes'))
+                for image_id, operation in renamed.items()
+                if image_id not in deleted
+            ])
         except Exception as e:
+            # 向量库写入失败时由 transaction 回滚 SQLite，两边保持一致
             self.logger.error(f"[TransactionManager._execute_pending_operations] 执行待处理操作时出错: {str(e)}")
+            raise
         finally:
             self._pending_operations.clear()
     
@@ -90,6 +254,7 @@ class TransactionManager:
             if self._transaction_level == 1:
                 self._execute_pending_operations()
                 self.db_manager.commit_transaction()
+                self._bump_generation()
             
         except Exception as e:
             self.logger.error(f"事务执行失败: {str(e)}")
@@ -103,7 +268,8 @@ class TransactionManager:
             if self._transaction_level == 0:
                 self._transaction_active = False
     
-    def add_image(self, image_data: dict, description: str) -> str:
+    def add_image(self, image_data: dict, description: Optional[str], embedding: List[float] = None,
+                  image_embedding: List[float] = None) -> int:
         """添加图片到数据库
         
         Args:
@@ -114,47 +280,76 @@ class TransactionManager:
                 - md5: MD5值
                 - created_time: 创建时间
                 - modified_time: 修改时间
-            description: 图片描述文本
+                - caption_profile: 生成描述所用的档位（可选）
+                - caption_model: 生成描述所用的模型标识（可选）
+                - capture_time: EXIF 拍摄时间（可选）
+            description: 图片描述文本，仅建图片向量索引时为 None
+            embedding: 已知的描述向量（可选），如描述缓存命中时复用
+            image_embedding: CLIP 图片向量（可选）
             
         Returns:
-            str: 图片ID
+            int: 图片ID
             
         Raises:
             Exception: 当操作失败时抛出异常
         """
         try:
-            # 生成图片ID
-            image_id = self.generate_image_id(image_data['file_path'])
-            image_data['id'] = image_id
-            
-            if self._transaction_active:
-                # 在事务中：先执行SQLite操作，记录向量操作
-                self.db_manager.add_image(image_data, in_transaction=True)
-                self._record_operation('add_vector', 
-                    file_path=image_data['file_path'],
-                    description=description
-                )
-            else:
-                # 非事务模式：按顺序执行，出错时回滚
-                self.db_manager.add_image(image_data, in_transaction=False)
-                try:
-                    self.vector_store.add_image(
-                        image_data['file_path'],
-                        description
+            # 不在事务中时 add_images 自动开启事务，向量写入失败时一并回滚 SQLite
+            return self.add_images([(image_data, description, embedding, image_embedding)])[0]
+        except Exception as e:
+            self.logger.error(f"[TransactionManager.add_image] 添加图片失败: {str(e)}")
+            raise
+    
+    def add_images(self, items: List[tuple]) -> List[int]:
+        """批量添加图片到数据库
+
+        SQLite 记录一次批量写入，向量在事务提交时批量写入；不在事务中时自动开启一个事务。
+
+        Args:
+            items: (图片基本信息, 描述, 描述向量或 None, 图片向量或 None) 列表，各项含义同 add_image
+
+        Returns:
+            List[int]: 与 items 对应的图片ID
+        """
+        if not self._transaction_active:
+            with self.transaction():
+                return self.add_images(items)
+        try:
+            attributes = [self._prepare_image_data(image_data, description)
+                          for image_data, description, _, _ in items]
+            image_ids = self.db_manager.add_images([image_data for image_data, _, _, _ in items],
+                                                   in_transaction=True)
+            for (image_data, description, embedding, image_embedding), attrs in zip(items, attributes):
+                image_id = image_ids[image_data['file_path']]
+                if description is not None:
+                    self._record_operation('add_vector',
+                        image_id=image_id,
+                        file_path=image_data['file_path'],
+                        description=description,
+                        embedding=embedding,
+                        attributes=attrs
                     )
-                except Exception as e:
-                    # 向量数据库操作失败，回滚SQLite
-                    self.db_manager.delete_image_by_path(
-                        image_data['file_path'],
-                        in_transaction=False
+                if image_embedding is not None:
+                    self._record_operation('add_image_vector',
+                        image_id=image_id,
+                        file_path=image_data['file_path'],
+                        image_embedding=image_embedding,
+                        attributes=attrs
                     )
-                    raise
-                    
-            return image_id
-            
+            return [image_ids[image_data['file_path']] for image_data, _, _, _ in items]
+
         except Exception as e:
-            self.logger.error(f"[TransactionManager.add_image] 添加图片失败: {str(e)}")
+            self.logger.error(f"[TransactionManager.add_images] 批量添加图片失败: {str(e)}")
             raise
+
+    def _prepare_image_data(self, image_data: dict, description: Optional[str]) -> dict:
+        """补充全文索引用的描述，返回写入向量元数据的属性"""
+        image_data['caption'] = description
+        # 写入向量元数据，供搜索过滤下推
+        return {
+            'file_size': image_data.get('file_size'),
+            'capture_time': image_data.get('capture_time')
+        }
     
     def delete_image(self, file_path: str):
         """删除图片
@@ -165,21 +360,67 @@ class TransactionManager:
         Raises:
             Exception: 当操作失败时抛出异常
         """
+        if not self._transaction_active:
+            with self.transaction():
+                return self.delete_image(file_path)
         try:
-            if self._transaction_active:
-                # 在事务中：先执行SQLite操作，记录向量操作
-                self.db_manager.delete_image_by_path(file_path, in_transaction=True)
-                self._record_operation('delete_vector', file_path=file_path)
-            else:
-                # 非事务模式：直接执行
-                self.db_manager.delete_image_by_path(file_path, in_transaction=False)
-                self.vector_store.delete_image(file_path)
-                
+            # 先执行SQLite操作，记录向量操作
+            for image_id in self.db_manager.delete_image_by_path(file_path, in_transaction=True):
+                self._record_operation('delete_vector', image_id=image_id)
         except Exception as e:
             self.logger.error(f"[TransactionManager.delete_image] 删除图片失败: {str(e)}")
             raise
     
-    def get_image_by_id(self, image_id: str) -> Optional[dict]:
+    def delete_images(self, file_paths: List[str]):
+        """批量删除图片
+        
+        Args:
+            file_paths: 图片文件路径列表
+        """
+        if not file_paths:
+            return
+        if not self._transaction_active:
+            with self.transaction():
+                return self.delete_images(file_paths)
+        try:
+            for image_id in self.db_manager.delete_images_by_paths(file_paths, in_transaction=True):
+                self._record_operation('delete_vector', image_id=image_id)
+        except Exception as e:
+            self.logger.error(f"[TransactionManager.delete_images] 批量删除图片失败: {str(e)}")
+            raise
+
+    def rename_image(self, old_path: str, new_path: str) -> Optional[int]:
+        """文件改名或移动：图片ID、描述和向量保留，只更新路径和向量元数据
+
+        Args:
+            old_path: 原文件路径
+            new_path: 新文件路径，已有记录时该记录被替换
+
+        Returns:
+            int: 图片ID；原路径没有记录时返回 None，调用方按新文件处理
+        """
+        if not self._transaction_active:
+            with self.transaction():
+                return self.rename_image(old_path, new_path)
+        try:
+            renamed = self.db_manager.rename_image(old_path, new_path, in_transaction=True)
+            if renamed is None:
+                return None
+            attributes = {'file_size': renamed['file_size'], 'capture_time': renamed['capture_time']}
+            if renamed['replaced_id'] is not None:
+                self._record_operation('delete_vector', image_id=renamed['replaced_id'])
+            self._record_operation('rename_vector',
+                image_id=renamed['id'],
+                file_path=new_path,
+                attributes=attributes
+            )
+            return renamed['id']
+
+        except Exception as e:
+            self.logger.error(f"[TransactionManager.rename_image] 更新图片路径失败: {str(e)}")
+            raise
+    
+    def get_image_by_id(self, image_id: int) -> Optional[dict]:
         """根据ID获取图片信息
         
         Args:
@@ -190,44 +431,233 @@ class TransactionManager:
         """
         return self.db_manager.get_image_by_id(image_id)
     
-    def search_similar_images(self, query: str, limit: int = 10) -> List[dict]:
+    def get_images_by_ids(self, image_ids: List[int]) -> List[dict]:
+        """根据ID批量获取图片信息，顺序与 image_ids 一致"""
+        return self.db_manager.get_images_by_ids(image_ids)
+    
+    def get_paths_by_caption_profile(self, exclude_profile: str, limit: int = 100) -> List[str]:
+        """获取描述档位不是 exclude_profile 的图片路径
+        
+        Args:
+            exclude_profile: 目标档位，已是该档位的图片不返回
+            limit: 返回数量上限
+            
+        Returns:
+            List[str]: 图片文件路径列表
+        """
+        return self.db_manager.get_paths_by_caption_profile(exclude_profile, limit)
+    
+    def search_similar_images(self, query: str, limit: int = 10, filters: dict = None,
+                              mode: str = None) -> List[dict]:
         """搜索相似图片
         
         Args:
-            query: 搜索查询文本
+            query: 搜索查询文本，用双引号包起时只做全文检索
             limit: 返回结果数量限制
+            filters: 过滤条件（可选），可用条件见 search_filters.FILTER_KEYS
+            mode: 检索方式（可选），见 SEARCH_MODES，为空时使用配置
             
         Returns:
-            List[dict]: 相似图片列表，每个元素包含完整的图片信息
+            List[dict]: 相似图片列表，每个元素包含完整的图片信息，以及 distance 和 caption
         """
-        try:
-            results = self.vector_store.search_images(query, limit)
-            images = []
+        return self.search_page(query, limit, filters=filters, mode=mode)['results']
+
+    def search_page(self, query: str, page_size: int = 20, cursor: Optional[str] = None,
+                    filters: dict = None, mode: str = None, max_distance: float = None,
+                    max_image_distance: float = None) -> dict:
+        """分页搜索图片
+        
+        每个查询只融合一次固定深度的排名，翻页按游标在同一排名中切片，前后页不重复、不遗漏；
+        只为本页结果查询图片信息和描述。
+        
+        Args:
+            query: 搜索查询文本，用双引号包起时只做全文检索
+            page_size: 每页数量
+            cursor: 上一页返回的游标，为空时从第一页开始
+            filters: 过滤条件（可选），可用条件见 search_filters.FILTER_KEYS
+            mode: 检索方式（可选），见 SEARCH_MODES，为空时使用配置
+            max_distance: 描述向量的余弦距离上限（可选）
+            max_image_distance: CLIP 图片向量的余弦距离上限（可选），两种向量的距离分布不同，分别设置；
+                全文命中或任一向量距离在上限内的结果保留
             
-            # 获取完整的图片信息
-            for result in results.get('metadatas', [[]])[0]:
-                image_id = result.get('image_id')
-                if image_id:
-                    image_info = self.get_image_by_id(image_id)
-                    if image_info:
-                        images.append(image_info)
-                        
-            return images
+        Returns:
+            dict: results 本页图片列表，每个元素包含完整的图片信息、distance（优先取描述向量的距离，
+                仅全文命中时为 None）和 caption；cursor 下一页游标，没有更多结果时为 None
+        """
+        try:
+            generation, offset = self._parse_cursor(cursor)
+            generation, hits = self._ranked_hits(query, max(SEARCH_RANK_DEPTH, page_size), filters, mode,
+                                                 generation)
+            if max_distance is not None or max_image_distance is not None:
+                hits = [hit for hit in hits if self._within_distance(hit, max_distance, max_image_distance)]
+            page_hits = hits[offset:offset + page_size]
+
+            # 全文命中和图片向量命中没有描述，只为本页从全文索引补齐
+            captions = {hit.image_id: hit.caption for hit in page_hits}
+            missing = [image_id for image_id, caption in captions.items() if caption is None]
+            if missing:
+                captions.update(self.db_manager.get_keyword_captions(missing))
+
+            # 一次查询取回本页的完整图片信息
+            by_id = {hit.image_id: hit for hit in page_hits}
+            images = self.get_images_by_ids([hit.image_id for hit in page_hits])
+            for image_info in images:
+                hit = by_id[image_info['id']]
+                image_info['distance'] = (hit.caption_distance if hit.caption_distance is not None
+                                          else hit.image_distance)
+                image_info['caption'] = captions.get(hit.image_id)
+
+            next_cursor = f"{generation}:{offset + page_size}" if len(hits) > offset + page_size else None
+            return {'results': images, 'cursor': next_cursor}
             
         except Exception as e:
-            self.logger.error(f"[TransactionManager.search_similar_images] 搜索图片失败: {str(e)}")
+            self.logger.error(f"[TransactionManager.search_page] 搜索图片失败: {str(e)}")
             raise 
-    
-    def generate_image_id(self, file_path: str) -> str:
-        """生成图片唯一ID
-        
-        Args:
-            file_path: 图片文件路径
-            
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]) -> tuple:
+        """游标为 "数据版本:偏移"，返回 (数据版本或 None, 偏移)"""
+        if not cursor:
+            return None, 0
+        generation, _, offset = cursor.rpartition(':')
+        return (int(generation) if generation else None), int(offset)
+
+    @staticmethod
+    def _within_distance(hit: SearchHit, max_distance: Optional[float],
+                         max_image_distance: Optional[float]) -> bool:
+        """全文命中，或任一向量距离不超过对应上限的结果保留；上限为 None 的向量不限制"""
+        if hit.keyword:
+            return True
+        if hit.caption_distance is not None and (max_distance is None or hit.caption_distance <= max_distance):
+            return True
+        return hit.image_distance is not None and (max_image_distance is None
+                                                   or hit.image_distance <= max_image_distance)
+
+    def _ranked_hits(self, query: str, depth: int, filters: dict = None, mode: str = None,
+                     generation: Optional[int] = None) -> tuple:
+        """按相关度排列的前 depth 个结果
+
+        每个索引各取 depth 个结果融合成一个排名，按数据版本缓存。generation 为上一页所用的数据版本，
+        其排名仍在缓存中时继续使用，翻页期间写入新数据也不会打乱已显示的页；否则按当前数据重新检索。
+
         Returns:
-            str: 生成的唯一ID
+            tuple: (数据版本, SearchHit 列表)
         """
-        return self.vector_store.generate_image_id(file_path) 
+        mode = mode or self.search_mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"未知的检索方式: {mode}")
+        stripped = query.strip()
+        if len(stripped) >= 2 and stripped[0] == stripped[-1] == '"':
+            # 关键词快速路径：不加载向量模型，只查全文索引
+            mode = 'keyword'
+            query = stripped[1:-1]
+        normalized = normalize_query(query)
+        filters = normalize_filters(filters)
+        result_key = (normalized, filters_cache_key(filters), mode, depth)
+        for version in (generation, self._generation):
+            cached = self._search_results.get((*result_key, version)) if version is not None else None
+            if cached is not None:
+                return version, cached
+        generation = self._generation
+
+        rankings = []
+        keyword_ids = []
+        caption_distances, image_distances, captions = {}, {}, {}
+        if mode == 'keyword':
+            keyword_ids = self.db_manager.search_keywords(query, depth, filters)
+            rankings.append(keyword_ids)
+        else:
+            where = self._resolve_filters(filters)
+            if where is not False:
+                # 每个有数据的索引各自检索，多个排名按名次融合
+                if self.vector_store.count() > 0:
+                    query_embedding = self._get_query_embedding(normalized, self.vector_store.embedding_model,
+                                                                self.vector_store.embed_documents)
+                    results = self.vector_store.search_images(query, depth, query_embedding, where)
+                    rankings.append(self._collect_hits(results, caption_distances, captions))
+                if self.vector_store.count_image_embeddings() > 0:
+                    from utils.image_embedder import ClipImageEmbedder
+                    clip_embedder = ClipImageEmbedder.get_instance()
+                    query_embedding = self._get_query_embedding(normalized, clip_embedder.model_name,
+                                                                clip_embedder.embed_texts)
+                    results = self.vector_store.search_image_embeddings(query_embedding, depth, where)
+                    rankings.append(self._collect_hits(results, image_distances))
+                if mode == 'hybrid':
+                    keyword_ids = self.db_manager.search_keywords(query, depth, filters)
+                    if keyword_ids:
+                        rankings.append(keyword_ids)
+
+        if len(rankings) > 1:
+            image_ids = reciprocal_rank_fusion(rankings)[:depth]
+        else:
+            image_ids = rankings[0] if rankings else []
+        keyword_set = set(keyword_ids)
+        hits = [SearchHit(image_id, caption_distances.get(image_id), image_distances.get(image_id),
+                          captions.get(image_id), image_id in keyword_set)
+                for image_id in image_ids]
+
+        self._search_results.put((*result_key, generation), hits)
+        return generation, hits
+
+    def _resolve_filters(self, filters: dict):
+        """过滤条件转为向量库 where 子句
+
+        目录、日期、大小、扩展名条件先在 SQLite 中按索引筛选：候选较少时以ID列表下推，
+        向量库只在候选中检索；候选较多时下推元数据条件。
+
+        Returns:
+            dict: where 子句；None 表示不过滤；False 表示没有满足条件的图片
+        """
+        if not filters:
+            return None
+        candidate_ids = None
+        if any(key in filters for key in SQLITE_FILTER_KEYS):
+            candidate_ids = self.db_manager.get_image_ids_by_filters(filters, PRERESOLVE_MAX_IDS + 1)
+            if not candidate_ids:
+                return False
+            if len(candidate_ids) > PRERESOLVE_MAX_IDS:
+                candidate_ids = None
+        return build_where(filters, candidate_ids)
+
+    def _get_query_embedding(self, normalized_query: str, model_name: str, embed) -> List[float]:
+        """查询向量，同一查询文本和向量模型只计算一次"""
+        key = (normalized_query, model_name)
+        embedding = self._query_embeddings.get(key)
+        if embedding is None:
+            embedding = embed([normalized_query])[0]
+            self._query_embeddings.put(key, embedding)
+        return embedding
+
+    def warm_up_search(self):
+        """预热查询用到的向量模型，首次搜索不再等待模型加载"""
+        self.vector_store.embedder.warm_up()
+        if self.vector_store.count_image_embeddings() > 0:
+            from utils.image_embedder import ClipImageEmbedder
+            try:
+                ClipImageEmbedder.get_instance().embed_texts(["warm up"])
+            except Exception as e:
+                self.logger.error(f"[TransactionManager.warm_up_search] CLIP 文本模型预热失败: {str(e)}")
+
+    @staticmethod
+    def _collect_hits(results: dict, distances: dict, documents: dict = None) -> List[int]:
+        """从向量库查询结果中按相关度顺序取出图片ID，距离记入 distances，描述记入 documents
+
+        每个索引使用各自的 distances，不同向量的距离分别保存、分别设置上限。
+        """
+        metadatas = (results.get('metadatas') or [[]])[0]
+        result_distances = (results.get('distances') or [[]])[0]
+        result_documents = (results.get('documents') or [[]])[0]
+        image_ids = []
+        for i, metadata in enumerate(metadatas):
+            if not metadata or metadata.get('image_id') is None:
+                continue
+            image_id = metadata['image_id']
+            if i < len(result_distances):
+                distances.setdefault(image_id, result_distances[i])
+            if documents is not None and i < len(result_documents) and result_documents[i] is not None:
+                documents.setdefault(image_id, result_documents[i])
+            image_ids.append(image_id)
+        return image_ids
     
     def get_all_records(self) -> List[dict]:
         """获取数据库中所有图片记录
@@ -241,15 +671,69 @@ class TransactionManager:
             self.logger.error(f"获取所有记录失败: {str(e)}")
             raise 
         
+    def iter_records(self) -> Iterator[list]:
+        """按文件路径顺序分页读取 SQLite 中的精简图片记录（ImageRecord）"""
+        return self.db_manager.iter_records()
+
+    def get_existing_record_ids(self, image_ids: List[int]) -> Set[int]:
+        """image_ids 中在 SQLite 里有记录的ID"""
+        return self.db_manager.get_existing_ids(image_ids)
+
+    def get_existing_vector_ids(self, image_ids: List[int]) -> Set[int]:
+        """image_ids 中在向量库里有记录的ID"""
+        return self.vector_store.existing_ids(image_ids)
+
+    def reindex_vectors(self, clear: bool = True) -> int:
+        """用 SQLite 中保存的描述重建描述向量集合，无需重新生成描述
+
+        描述按页读出并批量计算向量后写入；适用于向量库损坏或更换描述向量模型。
+
+        Args:
+            clear: 是否先清空描述向量集合，更换向量模型时必须清空；仍有描述只存在于
+                向量库中的图片时拒绝清空
+
+        Returns:
+            int: 写入的描述数
+        """
+        changed = False
+        try:
+            if clear:
+                # 清空前先把只存在于向量库文档中的描述补进 SQLite，补不齐的不能清空
+                self._backfill_captions()
+                unsaved = sum(len(self.vector_store.existing_caption_ids(chunk))
+                              for chunk in self.db_manager.iter_ids_without_caption())
+                if unsaved:
+                    raise RuntimeError(f"{unsaved} 张图片的描述只在描述向量集合中，清空会丢失，已取消")
+                self.vector_store.clear_captions()
+                changed = True
+            total = 0
+            for chunk in self.db_manager.iter_captions():
+                self.vector_store.upsert_images([
+                    (image_id, file_path, caption, None, {'file_size': file_size, 'capture_time': capture_time})
+                    for image_id, file_path, caption, file_size, capture_time in chunk
+                ])
+                changed = True
+                total += len(chunk)
+                self.logger.info(f"[TransactionManager.reindex_vectors] 已重建 {total} 条描述向量")
+            return total
+        except Exception as e:
+            self.logger.error(f"[TransactionManager.reindex_vectors] 重建描述向量失败: {str(e)}")
+            raise
+        finally:
+            # 向量写入后才递增；拒绝清空时集合没有变化
+            if changed:
+                self._bump_generation()
+
     def clear_database(self):
         """清空数据库"""
-        self.db_manager.drop_table('images')
+        self.db_manager.clear_images()
         self.vector_store.clear_database()
+        self._bump_generation()
         self.logger.info("[TransactionManager.clear_database] 数据库已清空")
 
-    #从chromadb中获得所有记录的id
-    def get_all_records_ids(self) -> List[str]:
-        return self.vector_store.collection.get()["ids"]
+    def iter_records_ids(self) -> Iterator[List[str]]:
+        """分页读取chromadb中的记录id（图片ID的字符串形式），内存占用与记录总数无关"""
+        return self.vector_store.iter_ids()
     
     def delete_record_by_id(self, ids: Set[str]):
         """从向量数据库中删除指定ID的记录
@@ -261,8 +745,9 @@ class TransactionManager:
             Exception: 当删除操作失败时抛出异常
         """
         try:
-            self.vector_store.collection.delete(ids=list(ids))
-            self.logger.info(f"[TransactionManager.delete_record_by_id] 成功从向量数据库删除记录: {ids}")
+            self.vector_store.delete_ids(ids)
+            self._bump_generation()
+            self.logger.info(f"[TransactionManager.delete_record_by_id] 成功从向量数据库删除记录: {len(ids)} 条")
         except Exception as e:
             self.logger.error(f"[TransactionManager.delete_record_by_id] 从向量数据库删除记录失败: {str(e)}")
             raise
@@ -0,0 +1,634 @@
+import json
+import os
+import threading
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+from utils.logger import Logger
+from .search_filters import match_where
+
+
+class VectorIndex:
+    """单个向量集合的存储接口
+
+    query 返回与 ChromaDB 相同结构的结果：ids / distances / metadatas / documents，
+    每项都是只含一个查询的嵌套列表。距离为余弦距离（1 - 余弦相似度）。
+    where 为 ChromaDB 语法的元数据过滤条件。
+    """
+
+    name = ''
+
+    def upsert(self, ids: List[str], embeddings: List[list], metadatas: List[dict],
+               documents: Optional[List[str]] = None):
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def query(self, embedding: list, limit: int, where: Optional[dict] = None) -> dict:
+        raise NotImplementedError
+
+    def iter_ids(self, chunk_size: int) -> Iterator[List[str]]:
+        raise NotImplementedError
+
+    def existing_ids(self, ids: List[str]) -> set:
+        """ids 中已在集合里的ID"""
+        raise NotImplementedError
+
+    def get_documents(self, ids: List[str]) -> dict:
+        """ids 中已有记录的文档，ID -> 文档，没有文档的记录不出现"""
+        raise NotImplementedError
+
+    def update_metadata(self, ids: List[str], metadatas: List[dict]):
+        """替换已有记录的元数据，向量和文档不变；不存在的ID忽略"""
+        raise NotImplementedError
+
+    def rekey(self, transform, chunk_size: int = 1000) -> int:
+        """按 transform 改写全部记录的 ID 和元数据，向量和文档不变
+
+        Args:
+            transform: 接收一页 (ID列表, 元数据列表)，返回等长列表，
+                每项为 (新ID, 新元数据)，为 None 时丢弃该记录
+
+        Returns:
+            int: 改写后集合中的记录数
+        """
+        raise NotImplementedError
+
+    def iter_vectors(self, chunk_size: int) -> Iterator[tuple]:
+        """分页读取 (ID列表, 向量列表)"""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def clear(self, metadata: Optional[dict] = None):
+        """删除全部记录，按 metadata 重建空集合，为空时沿用原参数"""
+        raise NotImplementedError
+
+    def rebuild(self, metadata: dict, chunk_size: int = 1000):
+        """按新的集合参数重建索引，保留全部记录"""
+        raise NotImplementedError
+
+    @property
+    def metadata(self) -> dict:
+        raise NotImplementedError
+
+
+class ChromaIndex(VectorIndex):
+    """ChromaDB 集合，近似检索（HNSW）
+
+    写入、删除按客户端允许的最大批量分块提交，超过上限的单次调用会被 ChromaDB 拒绝。
+    """
+
+    DEFAULT_MAX_BATCH_SIZE = 5000
+
+    def __init__(self, client, name: str, metadata: dict):
+        self.client = client
+        self.name = name
+        self._metadata = metadata
+        self.max_batch_size = self._read_max_batch_size(client)
+        self._open()
+
+    @classmethod
+    def _read_max_batch_size(cls, client) -> int:
+        """客户端的单次写入上限，旧版本只有 max_batch_size 属性"""
+        get_max_batch_size = getattr(client, 'get_max_batch_size', None)
+        if callable(get_max_batch_size):
+            return get_max_batch_size()
+        return getattr(client, 'max_batch_size', None) or cls.DEFAULT_MAX_BATCH_SIZE
+
+    def _batches(self, *columns):
+        """把等长的几列按 max_batch_size 切成若干批"""
+        for start in range(0, len(columns[0]), self.max_batch_size):
+            yield [column[start:start + self.max_batch_size] if column is not None else None
+                   for column in columns]
+
+    def _open(self):
+        self._recover_swap()
+        self.collection = self.client.get_or_create_collection(name=self.name, metadata=self._metadata)
+
+    def _recover_swap(self):
+        """处理上次重建或改写ID时中断留下的临时集合
+
+        原集合只在临时集合复制完成后才删除：原集合不在时临时集合是完整的，改回原名；
+        原集合还在时复制可能未完成，丢弃临时集合。
+        """
+        rebuild_name = f"{self.name}_rebuild"
+        names = {getattr(collection, 'name', collection) for collection in self.client.list_collections()}
+        if rebuild_name not in names:
+            return
+        if self.name in names:
+            self.client.delete_collection(rebuild_name)
+            Logger().warning(f"[ChromaIndex._recover_swap] 丢弃未完成的临时集合 {rebuild_name}")
+        else:
+            self.client.get_collection(rebuild_name).modify(name=self.name)
+            Logger().warning(f"[ChromaIndex._recover_swap] 已把中断时的临时集合 {rebuild_name} 改回 {self.name}")
+
+    @property
+    def metadata(self) -> dict:
+        return self.collection.metadata or {}
+
+    def upsert(self, ids, embeddings, metadatas, documents=None):
+        for ids, embeddings, metadatas, documents in self._batches(ids, embeddings, metadatas, documents):
+            kwargs = {'ids': ids, 'embeddings': embeddings, 'metadatas': metadatas}
+            if documents is not None:
+                kwargs['documents'] = documents
+            self.collection.upsert(**kwargs)
+
+    def delete(self, ids):
+        for ids, in self._batches(list(ids)):
+            self.collection.delete(ids=ids)
+
+    def existing_ids(self, ids):
+        if not ids:
+            return set()
+        return set(self.collection.get(ids=list(ids), include=[])["ids"])
+
+    def get_documents(self, ids):
+        if not ids:
+            return {}
+        page = self.collection.get(ids=list(ids), include=['documents'])
+        return {image_id: document for image_id, document in zip(page["ids"], page["documents"] or [])
+                if document is not None}
+
+    def update_metadata(self, ids, metadatas):
+        # update 会合并元数据，旧的 dir_N 键会残留；取出向量和文档整条覆盖
+        by_id = dict(zip(ids, metadatas))
+        for chunk, in self._batches(list(ids)):
+            page = self.collection.get(ids=chunk, include=['embeddings', 'documents'])
+            if not page["ids"]:
+                continue
+            documents = page.get("documents")
+            if not documents or any(document is None for document in documents):
+                documents = None
+            self.upsert(page["ids"], page["embeddings"], [by_id[image_id] for image_id in page["ids"]], documents)
+
+    def query(self, embedding, limit, where=None):
+        kwargs = {'query_embeddings': [embedding], 'n_results': limit}
+        if where:
+            kwargs['where'] = where
+        return self.collection.query(**kwargs)
+
+    def iter_ids(self, chunk_size):
+        offset = 0
+        while True:
+            ids = self.collection.get(include=[], limit=chunk_size, offset=offset)["ids"]
+            if not ids:
+                break
+            yield ids
+            offset += len(ids)
+
+    def iter_vectors(self, chunk_size):
+        offset = 0
+        while True:
+            page = self.collection.get(include=['embeddings'], limit=chunk_size, offset=offset)
+            if not page["ids"]:
+                break
+            yield page["ids"], page["embeddings"]
+            offset += len(page["ids"])
+
+    def count(self):
+        return self.collection.count()
+
+    def clear(self, metadata=None):
+        """删除并重建集合，无需逐条读取ID"""
+        if metadata is not None:
+            self._metadata = metadata
+        self.client.delete_collection(self.name)
+        self._open()
+
+    def copy_to(self, name: str, metadata: dict, chunk_size: int = 1000, transform=None) -> 'ChromaIndex':
+        """把全部记录分页复制到按 metadata 新建的集合，同名集合已存在时先删除
+
+        Args:
+            transform: 复制时改写 ID 和元数据（可选），见 VectorIndex.rekey
+        """
+        try:
+            self.client.delete_collection(name)
+        except Exception:
+            pass
+        target = self.client.create_collection(name=name, metadata=metadata)
+        offset = 0
+        while True:
+            page = self.collection.get(include=['embeddings', 'metadatas', 'documents'],
+                                       limit=chunk_size, offset=offset)
+            if not page["ids"]:
+                break
+            offset += len(page["ids"])
+            ids, embeddings, metadatas = page["ids"], page["embeddings"], page["metadatas"]
+            documents = page.get("documents")
+            if transform is not None:
+                keep = [(i, item) for i, item in enumerate(transform(ids, metadatas)) if item is not None]
+                if not keep:
+                    continue
+                ids = [new_id for _, (new_id, _) in keep]
+                metadatas = [new_metadata for _, (_, new_metadata) in keep]
+                embeddings = [embeddings[i] for i, _ in keep]
+                documents = [documents[i] for i, _ in keep] if documents else documents
+            kwargs = {'ids': ids, 'embeddings': embeddings, 'metadatas': metadatas}
+            if documents and all(document is not None for document in documents):
+                kwargs['documents'] = documents
+            target.add(**kwargs)
+        return ChromaIndex(self.client, name, metadata)
+
+    def rebuild(self, metadata, chunk_size=1000):
+        """用已存储的向量重建集合
+
+        HNSW 参数只能在创建集合时指定，因此先把全部记录复制到按新参数创建的临时集合，
+        再删除原集合并把临时集合改回原名。大量删除、重写后重建也能清理图中的失效节点。
+        """
+        self._replace_with_copy(metadata, chunk_size)
+
+    def rekey(self, transform, chunk_size=1000):
+        """ChromaDB 不能修改记录ID，复制到临时集合时改写后替换原集合"""
+        self._replace_with_copy(self.metadata, chunk_size, transform)
+        return self.count()
+
+    def _replace_with_copy(self, metadata: dict, chunk_size: int, transform=None):
+        """复制完成后才删除原集合；两步之间中断时由 _recover_swap 在下次打开时完成替换"""
+        target = self.copy_to(f"{self.name}_rebuild", metadata, chunk_size, transform)
+        expected = target.count()
+        self.client.delete_collection(self.name)
+        target.collection.modify(name=self.name)
+        self._metadata = metadata
+        self.collection = self.client.get_collection(self.name)
+        if self.collection.count() != expected:
+            raise RuntimeError(f"集合 {self.name} 替换后记录数 {self.collection.count()} 与复制的 {expected} 不一致")
+
+
+class NumpyIndex(VectorIndex):
+    """内存映射 NumPy 矩阵上的精确检索
+
+    向量归一化后按行存放在 <name>.npy 中，文件按容量预分配，写满时容量翻倍；
+    ID、元数据和删除记录追加写入 <name>.jsonl，启动时重放。
+    覆盖写入和删除只打墓碑标记，墓碑比例超过阈值时压缩重写两个文件。
+    查询为一次矩阵向量乘加 argpartition 取前 k 个。
+    """
+
+    INITIAL_CAPACITY = 1024
+    COMPACT_MIN_ROWS = 1024
+
+    def __init__(self, directory: str, name: str, metadata: dict, compact_ratio: float = 0.25):
+        self.logger = Logger()
+        self.name = name
+        self._metadata = dict(metadata)
+        self.compact_ratio = compact_ratio
+        self.matrix_path = os.path.join(directory, f"{name}.npy")
+        self.log_path = os.path.join(directory, f"{name}.jsonl")
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def metadata(self) -> dict:
+        return self._metadata
+
+    def _load(self):
+        """映射向量文件并重放 ID 日志"""
+        self._matrix = None
+        self._size = 0
+        self._ids: List[Optional[str]] = []
+        self._metadatas: List[Optional[dict]] = []
+        self._documents: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._reset_columns()
+
+        if os.path.exists(self.matrix_path):
+            self._matrix = np.load(self.matrix_path, mmap_mode='r+')
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if 'collection' in entry:
+                        self._metadata = entry['collection']
+                    elif 'delete' in entry:
+                        self._tombstone(entry['delete'])
+                    elif 'update' in entry:
+                        row = self._rows.get(entry['update'])
+                        if row is not None:
+                            self._metadatas[row] = entry.get('metadata')
+                    else:
+                        self._append_row(entry['id'], entry.get('metadata'), entry.get('document'))
+        available = len(self._matrix) if self._matrix is not None else 0
+        if self._size > available:
+            # 向量文件缺失或不完整，丢弃没有向量的行
+            self.logger.warning(f"[NumpyIndex._load] {self.name} 日志行数多于向量行数，截断到 {available}")
+            for image_id in self._ids[available:]:
+                if self._rows.get(image_id, -1) >= available:
+                    self._rows.pop(image_id)
+            del self._ids[available:], self._metadatas[available:], self._documents[available:]
+            self._size = available
+        self._alive = self._alive[:self._size]
+        if not os.path.exists(self.log_path):
+            self._write_log_header()
+
+    def _write_log_header(self):
+        with open(self.log_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'collection': self._metadata}) + '\n')
+
+    def _append_row(self, image_id, metadata, document):
+        row = self._size
+        self._tombstone(image_id)
+        self._ids.append(image_id)
+        self._metadatas.append(metadata)
+        self._documents.append(document)
+        self._rows[image_id] = row
+        if row >= len(self._alive):
+            grow = max(row + 1, len(self._alive))
+            self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+            for (key, numeric), column in self._columns.items():
+                self._columns[key, numeric] = np.concatenate([column, self._empty_column(numeric, grow)])
+        self._alive[row] = True
+        self._set_columns(row, metadata)
+        self._size += 1
+        return row
+
+    def _reset_columns(self):
+        """清空元数据列，下次过滤时按需重建"""
+        # (字段, 是否数值列) -> 每行一个值；数值列缺失为 NaN，其余字段存取值编号，缺失为 -1
+        self._columns: Dict[tuple, np.ndarray] = {}
+        self._codes: Dict[str, dict] = {}
+
+    @staticmethod
+    def _empty_column(numeric: bool, rows: int) -> np.ndarray:
+        if numeric:
+            return np.full(rows, np.nan)
+        return np.full(rows, -1, dtype=np.int64)
+
+    def _encode(self, key: str, numeric: bool, value):
+        if numeric:
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return value
+            return np.nan
+        if value is None:
+            return -1
+        codes = self._codes.setdefault(key, {})
+        return codes.setdefault(value, len(codes))
+
+    def _set_columns(self, row: int, metadata: Optional[dict]):
+        for key, numeric in self._columns:
+            value = metadata.get(key) if metadata else None
+            self._columns[key, numeric][row] = self._encode(key, numeric, value)
+
+    def _column(self, key: str, numeric: bool) -> np.ndarray:
+        """元数据字段的列存储，第一次按该字段过滤时建立，之后随写入增量维护"""
+        column = self._columns.get((key, numeric))
+        if column is None:
+            column = self._empty_column(numeric, len(self._alive))
+            for row in np.flatnonzero(self._alive[:self._size]):
+                metadata = self._metadatas[row]
+                column[row] = self._encode(key, numeric, metadata.get(key) if metadata else None)
+            self._columns[key, numeric] = column
+        return column[:self._size]
+
+    def _where_mask(self, where: dict) -> np.ndarray:
+        """按 where 子句在元数据列上整列比较，语义与 match_where 一致"""
+        mask = np.ones(self._size, dtype=bool)
+        for key, condition in where.items():
+            if key == '$and':
+                for sub in condition:
+                    mask &= self._where_mask(sub)
+            elif key == '$or':
+                matched = np.zeros(self._size, dtype=bool)
+                for sub in condition:
+                    matched |= self._where_mask(sub)
+                mask &= matched
+            else:
+                if not isinstance(condition, dict):
+                    condition = {'$eq': condition}
+                for op, operand in condition.items():
+                    mask &= self._condition_mask(key, op, operand)
+        return mask
+
+    def _condition_mask(self, key: str, op: str, operand) -> np.ndarray:
+        if op in ('$eq', '$ne', '$in', '$nin'):
+            codes = self._column(key, numeric=False)
+            known = self._codes.get(key, {})
+            # 集合中没有出现过的取值编号为 -2，不与任何行相等
+            if op in ('$eq', '$ne'):
+                matched = codes == known.get(operand, -2)
+            else:
+                matched = np.isin(codes, [known.get(value, -2) for value in operand])
+            return ~matched if op in ('$ne', '$nin') else matched
+        values = self._column(key, numeric=True)
+        # 缺失值为 NaN，比较结果为 False
+        with np.errstate(invalid='ignore'):
+            if op == '$gt':
+                return values > operand
+            if op == '$gte':
+                return values >= operand
+            if op == '$lt':
+                return values < operand
+            if op == '$lte':
+                return values <= operand
+        raise ValueError(f"不支持的条件运算符: {op}")
+
+    def _tombstone(self, image_id) -> bool:
+        row = self._rows.pop(image_id, None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        self._metadatas[row] = None
+        self._documents[row] = None
+        return True
+
+    def _ensure_capacity(self, rows: int, dim: int):
+        """保证向量文件能容纳 rows 行，不足时按翻倍容量重建文件"""
+        if self._matrix is not None:
+            if self._matrix.shape[1] != dim:
+                raise ValueError(f"向量维度 {dim} 与集合维度 {self._matrix.shape[1]} 不一致")
+            if rows <= len(self._matrix):
+                return
+        capacity = self.INITIAL_CAPACITY if self._matrix is None else len(self._matrix)
+        while capacity < rows:
+            capacity *= 2
+        self._rewrite_matrix(capacity, dim, np.arange(self._size))
+
+    def _rewrite_matrix(self, capacity: int, dim: int, keep_rows):
+        """把 keep_rows 指定的行写入新的向量文件，再原子替换"""
+        tmp_path = self.matrix_path + '.tmp.npy'
+        new_matrix = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(capacity, dim))
+        if self._matrix is not None and len(keep_rows):
+            new_matrix[:len(keep_rows)] = self._matrix[keep_rows]
+        new_matrix.flush()
+        del new_matrix
+        self._matrix = None
+        os.replace(tmp_path, self.matrix_path)
+        self._matrix = np.load(self.matrix_path, mmap_mode='r+')
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def upsert(self, ids, embeddings, metadatas, documents=None):
+        if not ids:
+            return
+        vectors = self._normalize(embeddings)
+        if documents is None:
+            documents = [None] * len(ids)
+        with self._lock:
+            start = self._size
+            self._ensure_capacity(start + len(ids), vectors.shape[1])
+            self._matrix[start:start + len(ids)] = vectors
+            self._matrix.flush()
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                for image_id, metadata, document in zip(ids, metadatas, documents):
+                    self._append_row(image_id, metadata, document)
+                    f.write(json.dumps({'id': image_id, 'metadata': metadata, 'document': document},
+                                       ensure_ascii=False) + '\n')
+            self._maybe_compact()
+
+    def delete(self, ids):
+        with self._lock:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                for image_id in ids:
+                    if self._tombstone(image_id):
+                        f.write(json.dumps({'delete': image_id}) + '\n')
+            self._maybe_compact()
+
+    def _candidate_rows(self, where) -> np.ndarray:
+        """满足 where 的行号
+
+        条件含 image_id 列表时只逐行检查这些行；其余条件在元数据列上整列比较。
+        """
+        if not where:
+            return np.flatnonzero(self._alive[:self._size])
+        conditions = where.get('$and', [where])
+        for condition in conditions:
+            image_ids = condition.get('image_id')
+            if isinstance(image_ids, dict) and '$in' in image_ids:
+                # 向量ID是图片ID的字符串形式
+                rows = (self._rows.get(str(image_id)) for image_id in image_ids['$in'])
+                candidates = sorted(row for row in rows if row is not None)
+                return np.array([row for row in candidates if match_where(self._metadatas[row], where)],
+                                dtype=np.int64)
+        return np.flatnonzero(self._alive[:self._size] & self._where_mask(where))
+
+    def query(self, embedding, limit, where=None):
+        with self._lock:
+            alive = self._candidate_rows(where)
+            if not len(alive) or limit <= 0:
+                return {'ids': [[]], 'distances': [[]], 'metadatas': [[]], 'documents': [[]]}
+            query = self._normalize(embedding)
+            if where:
+                scores = self._matrix[alive] @ query
+            else:
+                # 整块矩阵乘避免复制全部存活行
+                scores = (self._matrix[:self._size] @ query)[alive]
+            k = min(limit, len(alive))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            rows = alive[top]
+            return {
+                'ids': [[self._ids[row] for row in rows]],
+                'distances': [[float(1.0 - score) for score in scores[top]]],
+                'metadatas': [[self._metadatas[row] for row in rows]],
+                'documents': [[self._documents[row] for row in rows]]
+            }
+
+    def iter_ids(self, chunk_size):
+        with self._lock:
+            ids = list(self._rows)
+        for i in range(0, len(ids), chunk_size):
+            yield ids[i:i + chunk_size]
+
+    def existing_ids(self, ids):
+        with self._lock:
+            return {image_id for image_id in ids if image_id in self._rows}
+
+    def get_documents(self, ids):
+        with self._lock:
+            rows = ((image_id, self._rows.get(image_id)) for image_id in ids)
+            return {image_id: self._documents[row] for image_id, row in rows
+                    if row is not None and self._documents[row] is not None}
+
+    def update_metadata(self, ids, metadatas):
+        with self._lock:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                for image_id, metadata in zip(ids, metadatas):
+                    row = self._rows.get(image_id)
+                    if row is None:
+                        continue
+                    self._metadatas[row] = metadata
+                    self._set_columns(row, metadata)
+                    f.write(json.dumps({'update': image_id, 'metadata': metadata}, ensure_ascii=False) + '\n')
+
+    def rekey(self, transform, chunk_size=1000):
+        """在内存中改写 ID 和元数据，再压缩重写日志"""
+        with self._lock:
+            rows = np.flatnonzero(self._alive[:self._size])
+            for i in range(0, len(rows), chunk_size):
+                chunk = rows[i:i + chunk_size]
+                items = transform([self._ids[row] for row in chunk], [self._metadatas[row] for row in chunk])
+                for row, item in zip(chunk, items):
+                    if item is None:
+                        self._alive[row] = False
+                    else:
+                        self._ids[row], self._metadatas[row] = item
+            self.compact()
+            return len(self._rows)
+
+    def iter_vectors(self, chunk_size):
+        with self._lock:
+            rows = list(self._rows.items())
+            for i in range(0, len(rows), chunk_size):
+                chunk = rows[i:i + chunk_size]
+                yield [image_id for image_id, _ in chunk], self._matrix[[row for _, row in chunk]].tolist()
+
+    def count(self):
+        return len(self._rows)
+
+    def rebuild(self, metadata, chunk_size=1000):
+        """精确检索没有图参数，重建即压缩"""
+        self._metadata = dict(metadata)
+        self.compact()
+
+    def _maybe_compact(self):
+        dead = self._size - len(self._rows)
+        if self._size >= self.COMPACT_MIN_ROWS and dead > self._size * self.compact_ratio:
+            self.compact()
+
+    def compact(self):
+        """去掉墓碑行，重写向量文件和 ID 日志"""
+        with self._lock:
+            keep = np.flatnonzero(self._alive[:self._size])
+            dim = self._matrix.shape[1] if self._matrix is not None else 0
+            if self._matrix is not None:
+                capacity = self.INITIAL_CAPACITY
+                while capacity < len(keep):
+                    capacity *= 2
+                self._rewrite_matrix(capacity, dim, keep)
+
+            entries = [(self._ids[row], self._metadatas[row], self._documents[row]) for row in keep]
+            tmp_path = self.log_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'collection': self._metadata}) + '\n')
+                for image_id, metadata, document in entries:
+                    f.write(json.dumps({'id': image_id, 'metadata': metadata, 'document': document},
+                                       ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.log_path)
+
+            self._size = 0
+            self._ids, self._metadatas, self._documents, self._rows = [], [], [], {}
+            self._alive = np.zeros(len(entries), dtype=bool)
+            self._reset_columns()
+            for image_id, metadata, document in entries:
+                self._append_row(image_id, metadata, document)
+            self.logger.info(f"[NumpyIndex.compact] {self.name} 压缩完成，保留 {len(entries)} 条")
+
+    def clear(self, metadata=None):
+        with self._lock:
+            if metadata is not None:
+                self._metadata = dict(metadata)
+            self._matrix = None
+            if os.path.exists(self.matrix_path):
+                os.remove(self.matrix_path)
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+            self._load()
@@ -1,7 +1,13 @@
-import chromadb
-from chromadb.config import Settings
-import hashlib
+import os
+from datetime import datetime
 from utils.logger import Logger
+from utils.config_manager import ConfigManager
+from .embedder import TextEmbedder
+from .vector_backends import ChromaIndex, NumpyIndex
+from .search_filters import capture_timestamp, directory_metadata
+
+# 分页读取 ID 和分块删除时每次处理的记录数
+ID_CHUNK_SIZE = 1000
 
 class VectorStore:
     _instance = None
@@ -15,92 +21,331 @@ class VectorStore:
     def _init_store(self):
         """初始化ChromaDB"""
         self.logger = Logger()
+        config_manager = ConfigManager()
+        # 写入和查询共用的向量模型
+        self.embedder = TextEmbedder(
+            config_manager.get_embedding_model(),
+            config_manager.get_embedding_batch_size(),
+            config_manager.get_embedding_worker()
+        )
         try:
-            # 使用持久化存储
-            self.client = chromadb.PersistentClient(path="./vector_db")
-            # 获取或创建集合
-            self.collection = self.client.get_or_create_collection(
-                name="image_descriptions",
-                metadata={"hnsw:space": "cosine"}  # 使用余弦相似度
-            )
+            self.backend = config_manager.get_vector_backend()
+            self.clip_model = config_manager.get_clip_model()
+            self.hnsw_params = config_manager.get_hnsw_params()
+            self._open_collections()
+            # 描述向量集合由其他向量模型建成时拒绝写入，直到用当前模型重建（reindex_vectors）
+            self.caption_model_mismatch = None
+            collection_model = (self.collection.metadata or {}).get("embedding_model", "default")
+            if collection_model != self.embedder.model_name:
+                if self.collection.count() == 0:
+                    self.clear_captions()
+                else:
+                    self.caption_model_mismatch = collection_model
+                    self.logger.warning(f"[VectorStore._init_store] 集合向量模型 {collection_model} 与配置的 "
+                                        f"{self.embedder.model_name} 不一致，需要重建向量索引")
+            image_model = (self.image_collection.metadata or {}).get("embedding_model")
+            if image_model != self.clip_model:
+                # 图片向量无法从 SQLite 重建，且与新模型的查询向量不可比，清空后由重新扫描补齐
+                if self.image_collection.count() > 0:
+                    self.logger.warning(f"[VectorStore._init_store] 图片向量集合模型 {image_model} 与配置的 "
+                                        f"{self.clip_model} 不一致，已清空，重新扫描后重建")
+                self.image_collection.clear(self._collection_metadata()["image_embeddings"])
             self.logger.info("[VectorStore._init_store] 向量数据库初始化成功")
         except Exception as e:
             self.logger.error(f"[VectorStore._init_store] 向量数据库初始化失败: {str(e)}")
             raise
+
+    def _collection_metadata(self) -> dict:
+        """两个集合创建时使用的参数，HNSW 参数只在创建集合时生效"""
+        return {
+            "image_descriptions": {
+                "hnsw:space": "cosine",  # 使用余弦相似度
+                **self.hnsw_params,
+                "embedding_model": self.embedder.model_name
+            },
+            # CLIP 图片向量单独存放，维度和向量空间与描述向量不同
+            "image_embeddings": {
+                "hnsw:space": "cosine",
+                **self.hnsw_params,
+                "embedding_model": self.clip_model
+            }
+        }
+
+    def _open_collections(self):
+        """按配置的后端打开描述向量和图片向量两个集合"""
+        collections = self._collection_metadata()
+        if self.backend == 'numpy':
+            # 精确检索：启动时只做内存映射，无需加载 ChromaDB
+            indexes = [NumpyIndex("./vector_npy", name, metadata) for name, metadata in collections.items()]
+        else:
+            import chromadb
+            # 使用持久化存储
+            self.client = chromadb.PersistentClient(path="./vector_db")
+            indexes = [ChromaIndex(self.client, name, metadata) for name, metadata in collections.items()]
+        self.collection, self.image_collection = indexes
     
-    def generate_image_id(self, file_path: str) -> str:
-        """生成图片唯一ID"""
-        return hashlib.sha256(file_path.encode()).hexdigest()
+    @property
+    def embedding_model(self) -> str:
+        """当前使用的向量模型"""
+        return self.embedder.model_name
+
+    def embed_documents(self, documents: list) -> list:
+        """批量计算描述向量"""
+        return self.embedder.embed(documents)
+
+    def embed_documents_async(self, documents: list):
+        """提交批量向量计算，返回 Future"""
+        return self.embedder.embed_async(documents)
+
+    @staticmethod
+    def vector_id(image_id: int) -> str:
+        """向量库记录ID：SQLite 整数图片ID的字符串形式"""
+        return str(image_id)
+
+    def build_metadata(self, image_id: int, file_path: str, attributes: dict = None) -> dict:
+        """向量元数据：ID、路径，以及用于过滤下推的目录、扩展名、大小和拍摄时间
+
+        Args:
+            image_id: SQLite 中的图片ID
+            file_path: 图片文件路径
+            attributes: 图片属性（可选），包含 file_size 和 capture_time（'%Y-%m-%d %H:%M:%S'）
+        """
+        metadata = {"image_id": int(image_id), "file_path": file_path}
+        metadata.update(directory_metadata(file_path))
+        metadata["ext"] = os.path.splitext(file_path)[1].lower()
+        attributes = attributes or {}
+        if attributes.get('file_size') is not None:
+            metadata["file_size"] = int(attributes['file_size'])
+        if attributes.get('capture_time'):
+            capture_time = datetime.strptime(attributes['capture_time'], '%Y-%m-%d %H:%M:%S')
+            metadata["capture_ts"] = capture_timestamp(capture_time)
+        return metadata
     
-    def add_image(self, file_path: str, description: str):
-        """添加图片描述到向量数据库"""
+    def add_image(self, image_id: int, file_path: str, description: str, embedding: list = None,
+                  attributes: dict = None):
+        """添加图片描述到向量数据库
+
+        Args:
+            image_id: SQLite 中的图片ID
+            file_path: 图片文件路径
+            description: 图片描述
+            embedding: 已计算的描述向量（可选），为空时现场计算
+            attributes: 写入元数据的图片属性（可选），见 build_metadata
+        """
+        return self.upsert_images([(image_id, file_path, description, embedding, attributes)])[0]
+
+    def upsert_images(self, items: list) -> list:
+        """批量写入图片描述，已存在的记录直接覆盖
+
+        Args:
+            items: (图片ID, 文件路径, 描述, 描述向量或 None, 图片属性或 None) 列表，缺少的向量整批计算
+
+        Returns:
+            list: 与 items 对应的向量库记录ID
+        """
+        if not items:
+            return []
+        if self.caption_model_mismatch is not None:
+            raise RuntimeError(f"描述向量集合由 {self.caption_model_mismatch} 建成，与配置的向量模型 "
+                               f"{self.embedder.model_name} 不一致，需先重建描述向量")
         try:
-            image_id = self.generate_image_id(file_path)
-            
-            count = self.collection.count()
-            print(f"[VectorStore.add_image] 当前记录数: {count}, 准备添加: {file_path}")
-
-            # 检查是否存在
-            result = self.collection.get(ids=[image_id])
-            if result["ids"]:
-                print(f"[VectorStore.add_image] ID已存在: {image_id}, 文件: {file_path}")
-                # 如果已存在，先删除
-                self.collection.delete(ids=[image_id])
-                print(f"[VectorStore.add_image] 已删除旧记录: {image_id}")
-            
-            try:
-                self.collection.add(
-                    documents=[description],
-                    metadatas=[{"image_id": image_id, "file_path": file_path}],
-                    ids=[image_id]
-                )
-                print(f"[VectorStore.add_image] 成功添加记录: {file_path}")
-            except Exception as e:
-                print(f"[VectorStore.add_image] 添加记录失败: {str(e)}")
-                raise
-            
-            return image_id
-        
+            metadatas = [self.build_metadata(image_id, file_path, attributes)
+                         for image_id, file_path, _, _, attributes in items]
+            ids = [self.vector_id(image_id) for image_id, _, _, _, _ in items]
+            embeddings = [embedding for _, _, _, embedding, _ in items]
+            missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            if missing:
+                computed = self.embed_documents([items[i][2] for i in missing])
+                for i, embedding in zip(missing, computed):
+                    embeddings[i] = embedding
+
+            self.collection.upsert(
+                documents=[description for _, _, description, _, _ in items],
+                embeddings=embeddings,
+                metadatas=metadatas,
+                ids=ids
+            )
+            self.logger.info(f"[VectorStore.upsert_images] 写入 {len(ids)} 条描述向量")
+            return ids
         except Exception as e:
-            self.logger.error(f"[VectorStore.add_image] 处理失败: {str(e)}, 文件: {file_path}")
+            self.logger.error(f"[VectorStore.upsert_images] 批量写入失败: {str(e)}, 数量: {len(items)}")
             raise
     
-    def delete_image(self, file_path: str):
-        """从向量数据库删除图片描述"""
+    def add_image_embedding(self, image_id: int, file_path: str, embedding: list, attributes: dict = None):
+        """添加图片向量到图片向量集合"""
+        return self.upsert_image_embeddings([(image_id, file_path, embedding, attributes)])[0]
+
+    def upsert_image_embeddings(self, items: list) -> list:
+        """批量写入图片向量
+
+        Args:
+            items: (图片ID, 文件路径, 图片向量, 图片属性或 None) 列表
+
+        Returns:
+            list: 与 items 对应的向量库记录ID
+        """
+        if not items:
+            return []
         try:
-            image_id = self.generate_image_id(file_path)
-            self.collection.delete(ids=[image_id])
-            self.logger.info(f"[VectorStore.delete_image] 从向量数据库删除图片: {file_path}")
+            metadatas = [self.build_metadata(image_id, file_path, attributes)
+                         for image_id, file_path, _, attributes in items]
+            ids = [self.vector_id(image_id) for image_id, _, _, _ in items]
+            self.image_collection.upsert(
+                embeddings=[embedding for _, _, embedding, _ in items],
+                metadatas=metadatas,
+                ids=ids
+            )
+            return ids
         except Exception as e:
-            self.logger.error(f"[VectorStore.delete_image] 从向量数据库删除图片失败: {str(e)}")
+            self.logger.error(f"[VectorStore.upsert_image_embeddings] 批量写入失败: {str(e)}, 数量: {len(items)}")
+            raise
+
+    def delete_image(self, image_id: int):
+        """从向量数据库删除图片描述和图片向量"""
+        self.delete_images([image_id])
+
+    def delete_images(self, image_ids: list):
+        """按图片ID批量删除图片描述和图片向量"""
+        if not image_ids:
+            return
+        try:
+            ids = [self.vector_id(image_id) for image_id in image_ids]
+            self.collection.delete(ids)
+            self.image_collection.delete(ids)
+            self.logger.info(f"[VectorStore.delete_images] 从向量数据库删除图片: {len(ids)} 张")
+        except Exception as e:
+            self.logger.error(f"[VectorStore.delete_images] 从向量数据库删除图片失败: {str(e)}")
             raise
     
-    def search_images(self, query: str, limit: int = 10) -> list:
-        """搜索相似图片"""
+    def rename_images(self, items: list):
+        """文件改名或移动后只更新向量元数据中的路径和目录，不重新计算向量
+
+        Args:
+            items: (图片ID, 新文件路径, 图片属性或 None) 列表
+        """
+        if not items:
+            return
         try:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=limit
-            )
-            return results
+            ids = [self.vector_id(image_id) for image_id, _, _ in items]
+            metadatas = [self.build_metadata(image_id, file_path, attributes)
+                         for image_id, file_path, attributes in items]
+            self.collection.update_metadata(ids, metadatas)
+            self.image_collection.update_metadata(ids, metadatas)
+            self.logger.info(f"[VectorStore.rename_images] 更新图片路径: {len(ids)} 张")
+        except Exception as e:
+            self.logger.error(f"[VectorStore.rename_images] 更新图片路径失败: {str(e)}")
+            raise
+
+    def search_images(self, query: str, limit: int = 10, query_embedding: list = None,
+                      where: dict = None) -> list:
+        """搜索相似图片
+
+        Args:
+            query: 查询文本
+            limit: 返回结果数量
+            query_embedding: 已计算的查询向量（可选），为空时现场计算
+            where: 元数据过滤条件（可选），由 search_filters.build_where 生成
+        """
+        try:
+            # 查询与写入使用同一向量模型
+            if query_embedding is None:
+                query_embedding = self.embed_documents([query])[0]
+            return self.collection.query(query_embedding, limit, where)
         except Exception as e:
             self.logger.error(f"搜索图片失败: {str(e)}")
             raise 
+
+    def search_image_embeddings(self, query_embedding: list, limit: int = 10, where: dict = None) -> dict:
+        """用 CLIP 文本向量在图片向量集合中检索"""
+        try:
+            return self.image_collection.query(query_embedding, limit, where)
+        except Exception as e:
+            self.logger.error(f"[VectorStore.search_image_embeddings] 搜索图片失败: {str(e)}")
+            raise
         
+    def iter_ids(self, chunk_size: int = ID_CHUNK_SIZE):
+        """分页读取两个集合中的记录ID，不加载文档、元数据和向量
+
+        Yields:
+            list: 每页的向量库记录ID列表，同一ID可能在两个集合中各出现一次
+        """
+        for collection in (self.collection, self.image_collection):
+            yield from collection.iter_ids(chunk_size)
+
+    def existing_ids(self, image_ids: list) -> set:
+        """image_ids 中在任一集合里有记录的图片ID"""
+        ids = [self.vector_id(image_id) for image_id in image_ids]
+        found = self.collection.existing_ids(ids) | self.image_collection.existing_ids(ids)
+        return {image_id for image_id, vector_id in zip(image_ids, ids) if vector_id in found}
+
+    def existing_caption_ids(self, image_ids: list) -> set:
+        """image_ids 中在描述向量集合里有记录的图片ID"""
+        ids = [self.vector_id(image_id) for image_id in image_ids]
+        found = self.collection.existing_ids(ids)
+        return {image_id for image_id, vector_id in zip(image_ids, ids) if vector_id in found}
+
+    def get_captions(self, image_ids: list) -> dict:
+        """从描述向量集合读取图片描述
+
+        Returns:
+            dict: 图片ID -> 描述，集合中没有的图片不出现
+        """
+        documents = self.collection.get_documents([self.vector_id(image_id) for image_id in image_ids])
+        return {image_id: documents[self.vector_id(image_id)] for image_id in image_ids
+                if self.vector_id(image_id) in documents}
+
+    def delete_ids(self, ids: list, chunk_size: int = ID_CHUNK_SIZE):
+        """按向量库记录ID分块从两个集合中删除记录"""
+        ids = list(ids)
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            self.collection.delete(chunk)
+            self.image_collection.delete(chunk)
+
     def clear_database(self):
-        """清空向量数据库"""
+        """清空向量数据库：直接删除并重建集合，无需逐条读取ID"""
         try:
-            # 获取所有文档ID
-            ids = self.collection.get()["ids"]
-            if ids:  # 只在有数据时执行删除操作
-                self.collection.delete(ids=ids)
-                self.logger.info("[VectorStore.clear_database] 向量数据库已清空")
-            else:
-                self.logger.info("向量数据库已经为空，无需清理")
+            collections = self._collection_metadata()
+            self.collection.clear(collections["image_descriptions"])
+            self.image_collection.clear(collections["image_embeddings"])
+            self.caption_model_mismatch = None
+            self.logger.info("[VectorStore.clear_database] 向量数据库已清空")
         except Exception as e:
             self.logger.error(f"[VectorStore.clear_database] 清空向量数据库失败: {str(e)}")
             raise
             
+    def clear_captions(self):
+        """只清空描述向量集合，图片向量保留；集合按当前配置的向量模型重建"""
+        self.collection.clear(self._collection_metadata()["image_descriptions"])
+        self.caption_model_mismatch = None
+        self.logger.info("[VectorStore.clear_captions] 描述向量集合已清空")
+
+    def rebuild_collections(self):
+        """按当前配置的 HNSW 参数重建两个集合，保留已存储的向量"""
+        collections = self._collection_metadata()
+        for index in (self.collection, self.image_collection):
+            self.logger.info(f"[VectorStore.rebuild_collections] 开始重建集合 {index.name}: {index.count()} 条")
+            index.rebuild(collections[index.name])
+            self.logger.info(f"[VectorStore.rebuild_collections] 集合 {index.name} 重建完成")
+
+    def rekey_collections(self, transform) -> int:
+        """改写两个集合的记录ID和元数据，向量保留，见 VectorIndex.rekey
+
+        Returns:
+            int: 改写后两个集合的记录总数
+        """
+        total = 0
+        for index in (self.collection, self.image_collection):
+            self.logger.info(f"[VectorStore.rekey_collections] 开始改写集合 {index.name}: {index.count()} 条")
+            kept = index.rekey(transform, ID_CHUNK_SIZE)
+            self.logger.info(f"[VectorStore.rekey_collections] 集合 {index.name} 改写完成: {kept} 条")
+            total += kept
+        return total
+
     def count(self):
         """统计向量数据库中的记录数"""
         return self.collection.count()
+
+    def count_image_embeddings(self):
+        """统计图片向量集合中的记录数"""
+        return self.image_collection.count()
@@ -1,5 +1,6 @@
 import sys
 import os
+import threading
 from PyQt6.QtWidgets import QApplication
 from ui.main_window import MainWindow
 # from utils.image_scanner import ImageScanner
@@ -7,6 +8,8 @@ from utils.file_monitor import FileMonitor
 from utils.config_manager import ConfigManager
 from database.transaction_manager import TransactionManager
 from utils.scan_thread import ScanThread
+from utils.ImageToText import ImageToText
+from utils.caption_upgrader import CaptionUpgrader
 
 def is_debugging():
     """检查是否在调试模式下运行"""
@@ -41,6 +44,23 @@ def main():
     # 显示主窗口
     window.show()
 
+    # 后台预热描述模型，打开扫描或监控时不再阻塞等待模型加载
+    if (config_manager.get_model_warmup() and config_manager.get_caption_workers() <= 1 and
+            'caption' in config_manager.get_index_engines()):
+        ImageToText.get_instance().start_warmup()
+
+    # 后台预热查询向量模型，首次搜索不再等待模型加载
+    if config_manager.get_model_warmup():
+        threading.Thread(target=TransactionManager().warm_up_search, daemon=True,
+                         name='search_warmup').start()
+
+    # 空闲时将快速档位生成的描述升级为高质量描述
+    if ('caption' in config_manager.get_index_engines() and
+            config_manager.get_upgrade_idle_seconds() > 0 and
+            config_manager.get_index_profile() != config_manager.get_upgrade_profile()):
+        caption_upgrader = CaptionUpgrader()
+        caption_upgrader.start()
+
     # file_monitor = FileMonitor()
 
     # 检查是否首次运行
@@ -0,0 +1,34 @@
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# database/__init__.py 导入时即创建全局 TransactionManager（打开向量库、加载向量模型），
+# 测试只需要其中纯 SQLite / 纯 Python 的子模块，这里直接注册包路径而不执行 __init__
+if 'database' not in sys.modules:
+    package = types.ModuleType('database')
+    package.__path__ = [os.path.join(ROOT, 'database')]
+    sys.modules['database'] = package
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """每个测试在独立的临时目录中运行，everypic.db、settings.ini 和日志都写在这里"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def db_manager(workdir):
+    """临时目录中新建的 DatabaseManager"""
+    from database.db_manager import DatabaseManager
+    DatabaseManager._instance = None
+    manager = DatabaseManager()
+    yield manager
+    manager.pool.close()
+    DatabaseManager._instance = None
+
@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip('psutil')
+
+from utils.batch_sizer import AdaptiveBatchSizer  # noqa: E402
+
+
+@pytest.fixture
+def sizer():
+    # 不检查系统可用内存，结果只取决于上报的耗时和内存变化
+    return AdaptiveBatchSizer(initial_size=4, min_size=1, max_size=16, memory_budget_mb=100, min_available_mb=0)
+
+
+def test_grows_while_throughput_improves(sizer):
+    assert sizer.record(4, elapsed=4.0, memory_delta_mb=0) == 8
+    assert sizer.record(8, elapsed=6.0, memory_delta_mb=0) == 16
+    # 不超过上限
+    assert sizer.record(16, elapsed=8.0, memory_delta_mb=0) == 16
+
+
+def test_falls_back_to_best_size(sizer):
+    sizer.record(4, elapsed=4.0, memory_delta_mb=0)
+    sizer.record(8, elapsed=2.0, memory_delta_mb=0)
+
+    # 16 张的单张耗时变差，回到 8
+    assert sizer.record(16, elapsed=16.0, memory_delta_mb=0) == 8
+
+
+def test_memory_pressure_halves_size(sizer):
+    assert sizer.record(4, elapsed=1.0, memory_delta_mb=500) == 2
+    assert sizer.shrink() == 1
+    assert sizer.shrink() == 1
+
+
+def test_empty_batch_keeps_size(sizer):
+    assert sizer.record(0, elapsed=1.0, memory_delta_mb=0) == 4
+
+
+def test_initial_size_is_clamped():
+    assert AdaptiveBatchSizer(initial_size=64, max_size=8).batch_size == 8
+    assert AdaptiveBatchSizer(initial_size=0, min_size=2, max_size=8).batch_size == 2
@@ -0,0 +1,152 @@
+import os
+import sqlite3
+
+import pytest
+
+
+def image_row(file_path, **fields):
+    """add_images 需要的一行图片信息，未给出的字段使用固定的默认值"""
+    row = {
+        'file_path': file_path,
+        'file_name': os.path.basename(file_path),
+        'file_size': 100,
+        'md5': 'md5-' + os.path.basename(file_path),
+        'created_time': '2024-01-01T00:00:00',
+        'modified_time': '2024-01-01T00:00:00',
+        'caption': None,
+    }
+    row.update(fields)
+    return row
+
+
+def fetch_row(db_manager, image_id):
+    return db_manager.pool.connection().execute(
+        'SELECT file_path, file_size, caption, extension, directory FROM images WHERE id = ?',
+        (image_id,)).fetchone()
+
+
+def test_keyword_search_and_captions(db_manager):
+    ids = db_manager.add_images([image_row('a.jpg', caption='a red bicycle'),
+                                 image_row('b.jpg', caption='a blue car'),
+                                 image_row('c.jpg')])
+
+    assert db_manager.search_keywords('bicycle', 10) == [ids['a.jpg']]
+    # ID列表超过 SQLite 参数个数上限时也能一次查询，没有描述或不存在的ID不出现
+    missing = list(range(10 ** 6, 10 ** 6 + 40000))
+    assert db_manager.get_keyword_captions(list(ids.values()) + missing) == {
+        ids['a.jpg']: 'a red bicycle',
+        ids['b.jpg']: 'a blue car',
+    }
+    assert db_manager.get_keyword_captions([]) == {}
+
+
+def test_add_images_assigns_integer_ids(db_manager):
+    paths = [os.path.join('photos', 'a.jpg'), os.path.join('photos', 'b.PNG')]
+    ids = db_manager.add_images([image_row(path) for path in paths])
+
+    assert set(ids) == set(paths)
+    assert all(isinstance(image_id, int) for image_id in ids.values())
+    assert len(set(ids.values())) == 2
+    _, _, _, extension, directory = fetch_row(db_manager, ids[paths[1]])
+    assert extension == '.png'
+    assert directory == os.path.normcase('photos')
+
+
+def test_add_images_upsert_keeps_id(db_manager):
+    path = os.path.join('photos', 'a.jpg')
+    first = db_manager.add_images([image_row(path)])[path]
+
+    # 没有变化的图片原样返回已有ID
+    assert db_manager.add_images([image_row(path)]) == {path: first}
+
+    updated = db_manager.add_images([image_row(path, file_size=200, caption='a red bicycle')])
+    assert updated == {path: first}
+    assert fetch_row(db_manager, first)[1:3] == (200, 'a red bicycle')
+    assert db_manager.pool.connection().execute('SELECT COUNT(*) FROM images').fetchone()[0] == 1
+
+    # 全文索引随描述重写，rowid 仍是图片ID
+    assert db_manager.search_keywords('bicycle', 10) == [first]
+    assert db_manager.get_keyword_captions([first]) == {first: 'a red bicycle'}
+
+    db_manager.add_images([image_row(path, file_size=200, caption='a blue car')])
+    assert db_manager.search_keywords('bicycle', 10) == []
+    assert db_manager.search_keywords('car', 10) == [first]
+
+
+def test_add_images_last_duplicate_wins(db_manager):
+    path = 'a.jpg'
+    ids = db_manager.add_images([image_row(path, file_size=1), image_row(path, file_size=2)])
+
+    assert list(ids) == [path]
+    assert fetch_row(db_manager, ids[path])[1] == 2
+
+
+def test_add_images_rolls_back_failed_batch(db_manager):
+    rows = [image_row('a.jpg'), image_row('b.jpg', file_name=None)]
+    with pytest.raises(sqlite3.IntegrityError):
+        db_manager.add_images(rows)
+
+    assert db_manager.pool.connection().execute('SELECT COUNT(*) FROM images').fetchone()[0] == 0
+
+
+def test_iter_records_pages_by_path(db_manager):
+    paths = [f"{name}.jpg" for name in 'edcba']
+    ids = db_manager.add_images([image_row(path) for path in paths])
+
+    pages = list(db_manager.iter_records(chunk_size=2))
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    records = [record for page in pages for record in page]
+    assert [record.file_path for record in records] == sorted(paths)
+    assert [record.id for record in records] == [ids[path] for path in sorted(paths)]
+    assert records[0].md5 == 'md5-a.jpg'
+
+
+def test_iter_records_allows_writes_between_pages(db_manager):
+    db_manager.add_images([image_row(f"{name}.jpg") for name in 'abcd'])
+
+    seen = []
+    for page in db_manager.iter_records(chunk_size=2):
+        seen.extend(record.file_path for record in page)
+        # 翻页之间删除已读过的记录、插入排在后面的新记录
+        db_manager.delete_images_by_paths([record.file_path for record in page])
+        if len(seen) == 2:
+            db_manager.add_image(image_row('e.jpg'))
+
+    assert seen == ['a.jpg', 'b.jpg', 'c.jpg', 'd.jpg', 'e.jpg']
+
+
+def test_set_captions_fills_missing_captions_only(db_manager):
+    ids = db_manager.add_images([image_row('a.jpg', caption='a red bicycle'), image_row('b.jpg')])
+
+    db_manager.set_captions({ids['a.jpg']: 'a blue car', ids['b.jpg']: 'a green tree'})
+
+    assert fetch_row(db_manager, ids['a.jpg'])[2] == 'a red bicycle'
+    assert fetch_row(db_manager, ids['b.jpg'])[2] == 'a green tree'
+    # 已有描述的图片全文索引不被覆盖，补上描述的图片可按描述和文件名检索
+    assert db_manager.search_keywords('car', 10) == []
+    assert db_manager.search_keywords('bicycle', 10) == [ids['a.jpg']]
+    assert db_manager.search_keywords('tree', 10) == [ids['b.jpg']]
+    assert db_manager.get_keyword_captions([ids['b.jpg']]) == {ids['b.jpg']: 'a green tree'}
+
+
+def test_deleted_ids_are_not_reused(db_manager):
+    ids = db_manager.add_images([image_row('a.jpg'), image_row('b.jpg')])
+
+    assert db_manager.delete_images_by_paths(['b.jpg', 'missing.jpg']) == [ids['b.jpg']]
+    assert db_manager.search_keywords('b', 10) == []
+
+    new_id = db_manager.add_image(image_row('c.jpg'))
+    assert new_id > ids['b.jpg']
+
+
+def test_rename_image_keeps_id_and_caption(db_manager):
+    ids = db_manager.add_images([image_row('a.jpg', caption='a cat'), image_row('b.jpg')])
+
+    result = db_manager.rename_image('a.jpg', 'b.jpg')
+
+    assert result['id'] == ids['a.jpg']
+    assert result['replaced_id'] == ids['b.jpg']
+    assert fetch_row(db_manager, ids['a.jpg'])[:3] == ('b.jpg', 100, 'a cat')
+    assert fetch_row(db_manager, ids['b.jpg']) is None
+    assert db_manager.rename_image('missing.jpg', 'c.jpg') is None
@@ -0,0 +1,183 @@
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+pytest.importorskip('torch')
+
+from utils.ImageToText import ImageToText  # noqa: E402
+
+
+class FakeProcessor:
+    """记录输入的处理器，描述为图片的宽度，便于核对顺序"""
+
+    def __init__(self):
+        self.calls = []
+        self.image_processor = type('ImageProcessor', (), {'size': {'width': 64, 'height': 48}})()
+
+    def __call__(self, images, text=None, return_tensors=None, padding=False):
+        self.calls.append((list(images), text))
+        return {'images': list(images)}
+
+    def batch_decode(self, out, skip_special_tokens=False):
+        return [f"width {width}" for width in out]
+
+
+class FakeBackend:
+    def __init__(self):
+        self.generate_calls = []
+
+    def generate(self, inputs, **generate_kwargs):
+        self.generate_calls.append(generate_kwargs)
+        return [image.width for image in inputs['images']]
+
+
+@pytest.fixture
+def captioner():
+    captioner = ImageToText()
+    captioner.processor = FakeProcessor()
+    captioner.backend = FakeBackend()
+    captioner.model = object()
+    return captioner
+
+
+def test_batch_is_one_forward_pass(captioner):
+    images = [Image.new('RGB', (width, 8)) for width in (10, 20, 30)]
+
+    captions = captioner.caption_loaded_images(images, profile=ImageToText.PROFILE_FAST)
+
+    assert captions == ['width 10', 'width 20', 'width 30']
+    assert len(captioner.processor.calls) == 1
+    assert captioner.backend.generate_calls == [ImageToText.GENERATION_PROFILES[ImageToText.PROFILE_FAST]]
+
+
+def test_none_slots_keep_positions(captioner):
+    images = [None, Image.new('RGB', (10, 8)), None, Image.new('RGB', (20, 8))]
+
+    assert captioner.caption_loaded_images(images) == [None, 'width 10', None, 'width 20']
+    # 只有可用的图片进入处理器
+    assert [image.width for image in captioner.processor.calls[0][0]] == [10, 20]
+
+
+def test_all_images_missing_skips_model(captioner):
+    assert captioner.caption_loaded_images([None, None]) == [None, None]
+    assert captioner.backend.generate_calls == []
+
+
+def test_conditional_text_applies_to_whole_batch(captioner):
+    images = [Image.new('RGB', (10, 8)), Image.new('RGB', (20, 8))]
+
+    captioner.caption_loaded_images(images, conditional_text='a photo of')
+
+    assert captioner.processor.calls[0][1] == ['a photo of', 'a photo of']
+
+
+def test_unreadable_files_become_none(captioner, workdir):
+    path = str(workdir / 'a.png')
+    Image.new('RGB', (500, 400)).save(path)
+    (workdir / 'broken.jpg').write_bytes(b'not an image')
+
+    captions = captioner.caption_images([str(workdir / 'missing.jpg'), path, str(workdir / 'broken.jpg')])
+
+    assert captions == [None, 'width 64', None]
+    assert len(captioner.backend.generate_calls) == 1
+    with pytest.raises(RuntimeError):
+        captioner.caption_image(str(workdir / 'broken.jpg'))
+
+
+def test_wait_until_ready_after_warm_up(captioner):
+    ready = []
+    captioner.start_warmup(on_ready=lambda: ready.append(True))
+
+    assert captioner.wait_until_ready(timeout=5)
+    assert ready == [True]
+    assert captioner.load_error is None
+
+
+def test_failed_warm_up_is_reported(monkeypatch):
+    captioner = ImageToText()
+    error = RuntimeError('no model')
+
+    def fail():
+        raise error
+
+    monkeypatch.setattr(captioner, '_load', fail)
+    ready, failed = [], []
+    captioner.start_warmup(on_ready=lambda: ready.append(True), on_error=failed.append)
+
+    assert captioner.wait_until_ready(timeout=5) is False
+    assert captioner.load_error is error
+    assert failed == [error]
+    # 失败后等待就绪的回调被丢弃，不会在之后的成功加载中补调
+    assert ready == []
+    assert not captioner.is_loading
+
+
+def gradient_image(size, mode='RGB'):
+    """每个像素都不同的测试图，缩小结果对解码方式敏感"""
+    image = Image.new(mode, size)
+    channels = len(image.getbands())
+    image.putdata([tuple((x * 7 + y * 13 + c * 50) % 256 for c in range(channels)) if channels > 1
+                   else (x * 7 + y * 13) % 256
+                   for y in range(size[1]) for x in range(size[0])])
+    return image
+
+
+@pytest.mark.parametrize('file_name, mode', [('big.bmp', 'RGB'), ('big.ppm', 'RGB'), ('big.tif', 'L')])
+def test_over_budget_raw_formats_decode_in_bands(workdir, monkeypatch, file_name, mode):
+    import utils.ImageToText as image_to_text
+    path = str(workdir / file_name)
+    gradient_image((203, 157), mode).save(path)
+    expected = image_to_text.decode_image(path, (32, 32), resize=False)
+
+    # 每条只有几行，且原图不允许整张加载
+    monkeypatch.setattr(image_to_text, 'DECODE_BAND_PIXELS', 203 * 10)
+    from PIL import ImageFile
+    monkeypatch.setattr(ImageFile.ImageFile, 'load',
+                        lambda self: pytest.fail('超过预算的未压缩图片不应整张解码'))
+    decoded = image_to_text.decode_image(path, (32, 32), max_pixels=1000, resize=False)
+
+    assert decoded.size == expected.size == (-(-203 // 4), -(-157 // 4))
+    assert decoded.tobytes() == expected.tobytes()
+
+
+def test_over_budget_compressed_formats_decode_one_at_a_time(workdir, monkeypatch):
+    import utils.ImageToText as image_to_text
+    path = str(workdir / 'big.png')
+    gradient_image((203, 157)).save(path)
+    expected = image_to_text.decode_image(path, (32, 32))
+
+    entered = []
+
+    class RecordingLock:
+        def __enter__(self):
+            entered.append(True)
+
+        def __exit__(self, *exc_info):
+            return False
+
+    monkeypatch.setattr(image_to_text, '_large_decode_lock', RecordingLock())
+    decoded = image_to_text.decode_image(path, (32, 32), max_pixels=1000)
+
+    assert entered == [True]
+    assert decoded.size == (32, 32)
+    assert decoded.tobytes() == expected.tobytes()
+
+
+def test_within_budget_skips_decode_lock(workdir, monkeypatch):
+    import utils.ImageToText as image_to_text
+    path = str(workdir / 'small.png')
+    gradient_image((40, 30)).save(path)
+    monkeypatch.setattr(image_to_text, '_large_decode_lock', None)
+
+    assert image_to_text.decode_image(path, (20, 15), max_pixels=1000000).size == (20, 15)
+
+
+def test_decode_lock_is_shared_with_worker_processes(monkeypatch):
+    import multiprocessing
+    import utils.ImageToText as image_to_text
+    monkeypatch.setattr(image_to_text, '_large_decode_lock', image_to_text._large_decode_lock)
+    monkeypatch.setattr(image_to_text, '_shared_decode_lock', None)
+
+    lock = image_to_text.share_large_decode_lock(multiprocessing.get_context('spawn'))
+
+    assert image_to_text._large_decode_lock is lock
+    assert image_to_text.share_large_decode_lock(multiprocessing.get_context('spawn')) is lock
@@ -0,0 +1,106 @@
+import hashlib
+import sqlite3
+
+import pytest
+
+from database.migrations import SCHEMA_VERSION, migrate
+
+
+def legacy_id(file_path):
+    return hashlib.sha256(file_path.encode('utf-8')).hexdigest()
+
+
+@pytest.fixture
+def baseline_conn(workdir):
+    """引入版本号之前的 everypic.db：十六进制文本ID，没有全文索引和后来补充的列"""
+    conn = sqlite3.connect(str(workdir / 'baseline.db'))
+    conn.execute('''
+        CREATE TABLE images (
+            id TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL UNIQUE,
+            file_name TEXT NOT NULL,
+            file_size INTEGER,
+            md5 TEXT,
+            created_time TEXT,
+            modified_time TEXT
+        )
+    ''')
+    conn.executemany('INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?)', [
+        (legacy_id(path), path, path.rsplit('/', 1)[-1], 100 * i, f"md5-{i}",
+         '2024-01-01 00:00:00', '2024-01-02 00:00:00')
+        for i, path in enumerate(['/photos/a.jpg', '/photos/trip/b.PNG', '/c.gif'], start=1)
+    ])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def test_migrate_baseline_database(baseline_conn):
+    before = dict(baseline_conn.execute('SELECT file_path, rowid FROM images'))
+
+    assert migrate(baseline_conn) == SCHEMA_VERSION == 4
+    assert baseline_conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+
+    # 整数ID取原来的 rowid，旧ID对照表记录每条图片
+    after = dict(baseline_conn.execute('SELECT file_path, id FROM images'))
+    assert after == before
+    legacy = dict(baseline_conn.execute('SELECT legacy_id, id FROM legacy_image_ids'))
+    assert legacy == {legacy_id(path): image_id for path, image_id in before.items()}
+
+    assert {'caption_profile', 'capture_time', 'extension', 'directory',
+            'caption', 'caption_model'} <= columns(baseline_conn, 'images')
+    indexes = {row[0] for row in baseline_conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'images'")}
+    assert {f"idx_images_{column}" for column in (
+        'capture_time', 'extension', 'file_size', 'md5', 'modified_time', 'directory')} <= indexes
+
+    # 已有图片的文件名写入全文索引，rowid 与图片ID一致
+    fts = dict(baseline_conn.execute('SELECT rowid, file_name FROM images_fts'))
+    assert fts == dict(baseline_conn.execute('SELECT id, file_name FROM images'))
+
+    directory, caption_profile = baseline_conn.execute(
+        "SELECT directory, caption_profile FROM images WHERE file_path = '/photos/trip/b.PNG'").fetchone()
+    assert directory.replace('\\', '/').endswith('photos/trip')
+    assert caption_profile == 'quality'
+
+
+def test_migrate_is_idempotent(baseline_conn):
+    migrate(baseline_conn)
+    snapshot = baseline_conn.execute('SELECT * FROM images ORDER BY id').fetchall()
+
+    assert migrate(baseline_conn) == SCHEMA_VERSION
+    assert baseline_conn.execute('SELECT * FROM images ORDER BY id').fetchall() == snapshot
+
+
+def test_migrated_ids_autoincrement_past_existing_rows(baseline_conn):
+    migrate(baseline_conn)
+    max_id = baseline_conn.execute('SELECT MAX(id) FROM images').fetchone()[0]
+    baseline_conn.execute("DELETE FROM images WHERE id = ?", (max_id,))
+    cursor = baseline_conn.execute(
+        "INSERT INTO images (file_path, file_name) VALUES ('/d.jpg', 'd.jpg')")
+
+    assert cursor.lastrowid > max_id
+
+
+def test_migrate_fresh_database(workdir):
+    conn = sqlite3.connect(str(workdir / 'fresh.db'))
+    try:
+        assert migrate(conn) == SCHEMA_VERSION
+        assert columns(conn, 'images') >= {'id', 'file_path', 'caption', 'directory'}
+        assert conn.execute('SELECT COUNT(*) FROM legacy_image_ids').fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+def test_migrate_leaves_newer_database_alone(workdir):
+    conn = sqlite3.connect(str(workdir / 'newer.db'))
+    try:
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION + 1}')
+        assert migrate(conn) == SCHEMA_VERSION + 1
+        assert 'images' not in {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    finally:
+        conn.close()
@@ -0,0 +1,49 @@
+from database.query_cache import LRUCache, normalize_query
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    # 读取 a 后 b 成为最久未使用的条目
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_put_existing_key_refreshes_entry():
+    cache = LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.put('a', 10)
+    cache.put('c', 3)
+
+    assert cache.get('a') == 10
+    assert cache.get('b', 'missing') == 'missing'
+
+
+def test_zero_size_disables_cache():
+    cache = LRUCache(max_size=0)
+    cache.put('a', 1)
+
+    assert len(cache) == 0
+    assert cache.get('a') is None
+    assert LRUCache(max_size=-1).max_size == 0
+
+
+def test_clear():
+    cache = LRUCache()
+    cache.put('a', 1)
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.get('a') is None
+
+
+def test_normalize_query():
+    assert normalize_query('  A  Red\tCat\n') == 'a red cat'
+    assert normalize_query('') == ''
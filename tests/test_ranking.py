@@ -0,0 +1,28 @@
+from database.ranking import reciprocal_rank_fusion
+
+
+def test_items_in_both_rankings_come_first():
+    fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['d', 'c', 'b']])
+
+    # b、c 在两个排名中都出现，得分高于只在一个排名中排第一的 a、d；同分时保持首次出现的顺序
+    assert fused == ['b', 'c', 'a', 'd']
+
+
+def test_scores_sum_reciprocal_ranks():
+    fused = reciprocal_rank_fusion([['a', 'b'], ['c', 'a']], k=60)
+
+    # a: 1/61 + 1/62，c: 1/61，b: 1/62
+    assert fused == ['a', 'c', 'b']
+
+
+def test_k_controls_head_advantage():
+    rankings = [['a', 'x', 'b'], ['y', 'z', 'b']]
+
+    # k 越小单个排名的头名优势越大，k 越大出现次数越重要
+    assert reciprocal_rank_fusion(rankings, k=0)[0] == 'a'
+    assert reciprocal_rank_fusion(rankings, k=60)[0] == 'b'
+
+
+def test_empty_rankings():
+    assert reciprocal_rank_fusion([]) == []
+    assert reciprocal_rank_fusion([[], []]) == []
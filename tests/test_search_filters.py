@@ -0,0 +1,94 @@
+import os
+from datetime import date, datetime
+
+import pytest
+
+from database.search_filters import (build_where, capture_timestamp, directory_condition, directory_metadata,
+                                     match_where, normalize_filters)
+
+
+def test_normalize_filters():
+    filters = normalize_filters({
+        'directory': '',
+        'date_from': '2024-01-01',
+        'date_to': date(2024, 1, 31),
+        'extensions': ['JPG', '.Png'],
+        'min_size': '10',
+        'max_size': None,
+    })
+
+    assert filters == {
+        'date_from': datetime(2024, 1, 1),
+        'date_to': datetime(2024, 1, 31, 23, 59, 59, 999999),
+        'extensions': ('.jpg', '.png'),
+        'min_size': 10,
+    }
+    assert normalize_filters(None) == {}
+    with pytest.raises(ValueError):
+        normalize_filters({'color': 'red'})
+
+
+def test_build_where_empty():
+    assert build_where({}) is None
+
+
+def test_build_where_single_condition_is_not_wrapped():
+    assert build_where(normalize_filters({'extensions': ['jpg']})) == {'ext': {'$in': ['.jpg']}}
+
+
+def test_build_where_combines_conditions():
+    filters = normalize_filters({
+        'directory': os.path.join('photos', 'trip'),
+        'date_from': '2024-01-01',
+        'extensions': ['jpg'],
+        'min_size': 10,
+        'max_size': 20,
+    })
+
+    assert build_where(filters) == {'$and': [
+        directory_condition(os.path.join('photos', 'trip')),
+        {'capture_ts': {'$gte': capture_timestamp(datetime(2024, 1, 1))}},
+        {'ext': {'$in': ['.jpg']}},
+        {'file_size': {'$gte': 10}},
+        {'file_size': {'$lte': 20}},
+    ]}
+
+
+def test_build_where_candidate_ids_replace_sqlite_conditions():
+    filters = normalize_filters({'extensions': ['jpg'], 'min_size': 10})
+
+    assert build_where(filters, candidate_ids=[3, 1]) == {'image_id': {'$in': [3, 1]}}
+    assert build_where(filters, candidate_ids=[]) == {'image_id': {'$in': []}}
+
+
+def test_directory_condition_matches_descendants():
+    metadata = directory_metadata(os.path.join('photos', 'trip', 'day1', 'a.jpg'))
+
+    assert match_where(metadata, directory_condition(os.path.join('photos', 'trip')))
+    assert match_where(metadata, directory_condition('photos'))
+    assert not match_where(metadata, directory_condition(os.path.join('photos', 'home')))
+
+
+def test_match_where():
+    metadata = {'image_id': 1, 'ext': '.jpg', 'file_size': 15, 'capture_ts': 100}
+    where = build_where(normalize_filters({'extensions': ['jpg'], 'min_size': 10, 'max_size': 20}))
+
+    assert match_where(metadata, where)
+    assert not match_where({**metadata, 'file_size': 30}, where)
+    assert match_where(metadata, None)
+    assert not match_where(None, where)
+    # 缺少字段时范围条件不成立
+    assert not match_where({'ext': '.jpg'}, {'capture_ts': {'$gte': 0}})
+    assert match_where(metadata, {'$or': [{'ext': '.png'}, {'image_id': {'$in': [1, 2]}}]})
+    with pytest.raises(ValueError):
+        match_where(metadata, {'file_size': {'$regex': '1'}})
+
+
+def test_capture_timestamp_handles_dates_before_1970():
+    assert capture_timestamp(datetime(1970, 1, 2)) == 86400
+    assert capture_timestamp(datetime(1969, 12, 31, 23, 59, 59)) == -1
+    # 日期上限包含当天全天，与元数据中的拍摄时间比较时顺序不变
+    where = build_where(normalize_filters({'date_from': '1950-06-01', 'date_to': date(1950, 6, 1)}))
+    taken = capture_timestamp(datetime(1950, 6, 1, 12, 0))
+    assert match_where({'capture_ts': taken}, where)
+    assert not match_where({'capture_ts': taken + 86400}, where)
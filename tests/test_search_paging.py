@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('chromadb')
+
+from database.query_cache import LRUCache  # noqa: E402
+from database.ranking import reciprocal_rank_fusion  # noqa: E402
+from database.transaction_manager import SearchHit, TransactionManager  # noqa: E402
+from utils.logger import Logger  # noqa: E402
+
+
+class FakeVectorStore:
+    """描述向量按固定顺序返回前 limit 个结果"""
+    embedding_model = 'fake'
+
+    def __init__(self, ranking):
+        self.ranking = ranking
+
+    def count(self):
+        return len(self.ranking)
+
+    def count_image_embeddings(self):
+        return 0
+
+    def embed_documents(self, texts):
+        return [[1.0] for _ in texts]
+
+    def search_images(self, query, limit, query_embedding=None, where=None):
+        ranking = self.ranking[:limit]
+        return {'ids': [[str(image_id) for image_id in ranking]],
+                'distances': [[0.1 * rank for rank in range(len(ranking))]],
+                'metadatas': [[{'image_id': image_id} for image_id in ranking]],
+                'documents': [[f"caption {image_id}" for image_id in ranking]]}
+
+
+class FakeDatabase:
+    """全文检索按固定顺序返回前 limit 个结果"""
+
+    def __init__(self, ranking):
+        self.ranking = ranking
+
+    def search_keywords(self, query, limit, filters=None):
+        return self.ranking[:limit]
+
+    def get_keyword_captions(self, image_ids):
+        return {image_id: f"keyword {image_id}" for image_id in image_ids}
+
+    def get_images_by_ids(self, image_ids):
+        return [{'id': image_id} for image_id in image_ids]
+
+
+@pytest.fixture
+def manager():
+    manager = object.__new__(TransactionManager)
+    manager.logger = Logger()
+    manager._local = threading.local()
+    manager.search_mode = 'hybrid'
+    manager._query_embeddings = LRUCache(16)
+    manager._search_results = LRUCache(16)
+    manager._generation = 0
+    # 两个排名交错，按不同深度融合得到的顺序不同
+    manager.vector_store = FakeVectorStore(list(range(1, 41)))
+    manager.db_manager = FakeDatabase(list(range(40, 0, -1)))
+    return manager
+
+
+def all_pages(manager, page_size, **kwargs):
+    pages, cursor = [], None
+    while True:
+        page = manager.search_page('cat', page_size, cursor, **kwargs)
+        pages.append([image['id'] for image in page['results']])
+        cursor = page['cursor']
+        if cursor is None:
+            return pages
+
+
+def test_pages_slice_one_fused_ranking(manager):
+    pages = all_pages(manager, 7)
+    seen = [image_id for page in pages for image_id in page]
+
+    assert seen == reciprocal_rank_fusion([list(range(1, 41)), list(range(40, 0, -1))])
+    assert len(seen) == len(set(seen)) == 40
+    assert [len(page) for page in pages] == [7, 7, 7, 7, 7, 5]
+
+
+def test_cursor_keeps_ranking_across_writes(manager):
+    first = manager.search_page('cat', 5)
+    # 翻页期间写入新数据：后续页仍按第一页的排名切片
+    manager._generation += 1
+    manager.vector_store.ranking = [99] + manager.vector_store.ranking
+    second = manager.search_page('cat', 5, first['cursor'])
+
+    first_ids = [image['id'] for image in first['results']]
+    second_ids = [image['id'] for image in second['results']]
+    assert not set(first_ids) & set(second_ids)
+    assert 99 not in second_ids
+    # 新的搜索使用新数据
+    assert 99 in [image['id'] for image in manager.search_page('cat', 50)['results']]
+
+
+def test_page_captions_fall_back_to_keyword_index(manager):
+    manager.vector_store.ranking = [1]
+    results = manager.search_page('cat', 2)['results']
+
+    assert {image['id']: image['caption'] for image in results} == {1: 'caption 1', 40: 'keyword 40'}
+    assert {image['id']: image['distance'] for image in results} == {1: 0.0, 40: None}
+
+
+def test_caption_and_image_distances_have_separate_limits():
+    within = TransactionManager._within_distance
+
+    assert within(SearchHit(1, 0.5, None, None, False), 0.6, 0.1)
+    assert not within(SearchHit(1, 0.7, None, None, False), 0.6, None)
+    # CLIP 距离只按图片向量的上限判断，未设置上限时不过滤
+    assert within(SearchHit(1, None, 0.85, None, False), 0.6, None)
+    assert not within(SearchHit(1, None, 0.85, None, False), 0.6, 0.8)
+    # 任一向量在上限内即保留，全文命中总是保留
+    assert within(SearchHit(1, 0.9, 0.7, None, False), 0.6, 0.8)
+    assert within(SearchHit(1, 0.9, None, None, True), 0.6, 0.8)
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('chromadb')
+
+from database.query_cache import LRUCache  # noqa: E402
+from database.transaction_manager import TransactionManager  # noqa: E402
+from utils.logger import Logger  # noqa: E402
+from test_db_manager import image_row  # noqa: E402
+
+
+class FailingVectorStore:
+    """描述向量写入总是失败的向量库"""
+
+    def delete_images(self, image_ids):
+        pass
+
+    def upsert_images(self, items):
+        if items:
+            raise RuntimeError('vector store unavailable')
+        return []
+
+    def upsert_image_embeddings(self, items):
+        return []
+
+    def rename_images(self, items):
+        pass
+
+
+@pytest.fixture
+def manager(db_manager):
+    manager = object.__new__(TransactionManager)
+    manager.logger = Logger()
+    manager._local = threading.local()
+    manager._search_results = LRUCache(16)
+    manager._generation = 0
+    manager.db_manager = db_manager
+    manager.vector_store = FailingVectorStore()
+    return manager
+
+
+def count_images(db_manager):
+    return db_manager.pool.connection().execute('SELECT COUNT(*) FROM images').fetchone()[0]
+
+
+def test_failed_vector_write_rolls_back_sqlite(manager, db_manager):
+    with pytest.raises(RuntimeError):
+        with manager.transaction():
+            manager.add_images([(image_row('a.jpg'), 'a cat', None, None)])
+
+    assert count_images(db_manager) == 0
+    assert db_manager.search_keywords('cat', 10) == []
+    # 回滚后不递增数据版本，事务状态复位
+    assert manager._generation == 0
+    assert not manager._transaction_active
+    assert manager._pending_operations == []
+
+
+def test_generation_bumps_after_commit(manager, db_manager):
+    with manager.transaction():
+        manager.add_images([(image_row('a.jpg'), None, None, None)])
+        assert manager._generation == 0
+
+    assert manager._generation == 1
+    assert count_images(db_manager) == 1
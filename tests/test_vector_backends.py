@@ -0,0 +1,149 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from database.vector_backends import NumpyIndex  # noqa: E402
+
+
+def metadata(image_id, **fields):
+    return {'image_id': image_id, **fields}
+
+
+@pytest.fixture
+def index(workdir):
+    return NumpyIndex(str(workdir / 'vectors'), 'images', {'hnsw:space': 'cosine'})
+
+
+def reopen(index):
+    return NumpyIndex(os.path.dirname(index.matrix_path), index.name, index.metadata)
+
+
+def test_query_returns_nearest_first(index):
+    index.upsert(['1', '2', '3'], [[1, 0, 0], [0, 1, 0], [1, 1, 0]],
+                 [metadata(1), metadata(2), metadata(3)], ['one', 'two', 'three'])
+
+    result = index.query([2, 0, 0], limit=2)
+
+    assert result['ids'] == [['1', '3']]
+    assert result['distances'][0][0] == pytest.approx(0.0, abs=1e-6)
+    assert result['distances'][0][1] == pytest.approx(1 - 2 ** -0.5, abs=1e-6)
+    assert result['metadatas'] == [[metadata(1), metadata(3)]]
+    assert result['documents'] == [['one', 'three']]
+
+
+def test_upsert_overwrites_existing_id(index):
+    index.upsert(['1', '2'], [[1, 0], [0, 1]], [metadata(1), metadata(2)])
+    index.upsert(['1'], [[0, 1]], [metadata(1, ext='.png')], ['new'])
+
+    assert index.count() == 2
+    result = index.query([0, 1], limit=2)
+    assert sorted(result['ids'][0]) == ['1', '2']
+    assert result['distances'][0] == pytest.approx([0.0, 0.0], abs=1e-6)
+    assert index.get_documents(['1', '2']) == {'1': 'new'}
+
+
+def test_delete_and_where_filter(index):
+    index.upsert(['1', '2', '3'], [[1, 0], [1, 0.1], [1, 0.2]],
+                 [metadata(1, ext='.jpg'), metadata(2, ext='.png'), metadata(3, ext='.jpg')])
+    index.delete(['1', 'missing'])
+
+    assert index.count() == 2
+    assert index.existing_ids(['1', '2', '3']) == {'2', '3'}
+    assert index.query([1, 0], limit=5, where={'ext': '.jpg'})['ids'] == [['3']]
+    # image_id 候选列表只检查对应的行，已删除的图片不会返回
+    where = {'$and': [{'image_id': {'$in': [1, 2]}}, {'ext': {'$in': ['.png', '.jpg']}}]}
+    assert index.query([1, 0], limit=5, where=where)['ids'] == [['2']]
+    assert index.query([1, 0], limit=5, where={'image_id': {'$in': []}})['ids'] == [[]]
+
+
+def test_state_survives_reload(index):
+    index.upsert(['1', '2'], [[1, 0], [0, 1]], [metadata(1), metadata(2)], ['one', 'two'])
+    index.delete(['2'])
+    index.update_metadata(['1'], [metadata(1, ext='.gif')])
+
+    reloaded = reopen(index)
+
+    assert reloaded.count() == 1
+    result = reloaded.query([1, 0], limit=5)
+    assert result['ids'] == [['1']]
+    assert result['metadatas'] == [[metadata(1, ext='.gif')]]
+    assert result['documents'] == [['one']]
+
+
+def test_compact_drops_tombstones(index):
+    index.upsert(['1', '2', '3'], [[1, 0], [0, 1], [1, 1]], [metadata(1), metadata(2), metadata(3)])
+    index.upsert(['1'], [[1, 0.5]], [metadata(1)])
+    index.delete(['2'])
+
+    index.compact()
+
+    assert index._size == index.count() == 2
+    with open(index.log_path, encoding='utf-8') as f:
+        assert len(f.readlines()) == 3
+    result = reopen(index).query([1, 0.5], limit=5)
+    assert result['ids'][0][0] == '1'
+    assert sorted(result['ids'][0]) == ['1', '3']
+
+
+def test_automatic_compaction(workdir):
+    index = NumpyIndex(str(workdir / 'vectors'), 'images', {}, compact_ratio=0.25)
+    index.COMPACT_MIN_ROWS = 4
+    index.upsert([str(i) for i in range(4)], np.eye(4).tolist(), [metadata(i) for i in range(4)])
+
+    index.delete(['0', '1'])
+
+    # 墓碑超过比例后自动压缩，只剩存活的行
+    assert index._size == 2
+    assert sorted(index.query([0, 0, 1, 1], limit=5)['ids'][0]) == ['2', '3']
+
+
+def test_rekey(index):
+    index.upsert(['a', 'b'], [[1, 0], [0, 1]], [{'image_id': 'a'}, {'image_id': 'b'}])
+
+    def transform(ids, metadatas):
+        # 旧ID b 没有对应的新ID，丢弃
+        mapping = {'a': 7}
+        return [(str(mapping[image_id]), {'image_id': mapping[image_id]}) if image_id in mapping else None
+                for image_id in ids]
+
+    assert index.rekey(transform) == 1
+    result = reopen(index).query([1, 0], limit=5)
+    assert result['ids'] == [['7']]
+    assert result['metadatas'] == [[{'image_id': 7}]]
+
+
+def test_where_filter_matches_match_where(index):
+    from database.search_filters import match_where
+    metadatas = [metadata(1, ext='.jpg', file_size=100, dir_0='/a'),
+                 metadata(2, ext='.png', file_size=300, dir_0='/a', capture_ts=10),
+                 metadata(3, ext='.jpg', dir_0='/b', capture_ts=20),
+                 metadata(4, ext='.gif', file_size=200)]
+    index.upsert(['1', '2', '3', '4'], [[1, 0]] * 4, metadatas)
+    wheres = [{'ext': '.jpg'},
+              {'ext': {'$in': ['.png', '.gif', '.bmp']}},
+              {'ext': {'$nin': ['.jpg']}},
+              {'dir_0': {'$ne': '/a'}},
+              {'file_size': {'$gte': 150, '$lte': 300}},
+              {'capture_ts': {'$lt': 15}},
+              {'$and': [{'dir_0': '/a'}, {'file_size': {'$gt': 100}}]},
+              {'$or': [{'ext': '.gif'}, {'capture_ts': {'$gte': 20}}]},
+              {'ext': '.webp'}]
+
+    for where in wheres:
+        expected = sorted(str(m['image_id']) for m in metadatas if match_where(m, where))
+        assert sorted(index.query([1, 0], limit=10, where=where)['ids'][0]) == expected, where
+
+
+def test_where_filter_follows_writes(index):
+    index.upsert(['1', '2'], [[1, 0], [0, 1]], [metadata(1, ext='.jpg'), metadata(2, ext='.png')])
+    # 第一次过滤后建立元数据列，之后的写入、改元数据和删除都要反映到列中
+    assert index.query([1, 0], limit=5, where={'ext': '.jpg'})['ids'] == [['1']]
+
+    index.upsert(['3'], [[1, 1]], [metadata(3, ext='.jpg')])
+    index.update_metadata(['1'], [metadata(1, ext='.gif')])
+    index.delete(['2'])
+
+    assert index.query([1, 0], limit=5, where={'ext': '.jpg'})['ids'] == [['3']]
+    assert index.query([1, 0], limit=5, where={'ext': {'$in': ['.gif', '.png']}})['ids'] == [['1']]
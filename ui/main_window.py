@@ -7,11 +7,19 @@ import os
 from ui.menu_bar import create_menu_bar
 from database import db  # 使用统一的数据库接口
 from utils.logger import Logger  # 添加日志支持
+from utils.config_manager import ConfigManager
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.logger = Logger()  # 初始化日志器
+        config = ConfigManager()
+        self.page_size = config.get_search_page_size()
+        self.max_distance = config.get_search_max_distance()
+        self.max_image_distance = config.get_search_max_image_distance()
+        # 当前搜索和下一页游标，滚动到底部时按游标加载下一页
+        self._query = None
+        self._cursor = None
         self.setWindowTitle(" Where's my picture")
         self.setMinimumSize(800, 600)
         
@@ -41,6 +49,7 @@ class MainWindow(QMainWindow):
         self.image_list.setIconSize(QSize(200, 200))
         self.image_list.setSpacing(10)
         self.image_list.itemDoubleClicked.connect(self.open_image)
+        self.image_list.verticalScrollBar().valueChanged.connect(self.on_scroll)
         layout.addWidget(self.image_list)
         
         # 创建菜单栏
@@ -51,61 +60,89 @@ class MainWindow(QMainWindow):
         create_menu_bar(self, menubar)
     
     def search_images(self):
-        """搜索图片并显示结果"""
+        """搜索图片并显示第一页结果"""
         try:
             self.image_list.clear()
+            self._query = None
+            self._cursor = None
             
             keyword = self.search_box.text().strip()
             if not keyword:
                 return
             
             self.logger.info(f"搜索关键词: {keyword}")
-            results = db.search_similar_images(keyword)
-            
-            if not results:
+            self._query = keyword
+            if not self.load_next_page():
                 item = QListWidgetItem("没有找到匹配的图片")
                 self.image_list.addItem(item)
                 return
             
-            for image_info in results:
-                file_path = image_info['file_path']
-                if not os.path.exists(file_path):
-                    self.logger.warning(f"文件不存在: {file_path}")
-                    continue
-                    
-                try:
-                    # 创建缩略图
-                    pixmap = QPixmap(file_path)
-                    if pixmap.isNull():
-                        self.logger.warning(f"无法加载图片: {file_path}")
-                        continue
-                        
-                    # 缩放图片
-                    scaled_pixmap = pixmap.scaled(
-                        200, 200,
-                        Qt.AspectRatioMode.KeepAspectRatio,
-                        Qt.TransformationMode.SmoothTransformation
-                    )
-                    
-                    # 创建列表项
-                    item = QListWidgetItem()
-                    item.setIcon(QIcon(scaled_pixmap))  # 使用QIcon而不是直接使用QPixmap
-                    item.setText(os.path.basename(file_path))
-                    item.setData(Qt.ItemDataRole.UserRole, file_path)
-                    item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                    
-                    self.image_list.addItem(item)
-                    
-                except Exception as e:
-                    self.logger.error(f"处理图片失败 {file_path}: {str(e)}")
-                    continue
-            
             self.logger.info(f"找到 {self.image_list.count()} 个匹配结果")
             
         except Exception as e:
             self.logger.error(f"搜索出错: {str(e)}")
             item = QListWidgetItem(f"搜索出错: {str(e)}")
             self.image_list.addItem(item)
+
+    def on_scroll(self, value):
+        """滚动到底部时加载下一页"""
+        if self._cursor is None or value < self.image_list.verticalScrollBar().maximum():
+            return
+        try:
+            self.load_next_page()
+        except Exception as e:
+            self._cursor = None
+            self.logger.error(f"加载下一页出错: {str(e)}")
+
+    def load_next_page(self) -> int:
+        """按当前游标加载一页结果，返回本页结果数"""
+        page = db.search_page(self._query, self.page_size, self._cursor, max_distance=self.max_distance,
+                              max_image_distance=self.max_image_distance)
+        self._cursor = page['cursor']
+        for image_info in page['results']:
+            self.add_result_item(image_info)
+        return len(page['results'])
+
+    def add_result_item(self, image_info: dict):
+        """为一条搜索结果创建缩略图列表项"""
+        file_path = image_info['file_path']
+        if not os.path.exists(file_path):
+            self.logger.warning(f"文件不存在: {file_path}")
+            return
+            
+        try:
+            # 创建缩略图
+            pixmap = QPixmap(file_path)
+            if pixmap.isNull():
+                self.logger.warning(f"无法加载图片: {file_path}")
+                return
+                
+            # 缩放图片
+            scaled_pixmap = pixmap.scaled(
+                200, 200,
+                Qt.AspectRatioMode.KeepAspectRatio,
+                Qt.TransformationMode.SmoothTransformation
+            )
+            
+            # 创建列表项
+            item = QListWidgetItem()
+            item.setIcon(QIcon(scaled_pixmap))  # 使用QIcon而不是直接使用QPixmap
+            item.setText(os.path.basename(file_path))
+            item.setData(Qt.ItemDataRole.UserRole, file_path)
+            item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
+            
+            # 悬停时显示描述和距离
+            tooltip = [file_path]
+            if image_info.get('caption'):
+                tooltip.append(image_info['caption'])
+            if image_info.get('distance') is not None:
+                tooltip.append(f"距离: {image_info['distance']:.3f}")
+            item.setToolTip('\n'.join(tooltip))
+            
+            self.image_list.addItem(item)
+            
+        except Exception as e:
+            self.logger.error(f"处理图片失败 {file_path}: {str(e)}")
     
     def open_image(self, item):
         """打开选中的图片"""
@@ -129,5 +129,5 @@ def test_add_data_to_chromadb():
     transaction_manager = TransactionManager()
     #利用transaction_manager.vector_store.add_image方法，向集合中插入101条记录  
     for i in range(101):
-        transaction_manager.vector_store.add_image(f"test11_{i}.jpg", f"test11_{i} description")
+        transaction_manager.vector_store.add_image(i, f"test11_{i}.jpg", f"test11_{i} description")
 
@@ -1,55 +1,428 @@
 import requests
+import threading
 from PIL import Image
-from transformers import BlipProcessor, BlipForConditionalGeneration
+from utils.caption_backends import create_caption_backend
+from utils.config_manager import ConfigManager
+from utils.logger import Logger
 # Salesforce/blip-image-captioning-base
 # Salesforce/blip-image-captioning-large
 
+# EXIF 方向值对应的旋转/翻转操作，与 ImageOps.exif_transpose 一致
+EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90
+}
+
+
+# 可以直接整数倍缩小的模式
+REDUCIBLE_MODES = ('L', 'RGB', 'RGBA', 'LA', 'RGBa', 'La', 'I', 'F')
+
+# 分条解码时每条的像素数上限
+DECODE_BAND_PIXELS = 1 << 22
+
+# 超过像素预算又无法分条解码的图片逐张完整解码；启用描述进程池后换成与工作进程共享的进程锁，
+# 所有进程同时只有一张大图的原始像素占用内存
+_large_decode_lock = threading.Lock()
+_shared_decode_lock = None
+_shared_decode_lock_guard = threading.Lock()
+
+
+def share_large_decode_lock(context):
+    """换成由 multiprocessing 上下文创建的进程锁并返回，传给工作进程后整个进程池共用一个像素预算
+
+    Args:
+        context: multiprocessing 上下文，与进程池使用的启动方式一致
+    """
+    global _large_decode_lock, _shared_decode_lock
+    with _shared_decode_lock_guard:
+        if _shared_decode_lock is None:
+            _shared_decode_lock = context.Lock()
+            _large_decode_lock = _shared_decode_lock
+        return _shared_decode_lock
+
+
+def use_large_decode_lock(lock):
+    """工作进程使用父进程传入的进程锁"""
+    global _large_decode_lock
+    _large_decode_lock = lock
+
+
+def _reduce_factor(image, input_size) -> int:
+    """缩小到不小于目标尺寸的最大整数倍数，不能缩小时为 1"""
+    factor = min(image.width // input_size[0], image.height // input_size[1])
+    return factor if factor >= 2 and image.mode in REDUCIBLE_MODES else 1
+
+
+def _reduce_to(image, input_size):
+    """整数倍缩小到接近目标尺寸，后续转换和插值只处理小图"""
+    factor = _reduce_factor(image, input_size)
+    if factor > 1:
+        image = image.reduce(factor)
+    return image
+
+
+def _raw_layout(image):
+    """未压缩且按行连续存放的像素数据的 (起始偏移, 行字节数, 存放方向, rawmode)，其他格式返回 None"""
+    if len(image.tile) != 1:
+        return None
+    codec, extents, offset, args = image.tile[0]
+    if codec != 'raw' or tuple(extents) != (0, 0, image.width, image.height):
+        return None
+    rawmode, stride, orientation = args if isinstance(args, tuple) else (args, 0, 1)
+    if not stride:
+        try:
+            stride = len(Image.new(image.mode, (image.width, 1)).tobytes('raw', rawmode))
+        except Exception:
+            return None
+    return offset, stride, orientation, rawmode
+
+
+def _decode_in_bands(image, factor, layout):
+    """按横条从文件读取未压缩像素，每条读出后立即缩小，内存只有一条原始像素和缩小后的图片
+
+    每条的行数是 factor 的整数倍，缩小结果与整图缩小一致。
+    """
+    offset, stride, orientation, rawmode = layout
+    width, height = image.size
+    rows = max(factor, DECODE_BAND_PIXELS // width // factor * factor)
+    result = Image.new(image.mode, (-(-width // factor), -(-height // factor)))
+    for top in range(0, height, rows):
+        bottom = min(top + rows, height)
+        # 自下而上存放（BMP）时，该条在文件中从第 height - bottom 行开始
+        start = top if orientation > 0 else height - bottom
+        image.fp.seek(offset + start * stride)
+        data = image.fp.read((bottom - top) * stride)
+        band = Image.frombytes(image.mode, (width, bottom - top), data, 'raw', rawmode, stride, orientation)
+        result.paste(band.reduce(factor), (0, top // factor))
+    return result
+
+
+def _decode_over_budget(image, input_size):
+    """超过像素预算的非 JPEG 图片：未压缩格式分条解码，其他格式持锁逐张完整解码后缩小"""
+    factor = _reduce_factor(image, input_size)
+    layout = _raw_layout(image) if factor > 1 else None
+    if layout is not None:
+        return _decode_in_bands(image, factor, layout)
+    with _large_decode_lock:
+        image.load()
+        return _reduce_to(image, input_size)
+
+
+def decode_image(image_path, input_size, max_pixels=0, resize=True):
+    """以接近模型输入尺寸的分辨率解码图片并按 EXIF 方向摆正
+
+    JPEG 通过 draft 模式在解码时直接按 1/2~1/8 缩小，内存和耗时与原图分辨率基本无关；
+    其他格式解码后立即整数倍缩小并释放原图。超过像素预算时，BMP、PPM、未压缩 TIFF 等
+    按横条读取并逐条缩小，内存与原图分辨率无关；PNG 等压缩格式无法分条解码，
+    逐张排队完整解码，多个大图不会同时占用内存。超过 PIL 解压炸弹上限的图片由 PIL 拒绝打开。
+
+    Args:
+        image_path: 图片文件路径
+        input_size: 模型输入尺寸 (宽, 高)
+        max_pixels: 非 JPEG 图片可以并发完整解码的最大像素数，0 表示不限制
+        resize: 是否缩放到 input_size；为 False 时只保证宽高都不小于 input_size，
+            由模型的处理器自行缩放裁剪
+
+    Returns:
+        Image: RGB 图片
+    """
+    with Image.open(image_path) as image:
+        orientation = image.getexif().get(0x0112)
+        if image.format == 'JPEG':
+            # draft 选择不小于目标尺寸的最大缩小比例
+            image.draft('RGB', input_size)
+            image.load()
+            image = _reduce_to(image, input_size)
+        elif max_pixels and image.width * image.height > max_pixels:
+            image = _decode_over_budget(image, input_size)
+        else:
+            image.load()
+            image = _reduce_to(image, input_size)
+        image = image.convert('RGB')
+
+    if orientation in EXIF_TRANSPOSE:
+        image = image.transpose(EXIF_TRANSPOSE[orientation])
+    if resize and image.size != input_size:
+        # 与 BLIP 处理器一致使用双三次插值，处理器内部的缩放随之变为空操作
+        image = image.resize(input_size, Image.BICUBIC, reducing_gap=3.0)
+    return image
+
+
 class ImageToText:
-    def __init__(self, model_name="Salesforce/blip-image-captioning-base"):
+    # 调整参数以适应 base 模型
+    GENERATE_KWARGS = {
+        'max_length': 100,          # 减小最大长度，base模型不需要太长
+        'num_beams': 5,             # 减小束搜索数量，提高速度
+        'length_penalty': 1.0,      # 调整长度惩罚
+        'temperature': 0.7,         # 调整温度
+        'repetition_penalty': 1.2,  # 调整重复惩罚
+        'do_sample': True,          # 保持采样以增加多样性
+        'top_k': 50,                # 保持词表限制
+        'top_p': 0.9                # 保持核采样参数
+    }
+
+    # 命名的生成参数档位：fast 用于新图片快速入库，quality 用于空闲时升级描述
+    PROFILE_FAST = 'fast'
+    PROFILE_QUALITY = 'quality'
+    GENERATION_PROFILES = {
+        PROFILE_FAST: {
+            'max_length': 30,           # 短描述足以支撑检索
+            'num_beams': 1,             # 贪心解码
+            'repetition_penalty': 1.2,
+            'do_sample': False
+        },
+        PROFILE_QUALITY: GENERATE_KWARGS
+    }
+
+    # 处理器未加载时使用的默认输入尺寸 (宽, 高)
+    DEFAULT_INPUT_SIZE = (384, 384)
+
+    DEFAULT_MODEL = "Salesforce/blip-image-captioning-base"
+
+    # 按模型名和后端共享的实例，避免每个 ImageScanner 各自加载一份模型
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, model_name=DEFAULT_MODEL, backend='torch'):
+        """
+        Args:
+            model_name: 描述模型名称
+            backend: 推理后端，torch / int8 / onnx，加载失败时回退到 torch
+        """
         self.model_name = model_name
+        self.backend_name = backend
+        # 超过该像素数的非 JPEG 图片分条或逐张解码，0 表示不限制
+        self.max_decode_pixels = ConfigManager().get_max_decode_pixels()
+        self.backend = None
         self.processor = None
         self.model = None
-    
+        # 最近一次加载失败的异常，加载成功后清空
+        self.load_error = None
+        self._load_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._ready_callbacks = []
+        self._error_callbacks = []
+        self._warmup_thread = None
+
+    @classmethod
+    def get_instance(cls, model_name=DEFAULT_MODEL, backend=None):
+        """获取共享实例
+
+        Args:
+            model_name: 描述模型名称
+            backend: 推理后端，为空时读取配置
+        """
+        if backend is None:
+            backend = ConfigManager().get_caption_backend()
+        key = (model_name, backend)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(model_name, backend)
+            return cls._instances[key]
+
+    @property
+    def model_id(self) -> str:
+        """模型标识，模型或后端不同生成的描述也不同，用于区分缓存"""
+        return f"{self.model_name}@{self.backend_name}"
+
+    def _load(self):
+        """在加载锁内加载后端"""
+        with self._load_lock:
+            if self.processor is None or self.model is None:
+                self.backend = create_caption_backend(self.backend_name, self.model_name)
+                self.processor = self.backend.processor
+                self.model = self.backend.model
+
     def load_model(self):
         """
         Load the BLIP model and processor
         """
-        if self.processor is None or self.model is None:
-            self.processor = BlipProcessor.from_pretrained(self.model_name)
-            self.model = BlipForConditionalGeneration.from_pretrained(self.model_name)
-    
-    def caption_image(self, image_path, conditional_text=None):
+        try:
+            self._load()
+        except Exception as e:
+            self._mark_failed(e)
+            raise
+        self._mark_ready()
+
+    @property
+    def is_ready(self) -> bool:
+        """模型是否已加载可用"""
+        return self._ready.is_set()
+
+    @property
+    def is_loading(self) -> bool:
+        """后台预热是否正在进行"""
+        return (not self.is_ready and self._warmup_thread is not None
+                and self._warmup_thread.is_alive())
+
+    def _mark_ready(self):
+        """标记模型可用并执行等待就绪的回调"""
+        with self._state_lock:
+            if self._ready.is_set():
+                return
+            self.load_error = None
+            self._ready.set()
+            callbacks, self._ready_callbacks = self._ready_callbacks, []
+            self._error_callbacks = []
+        for callback in callbacks:
+            callback()
+
+    def _mark_failed(self, error):
+        """记录加载失败，清空等待就绪的回调并通知失败回调"""
+        with self._state_lock:
+            if self._ready.is_set():
+                return
+            self.load_error = error
+            self._ready_callbacks = []
+            callbacks, self._error_callbacks = self._error_callbacks, []
+        for callback in callbacks:
+            callback(error)
+
+    def _warm_up(self):
+        """加载模型并做一次空白图推理，让首个真实请求不再承担初始化开销"""
+        try:
+            self._load()
+            self.caption_loaded_images([Image.new('RGB', self.get_input_size())], profile=self.PROFILE_FAST)
+            Logger().info(f"[ImageToText._warm_up] 模型预热完成: {self.model_name}")
+            self._mark_ready()
+        except Exception as e:
+            # 未就绪时下次启动预热会重新加载
+            Logger().error(f"[ImageToText._warm_up] 模型预热失败: {str(e)}")
+            self._mark_failed(e)
+
+    def start_warmup(self, on_ready=None, on_error=None):
+        """启动后台预热线程，重复调用只会启动一次
+
+        Args:
+            on_ready: 模型就绪后调用的回调（可选），已就绪时立即在当前线程调用
+            on_error: 本次预热失败时以异常为参数调用的回调（可选）；
+                失败后尚未执行的 on_ready 回调全部丢弃，需要时重新启动预热
+        """
+        with self._state_lock:
+            if not self._ready.is_set():
+                if on_ready is not None:
+                    self._ready_callbacks.append(on_ready)
+                if on_error is not None:
+                    self._error_callbacks.append(on_error)
+                if self._warmup_thread is None or not self._warmup_thread.is_alive():
+                    self._warmup_thread = threading.Thread(
+                        target=self._warm_up, name='caption_model_warmup', daemon=True)
+                    self._warmup_thread.start()
+                return
+        if on_ready is not None:
+            on_ready()
+
+    def wait_until_ready(self, timeout=None) -> bool:
+        """等待模型就绪，必要时启动后台预热
+
+        预热失败时立即返回，失败原因见 load_error。
+
+        Args:
+            timeout: 最长等待秒数，None 表示等到预热结束
+
+        Returns:
+            bool: 模型是否已就绪；超时或预热失败时为 False
+        """
+        if self.is_ready:
+            return True
+        self.start_warmup()
+        with self._state_lock:
+            warmup_thread = self._warmup_thread
+        if warmup_thread is not None:
+            warmup_thread.join(timeout)
+        return self.is_ready
+
+    def caption_image(self, image_path, conditional_text=None, profile=PROFILE_QUALITY):
         """生成图片描述
-        
+
         Args:
             image_path: 图片文件路径
             conditional_text: 条件文本（可选）
-            
+            profile: 生成参数档位，见 GENERATION_PROFILES
+
         Returns:
             str: 生成的图片描述
         """
+        caption = self.caption_images([image_path], conditional_text, profile)[0]
+        if caption is None:
+            raise RuntimeError(f"无法读取图片: {image_path}")
+        return caption
+
+    def caption_images(self, image_paths, conditional_text=None, profile=PROFILE_QUALITY):
+        """批量生成图片描述，整批图片只做一次前向推理
+
+        Args:
+            image_paths: 图片文件路径列表
+            conditional_text: 条件文本（可选），对整批图片生效
+            profile: 生成参数档位，见 GENERATION_PROFILES
+
+        Returns:
+            list: 与 image_paths 一一对应的描述，无法读取的图片对应 None
+        """
+        images = []
+        for image_path in image_paths:
+            try:
+                images.append(self.load_image(image_path))
+            except Exception:
+                # 单张图片损坏不影响整批
+                images.append(None)
+        return self.caption_loaded_images(images, conditional_text, profile)
+
+    def get_input_size(self):
+        """模型输入尺寸 (宽, 高)"""
+        if self.processor is not None:
+            size = getattr(self.processor.image_processor, 'size', None)
+            if isinstance(size, dict) and 'width' in size and 'height' in size:
+                return size['width'], size['height']
+        return self.DEFAULT_INPUT_SIZE
+
+    def load_image(self, image_path):
+        """解码图片，按 EXIF 方向摆正并缩小到模型输入尺寸
+
+        可在预取线程中调用，与模型推理并行执行。
+        """
+        return decode_image(image_path, self.get_input_size(), self.max_decode_pixels)
+
+    def caption_loaded_images(self, images, conditional_text=None, profile=PROFILE_QUALITY):
+        """对已解码的图片批量生成描述
+
+        Args:
+            images: PIL 图片列表，解码失败的位置为 None
+            conditional_text: 条件文本（可选），对整批图片生效
+            profile: 生成参数档位，见 GENERATION_PROFILES
+
+        Returns:
+            list: 与 images 一一对应的描述，None 图片对应 None
+        """
         if self.processor is None or self.model is None:
-            raise RuntimeError("Model not loaded. Please call load_model() first.")
-        
-        raw_image = Image.open(image_path).convert('RGB')
-        inputs = self.processor(raw_image, conditional_text, return_tensors="pt")
-        
-        # 调整参数以适应 base 模型
-        out = self.model.generate(
-            **inputs,
-            max_length=100,          # 减小最大长度，base模型不需要太长
-            num_beams=5,             # 减小束搜索数量，提高速度
-            length_penalty=1.0,      # 调整长度惩罚
-            temperature=0.7,         # 调整温度
-            repetition_penalty=1.2,  # 调整重复惩罚
-            do_sample=True,          # 保持采样以增加多样性
-            top_k=50,               # 保持词表限制
-            top_p=0.9               # 保持核采样参数
-        )
-        
-        return self.processor.decode(out[0], skip_special_tokens=True)
+            # 首次使用时再加载模型
+            self.load_model()
+
+        captions = [None] * len(images)
+        positions = [i for i, image in enumerate(images) if image is not None]
+        if not positions:
+            return captions
+
+        raw_images = [images[i] for i in positions]
+        text = None
+        if conditional_text is not None:
+            text = [conditional_text] * len(raw_images)
+        inputs = self.processor(raw_images, text, return_tensors="pt", padding=True)
+        out = self.backend.generate(inputs, **self.GENERATION_PROFILES[profile])
+
+        decoded = self.processor.batch_decode(out, skip_special_tokens=True)
+        for position, caption in zip(positions, decoded):
+            captions[position] = caption
+        return captions
 
 # Example usage:
 # captioner = ImageToText()
 # caption = captioner.caption_image("path/to/image.jpg")
 # caption_with_prompt = captioner.caption_image("path/to/image.jpg", "A photo of:")
+# captions = captioner.caption_images(["a.jpg", "b.jpg"])
@@ -0,0 +1,68 @@
+import psutil
+from utils.logger import Logger
+
+
+class AdaptiveBatchSizer:
+    """根据实测延迟和内存自动调整描述生成的批大小
+
+    每批结束后调用 record() 上报耗时和内存变化：
+    - 单张耗时下降时继续加倍批大小，变差时回退到上一个较优值
+    - 内存增长超过预算或系统可用内存不足时立即减半
+    """
+
+    def __init__(self, initial_size: int = 4, min_size: int = 1, max_size: int = 32,
+                 memory_budget_mb: float = 1024, min_available_mb: float = 1024):
+        self.logger = Logger()
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.batch_size = min(max(initial_size, self.min_size), self.max_size)
+        self.memory_budget_mb = memory_budget_mb
+        self.min_available_mb = min_available_mb
+        self._best_per_item = None
+        self._best_size = self.batch_size
+        self._process = psutil.Process()
+
+    def current_memory_mb(self) -> float:
+        """当前进程内存占用（MB）"""
+        return self._process.memory_info().rss / 1024 / 1024
+
+    def shrink(self) -> int:
+        """整批失败（如内存不足）时将批大小减半"""
+        self.batch_size = max(self.min_size, self.batch_size // 2)
+        self._best_size = min(self._best_size, self.batch_size)
+        return self.batch_size
+
+    def record(self, items: int, elapsed: float, memory_delta_mb: float) -> int:
+        """记录一批的处理结果并返回下一批的大小
+
+        Args:
+            items: 本批实际处理的图片数
+            elapsed: 本批耗时（秒）
+            memory_delta_mb: 本批处理前后进程内存变化（MB）
+
+        Returns:
+            int: 下一批的批大小
+        """
+        if items <= 0:
+            return self.batch_size
+
+        available_mb = psutil.virtual_memory().available / 1024 / 1024
+        if memory_delta_mb > self.memory_budget_mb or available_mb < self.min_available_mb:
+            self.shrink()
+            self.logger.warning(f"[AdaptiveBatchSizer.record] 内存紧张(增加 {memory_delta_mb:.2f} MB, "
+                                f"可用 {available_mb:.2f} MB)，批大小降为 {self.batch_size}")
+            return self.batch_size
+
+        per_item = elapsed / items
+        if self._best_per_item is None or per_item < self._best_per_item:
+            # 吞吐提升，继续尝试更大的批
+            self._best_per_item = per_item
+            self._best_size = items
+            self.batch_size = min(self.max_size, items * 2)
+        else:
+            # 吞吐没有提升，回到最优批大小
+            self.batch_size = self._best_size
+
+        self.logger.info(f"[AdaptiveBatchSizer.record] 本批 {items} 张, 单张耗时 {per_item:.3f} 秒, "
+                         f"下一批大小 {self.batch_size}")
+        return self.batch_size
@@ -0,0 +1,171 @@
+import os
+import torch
+from transformers import BlipProcessor, BlipForConditionalGeneration
+from utils.logger import Logger
+
+# 导出的 ONNX 图缓存目录
+ONNX_CACHE_DIR = os.path.join('models', 'onnx')
+
+
+class TorchCaptionBackend:
+    """默认后端：fp32 PyTorch 模型"""
+
+    name = 'torch'
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.processor = None
+        self.model = None
+
+    def load(self):
+        """加载处理器和模型"""
+        self.processor = BlipProcessor.from_pretrained(self.model_name)
+        self.model = BlipForConditionalGeneration.from_pretrained(self.model_name)
+        self.model.eval()
+
+    def generate(self, inputs, **generate_kwargs):
+        """根据处理器输出生成描述 token"""
+        with torch.inference_mode():
+            return self.model.generate(**inputs, **generate_kwargs)
+
+
+class QuantizedCaptionBackend(TorchCaptionBackend):
+    """int8 动态量化后端：线性层权重量化为 int8，激活在运行时量化"""
+
+    name = 'int8'
+
+    def load(self):
+        super().load()
+        self.model = torch.quantization.quantize_dynamic(
+            self.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+
+class _VisionEncoder(torch.nn.Module):
+    """仅包含视觉编码器的导出包装"""
+
+    def __init__(self, vision_model):
+        super().__init__()
+        self.vision_model = vision_model
+
+    def forward(self, pixel_values):
+        return self.vision_model(pixel_values=pixel_values)[0]
+
+
+class OnnxCaptionBackend(QuantizedCaptionBackend):
+    """ONNX Runtime 后端
+
+    视觉编码器导出为 ONNX 图并做 int8 动态量化后由 ONNX Runtime 执行；
+    文本解码器需要束搜索/采样，继续使用 int8 量化的 PyTorch 模块，
+    并直接接收 ONNX Runtime 输出的图像特征。
+    """
+
+    name = 'onnx'
+
+    def __init__(self, model_name: str, cache_dir: str = ONNX_CACHE_DIR):
+        super().__init__(model_name)
+        self.cache_dir = cache_dir
+        self.session = None
+
+    def _encoder_path(self) -> str:
+        return os.path.join(self.cache_dir, self.model_name.replace('/', '__') + '_vision_int8.onnx')
+
+    def _export_encoder(self, path: str):
+        """导出并量化视觉编码器"""
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fp32_path = path.replace('_int8.onnx', '.onnx')
+        size = self.processor.image_processor.size
+        dummy = torch.zeros(1, 3, size['height'], size['width'])
+        # 导出时需要 fp32 视觉编码器，因此在量化前调用
+        torch.onnx.export(
+            _VisionEncoder(self.model.vision_model), dummy, fp32_path,
+            input_names=['pixel_values'], output_names=['image_embeds'],
+            dynamic_axes={'pixel_values': {0: 'batch'}, 'image_embeds': {0: 'batch'}},
+            opset_version=14
+        )
+        quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+        Logger().info(f"[OnnxCaptionBackend._export_encoder] 已导出视觉编码器: {path}")
+
+    def load(self):
+        import onnxruntime as ort
+
+        TorchCaptionBackend.load(self)
+        path = self._encoder_path()
+        if not os.path.exists(path):
+            self._export_encoder(path)
+
+        options = ort.SessionOptions()
+        # 与 torch 线程数保持一致，多进程模式下的线程固定同样生效
+        options.intra_op_num_threads = torch.get_num_threads()
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+        # 视觉编码器已由 ONNX Runtime 接管，只量化文本解码器
+        self.model.text_decoder = torch.quantization.quantize_dynamic(
+            self.model.text_decoder, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+    def generate(self, inputs, **generate_kwargs):
+        pixel_values = inputs['pixel_values']
+        image_embeds = torch.from_numpy(
+            self.session.run(['image_embeds'], {'pixel_values': pixel_values.numpy()})[0]
+        )
+        batch_size = image_embeds.shape[0]
+        image_attention_mask = torch.ones(image_embeds.shape[:-1], dtype=torch.long)
+
+        # 与 BlipForConditionalGeneration.generate 相同的解码器输入构造
+        text_config = self.model.config.text_config
+        input_ids = inputs.get('input_ids')
+        if input_ids is None:
+            input_ids = torch.LongTensor(
+                [[self.model.decoder_input_ids, text_config.eos_token_id]]
+            ).repeat(batch_size, 1)
+        input_ids = input_ids.clone()
+        input_ids[:, 0] = text_config.bos_token_id
+        attention_mask = inputs.get('attention_mask')
+        if attention_mask is not None:
+            attention_mask = attention_mask[:, :-1]
+
+        with torch.inference_mode():
+            return self.model.text_decoder.generate(
+                input_ids=input_ids[:, :-1],
+                eos_token_id=text_config.sep_token_id,
+                pad_token_id=text_config.pad_token_id,
+                attention_mask=attention_mask,
+                encoder_hidden_states=image_embeds,
+                encoder_attention_mask=image_attention_mask,
+                **generate_kwargs
+            )
+
+
+CAPTION_BACKENDS = {
+    TorchCaptionBackend.name: TorchCaptionBackend,
+    QuantizedCaptionBackend.name: QuantizedCaptionBackend,
+    OnnxCaptionBackend.name: OnnxCaptionBackend,
+}
+
+
+def create_caption_backend(name: str, model_name: str) -> TorchCaptionBackend:
+    """创建并加载描述后端，失败时回退到 fp32 PyTorch 后端"""
+    logger = Logger()
+    backend_cls = CAPTION_BACKENDS.get(name)
+    if backend_cls is None:
+        logger.warning(f"[create_caption_backend] 未知的描述后端: {name}，使用 {TorchCaptionBackend.name}")
+        backend_cls = TorchCaptionBackend
+
+    backend = backend_cls(model_name)
+    try:
+        backend.load()
+        logger.info(f"[create_caption_backend] 描述后端已加载: {backend.name}")
+        return backend
+    except Exception as e:
+        if backend_cls is TorchCaptionBackend:
+            raise
+        logger.warning(f"[create_caption_backend] 描述后端 {backend.name} 加载失败，"
+                       f"回退到 {TorchCaptionBackend.name}: {str(e)}")
+
+    backend = TorchCaptionBackend(model_name)
+    backend.load()
+    return backend
@@ -0,0 +1,123 @@
+"""描述后端一致性检查
+
+对同一批图片分别用参考后端（fp32 PyTorch）和候选后端生成描述，
+比较描述文本的一致程度，并用应用配置的描述向量模型比较检索结果的重合度。
+
+用法:
+    python -m utils.caption_parity --backend int8 D:/pictures --query "a cat" --query "beach"
+"""
+import os
+import argparse
+import numpy as np
+from database.embedder import TextEmbedder
+from utils.ImageToText import ImageToText
+from utils.config_manager import ConfigManager
+from utils.logger import Logger
+
+
+def _token_overlap(a: str, b: str) -> float:
+    """两段描述的词集合 Jaccard 相似度"""
+    tokens_a, tokens_b = set(a.lower().split()), set(b.lower().split())
+    if not tokens_a and not tokens_b:
+        return 1.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+def _top_k(query_vector, vectors, k: int):
+    # 与向量库一致按余弦相似度排序，配置的向量模型不一定输出单位向量
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+    scores = (vectors @ query_vector) / np.where(norms == 0, 1.0, norms)
+    k = min(k, len(scores))
+    return set(np.argsort(-scores)[:k].tolist())
+
+
+def run_parity_check(image_paths, backend: str, queries, reference: str = 'torch',
+                     k: int = 10, profile: str = ImageToText.PROFILE_QUALITY) -> dict:
+    """比较候选后端与参考后端的描述和检索结果
+
+    生成参数中的采样会让同一后端两次运行的描述也不同，
+    因此检查时关闭采样，只比较后端本身带来的差异。
+
+    Args:
+        image_paths: 参与比较的图片路径
+        backend: 候选后端名称
+        queries: 检索比较用的查询文本
+        reference: 参考后端名称
+        k: 检索比较的 top-k
+        profile: 生成参数档位
+
+    Returns:
+        dict: exact_match 描述完全一致比例，token_overlap 平均词重合度，
+            recall_at_k 候选后端检索结果对参考结果的平均召回率，embedding_model 比较所用的向量模型
+    """
+    logger = Logger()
+    profiles = dict(ImageToText.GENERATION_PROFILES)
+    profiles[profile] = dict(profiles[profile], do_sample=False)
+
+    captions = {}
+    for name in (reference, backend):
+        captioner = ImageToText(ImageToText.DEFAULT_MODEL, name)
+        captioner.GENERATION_PROFILES = profiles
+        captioner.load_model()
+        if captioner.backend.name != name:
+            raise RuntimeError(f"后端 {name} 加载失败，已回退到 {captioner.backend.name}")
+        captions[name] = captioner.caption_images(image_paths, profile=profile)
+        logger.info(f"[run_parity_check] 后端 {name} 已完成 {len(image_paths)} 张图片")
+
+    pairs = [(a, b) for a, b in zip(captions[reference], captions[backend])
+             if a is not None and b is not None]
+    if not pairs:
+        raise RuntimeError("没有可比较的图片")
+
+    exact_match = sum(1 for a, b in pairs if a == b) / len(pairs)
+    token_overlap = sum(_token_overlap(a, b) for a, b in pairs) / len(pairs)
+
+    # 用向量库写入和查询所用的同一个向量模型分别为两组描述建索引，比较每个查询的 top-k
+    config_manager = ConfigManager()
+    embedder = TextEmbedder(config_manager.get_embedding_model(), config_manager.get_embedding_batch_size())
+    reference_vectors = np.asarray(embedder.embed([a for a, _ in pairs]), dtype=np.float32)
+    candidate_vectors = np.asarray(embedder.embed([b for _, b in pairs]), dtype=np.float32)
+    recalls = []
+    for query in queries:
+        query_vector = np.asarray(embedder.embed([query])[0], dtype=np.float32)
+        expected = _top_k(query_vector, reference_vectors, k)
+        actual = _top_k(query_vector, candidate_vectors, k)
+        recalls.append(len(expected & actual) / len(expected))
+
+    result = {
+        'images': len(pairs),
+        'exact_match': exact_match,
+        'token_overlap': token_overlap,
+        'recall_at_k': sum(recalls) / len(recalls) if recalls else None,
+        'k': k,
+        'embedding_model': embedder.model_name
+    }
+    logger.info(f"[run_parity_check] {backend} 对比 {reference}: {result}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较描述后端与 fp32 模型的一致性")
+    parser.add_argument('directory', help="图片目录")
+    parser.add_argument('--backend', required=True, help="候选后端：int8 / onnx")
+    parser.add_argument('--query', action='append', default=[], help="检索比较用的查询，可重复")
+    parser.add_argument('--limit', type=int, default=200, help="最多比较的图片数")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--profile', default=ImageToText.PROFILE_QUALITY, help="生成参数档位：fast / quality")
+    args = parser.parse_args()
+
+    supported_formats = ConfigManager().get_supported_formats()
+    image_paths = []
+    for root, _, files in os.walk(args.directory):
+        for file in files:
+            if any(file.lower().endswith(fmt) for fmt in supported_formats):
+                image_paths.append(os.path.join(root, file))
+    image_paths = image_paths[:args.limit]
+
+    result = run_parity_check(image_paths, args.backend, args.query, k=args.k, profile=args.profile)
+    for key, value in result.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from utils.logger import Logger
+
+# 子进程内的描述模型，每个工作进程只加载一次
+_worker_captioner = None
+
+
+def _init_worker(model_name: str, backend: str, num_threads: int, decode_lock):
+    """工作进程初始化：固定 torch 线程数、共享大图解码锁并加载模型"""
+    global _worker_captioner
+    import torch
+    from utils.ImageToText import ImageToText, use_large_decode_lock
+
+    use_large_decode_lock(decode_lock)
+
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # 已有并行任务运行时不允许再设置，忽略即可
+        pass
+
+    _worker_captioner = ImageToText(model_name, backend)
+    _worker_captioner.load_model()
+
+
+def _caption_chunk(image_paths, profile):
+    """在工作进程中为一组图片生成描述"""
+    return _worker_captioner.caption_images(image_paths, profile=profile)
+
+
+class CaptionWorkerPool:
+    """多进程描述生成池
+
+    每个工作进程加载一份 BLIP 模型并使用固定的 torch 线程数，
+    父进程负责分发文件并按原顺序收集描述，数据库写入仍在父进程中完成。
+    同一进程内通过 get_instance 共享，多个扫描器不会各自启动一组工作进程。
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, model_name: str, num_workers: int, threads_per_worker: int = 0,
+                 backend: str = 'torch'):
+        """
+        Args:
+            model_name: 描述模型名称
+            num_workers: 工作进程数
+            threads_per_worker: 每个进程的 torch 线程数，0 表示按 CPU 核数平均分配
+            backend: 推理后端，torch / int8 / onnx
+        """
+        self.logger = Logger()
+        self.model_name = model_name
+        self.backend = backend
+        self.num_workers = max(1, num_workers)
+        if threads_per_worker <= 0:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // self.num_workers)
+        self.threads_per_worker = threads_per_worker
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls, model_name: str, num_workers: int, threads_per_worker: int = 0,
+                     backend: str = 'torch') -> 'CaptionWorkerPool':
+        """获取按模型名和后端共享的进程池，进程数和线程数以首次创建时为准"""
+        with cls._instances_lock:
+            key = (model_name, backend)
+            if key not in cls._instances:
+                cls._instances[key] = cls(model_name, num_workers, threads_per_worker, backend)
+            return cls._instances[key]
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                from utils.ImageToText import share_large_decode_lock
+                # 使用 spawn 避免 fork 继承 torch 的线程状态导致死锁
+                context = multiprocessing.get_context('spawn')
+                # 超过像素预算的大图在父进程和所有工作进程间逐张解码
+                decode_lock = share_large_decode_lock(context)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self.model_name, self.backend, self.threads_per_worker, decode_lock)
+                )
+                atexit.register(self.shutdown)
+                self.logger.info(f"[CaptionWorkerPool._get_executor] 启动 {self.num_workers} 个描述进程, "
+                                 f"每个进程 {self.threads_per_worker} 个线程")
+            return self._executor
+
+    def caption_images(self, image_paths, profile: str = 'quality'):
+        """将图片分发到各工作进程生成描述
+
+        Args:
+            image_paths: 图片路径列表
+            profile: 生成参数档位
+
+        Returns:
+            list: 与 image_paths 一一对应的描述，无法读取的图片对应 None
+        """
+        if not image_paths:
+            return []
+        chunk_size = -(-len(image_paths) // self.num_workers)
+        chunks = [image_paths[i:i + chunk_size] for i in range(0, len(image_paths), chunk_size)]
+        captions = []
+        # map 按提交顺序返回结果
+        for chunk_captions in self._get_executor().map(_caption_chunk, chunks, [profile] * len(chunks)):
+            captions.extend(chunk_captions)
+        return captions
+
+    def shutdown(self):
+        """关闭所有工作进程"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self.logger.info("[CaptionWorkerPool.shutdown] 描述进程已关闭")
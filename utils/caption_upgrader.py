@@ -0,0 +1,97 @@
+import os
+import time
+import threading
+from database.transaction_manager import TransactionManager
+from utils.image_scanner import ImageScanner
+from utils.config_manager import ConfigManager
+from utils.logger import Logger
+
+
+class CaptionUpgrader(threading.Thread):
+    """空闲时的描述升级线程
+
+    新图片先用快速档位入库以便尽快可搜索，
+    本线程在没有索引任务时用高质量档位重新生成描述并覆盖写入。
+    """
+
+    def __init__(self, batch_size: int = 8, poll_seconds: float = 10):
+        super().__init__(name='caption_upgrader', daemon=True)
+        self.logger = Logger()
+        config_manager = ConfigManager()
+        self.profile = config_manager.get_upgrade_profile()
+        self.idle_seconds = config_manager.get_upgrade_idle_seconds()
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.transaction_manager = TransactionManager()
+        self.image_scanner = None  # 首次升级时再创建
+        self._failed = set()  # 升级失败的图片，本次运行不再重试
+        self._stop_event = threading.Event()
+        self.upgraded = 0
+
+    def stop(self):
+        """停止升级线程"""
+        self._stop_event.set()
+
+    def is_idle(self) -> bool:
+        """距离最近一次索引活动是否已超过空闲阈值"""
+        return time.time() - ImageScanner.last_activity >= self.idle_seconds
+
+    def _next_batch(self):
+        paths = self.transaction_manager.get_paths_by_caption_profile(
+            self.profile, self.batch_size + len(self._failed)
+        )
+        return [path for path in paths if path not in self._failed][:self.batch_size]
+
+    def upgrade_batch(self) -> int:
+        """升级一批图片的描述
+
+        Returns:
+            int: 本批尝试升级的图片数，0 表示没有待升级的图片
+        """
+        file_paths = self._next_batch()
+        if not file_paths:
+            return 0
+        if self.image_scanner is None:
+            self.image_scanner = ImageScanner()
+
+        existing = [path for path in file_paths if os.path.exists(path)]
+        self._failed.update(set(file_paths) - set(existing))
+        try:
+            descriptions = self.image_scanner.get_image_descriptions(existing, profile=self.profile)
+        except Exception as e:
+            self.logger.error(f"[CaptionUpgrader.upgrade_batch] 批量生成描述失败: {str(e)}")
+            self._failed.update(existing)
+            self.image_scanner.discard(existing)
+            return len(file_paths)
+
+        try:
+            for file_path in existing:
+                if not self.is_idle() or self._stop_event.is_set():
+                    # 有新的索引任务，让出资源
+                    break
+                if file_path not in descriptions:
+                    self._failed.add(file_path)
+                    continue
+                try:
+                    self.image_scanner.process_single_image(file_path, descriptions[file_path], self.profile)
+                    self.upgraded += 1
+                except Exception as e:
+                    self.logger.error(f"[CaptionUpgrader.upgrade_batch] 升级描述失败 {file_path}: {str(e)}")
+                    self._failed.add(file_path)
+        finally:
+            # 让出资源时未写入的图片下一轮重新生成
+            self.image_scanner.discard(existing)
+        return len(file_paths)
+
+    def run(self):
+        self.logger.info(f"[CaptionUpgrader.run] 描述升级线程已启动，目标档位: {self.profile}")
+        while not self._stop_event.wait(self.poll_seconds):
+            if not self.is_idle():
+                continue
+            try:
+                while self.is_idle() and not self._stop_event.is_set():
+                    if self.upgrade_batch() == 0:
+                        break
+                    self.logger.info(f"[CaptionUpgrader.run] 已升级描述: {self.upgraded} 张")
+            except Exception as e:
+                self.logger.error(f"[CaptionUpgrader.run] 升级描述时出错: {str(e)}")
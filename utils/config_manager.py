@@ -1,6 +1,6 @@
 import os
 import configparser
-from typing import List
+from typing import List, Optional
 
 class ConfigManager:
     def __init__(self):
@@ -27,12 +27,44 @@ class ConfigManager:
         }
         
         self.config['Database'] = {
-            'db_path': 'everypic.db'
+            'db_path': 'everypic.db',
+            'embedding_model': 'default',    # 描述向量模型，default 为 ChromaDB 默认模型
+            'index_engine': 'caption',       # 索引方式：caption 描述向量 / clip 图片向量 / both 两者都建
+            'clip_model': 'openai/clip-vit-base-patch32',
+            'vector_backend': 'chroma',      # 向量存储：chroma 近似检索 / numpy 内存映射精确检索
+            'hnsw_construction_ef': '100',   # 建图候选数，越大图质量越高、写入越慢
+            'hnsw_search_ef': '10',          # 查询候选数，越大召回越高、查询越慢
+            'hnsw_m': '16',                  # 每个节点的邻居数，越大召回越高、内存越多
+            'search_mode': 'hybrid',         # 检索方式：vector 向量 / keyword 全文 / hybrid 两者融合
+            'search_page_size': '30',        # 搜索结果每页数量，滚动到底部时加载下一页
+            'search_max_distance': '0.8',    # 描述向量结果的余弦距离上限，0 表示不限制
+            'search_max_image_distance': '0'  # CLIP 图片向量结果的余弦距离上限，0 表示不限制
         }
         
         self.config['General'] = {
             'language': 'zh_CN'  # 默认使用中文
         }
+
+        self.config['Performance'] = {
+            'caption_batch_size': '4',       # 初始批大小，运行时按实测延迟和内存自动调整
+            'caption_batch_max': '32',
+            'prefetch_workers': '2',         # 解码预取线程数
+            'prefetch_depth': '64',          # 预取队列上限（图片数）
+            'caption_workers': '1',          # 描述生成进程数，大于1时启用多进程
+            'caption_threads_per_worker': '0',  # 每个描述进程的 torch 线程数，0 表示按核数平均分配
+            'model_warmup': 'true',          # 启动后在后台预热描述模型
+            'caption_backend': 'torch',      # 描述推理后端：torch / int8 / onnx
+            'index_profile': 'fast',         # 新图片入库使用的生成档位
+            'upgrade_profile': 'quality',    # 空闲时升级描述使用的生成档位
+            'upgrade_idle_seconds': '60',    # 无索引任务持续多久后开始升级描述，0 表示不升级
+            'max_decode_pixels': '100000000',  # 超过该像素数的非 JPEG 图片分条或逐张解码，0 表示不限制
+            'embedding_batch_size': '64',    # 描述向量批大小
+            'embedding_worker': 'false',     # 是否在单独线程中计算描述向量
+            'query_cache_size': '128',       # 查询向量和搜索结果缓存条数，0 表示不缓存
+            'sqlite_cache_size_mb': '64',    # 每个 SQLite 连接的页缓存（MB）
+            'sqlite_mmap_size_mb': '256',    # SQLite 内存映射读取上限（MB），0 表示不使用
+            'sqlite_busy_timeout_ms': '5000' # 等待写锁的时间（毫秒）
+        }
         
         self.save_config()
 
@@ -72,4 +104,128 @@ class ConfigManager:
     def set_supported_formats(self, formats: str):
         """设置支持的文件格式"""
         self.config['FileTypes']['supported_formats'] = formats
-        self.save_config() 
\ No newline at end of file
+        self.save_config()
+
+    def get_caption_batch_size(self) -> int:
+        """获取描述生成的初始批大小"""
+        return self.config.getint('Performance', 'caption_batch_size', fallback=4)
+
+    def get_caption_batch_max(self) -> int:
+        """获取描述生成的最大批大小"""
+        return self.config.getint('Performance', 'caption_batch_max', fallback=32)
+
+    def get_prefetch_workers(self) -> int:
+        """获取图片解码预取线程数"""
+        return self.config.getint('Performance', 'prefetch_workers', fallback=2)
+
+    def get_prefetch_depth(self) -> int:
+        """获取图片预取队列上限"""
+        return self.config.getint('Performance', 'prefetch_depth', fallback=64)
+
+    def get_caption_workers(self) -> int:
+        """获取描述生成进程数"""
+        return max(1, self.config.getint('Performance', 'caption_workers', fallback=1))
+
+    def get_caption_threads_per_worker(self) -> int:
+        """获取每个描述进程的 torch 线程数，0 表示自动"""
+        return self.config.getint('Performance', 'caption_threads_per_worker', fallback=0)
+
+    def get_model_warmup(self) -> bool:
+        """是否在启动后后台预热描述模型"""
+        return self.config.getboolean('Performance', 'model_warmup', fallback=True)
+
+    def get_caption_backend(self) -> str:
+        """获取描述推理后端：torch / int8 / onnx"""
+        return self.config.get('Performance', 'caption_backend', fallback='torch').strip().lower()
+
+    def get_index_profile(self) -> str:
+        """获取新图片入库使用的生成档位"""
+        return self.config.get('Performance', 'index_profile', fallback='fast').strip()
+
+    def get_upgrade_profile(self) -> str:
+        """获取空闲时升级描述使用的生成档位"""
+        return self.config.get('Performance', 'upgrade_profile', fallback='quality').strip()
+
+    def get_upgrade_idle_seconds(self) -> int:
+        """获取开始升级描述前需要的空闲时间（秒），0 表示不升级"""
+        return self.config.getint('Performance', 'upgrade_idle_seconds', fallback=60)
+
+    def get_max_decode_pixels(self) -> int:
+        """获取非 JPEG 图片可以并发完整解码的最大像素数，超过的分条或逐张解码，0 表示不限制"""
+        return self.config.getint('Performance', 'max_decode_pixels', fallback=100000000)
+
+    def get_embedding_model(self) -> str:
+        """获取描述向量模型"""
+        return self.config.get('Database', 'embedding_model', fallback='default').strip()
+
+    def get_embedding_batch_size(self) -> int:
+        """获取描述向量批大小"""
+        return self.config.getint('Performance', 'embedding_batch_size', fallback=64)
+
+    def get_embedding_worker(self) -> bool:
+        """是否在单独线程中计算描述向量"""
+        return self.config.getboolean('Performance', 'embedding_worker', fallback=False)
+
+    def get_query_cache_size(self) -> int:
+        """获取查询向量和搜索结果缓存条数"""
+        return max(0, self.config.getint('Performance', 'query_cache_size', fallback=128))
+
+    def get_sqlite_cache_size_mb(self) -> int:
+        """获取每个 SQLite 连接的页缓存大小（MB）"""
+        return max(1, self.config.getint('Performance', 'sqlite_cache_size_mb', fallback=64))
+
+    def get_sqlite_mmap_size_mb(self) -> int:
+        """获取 SQLite 内存映射读取上限（MB），0 表示不使用"""
+        return max(0, self.config.getint('Performance', 'sqlite_mmap_size_mb', fallback=256))
+
+    def get_sqlite_busy_timeout_ms(self) -> int:
+        """获取等待 SQLite 写锁的时间（毫秒）"""
+        return max(0, self.config.getint('Performance', 'sqlite_busy_timeout_ms', fallback=5000))
+
+    def get_index_engines(self) -> set:
+        """获取启用的索引方式集合：caption / clip"""
+        engine = self.config.get('Database', 'index_engine', fallback='caption').strip().lower()
+        if engine == 'both':
+            return {'caption', 'clip'}
+        if engine == 'clip':
+            return {'clip'}
+        return {'caption'}
+
+    def get_vector_backend(self) -> str:
+        """获取向量存储后端：chroma / numpy"""
+        backend = self.config.get('Database', 'vector_backend', fallback='chroma').strip().lower()
+        return backend if backend in ('chroma', 'numpy') else 'chroma'
+
+    def get_hnsw_params(self) -> dict:
+        """获取 ChromaDB 集合的 HNSW 参数，修改后需重建索引才对已有集合生效"""
+        return {
+            'hnsw:construction_ef': self.config.getint('Database', 'hnsw_construction_ef', fallback=100),
+            'hnsw:search_ef': self.config.getint('Database', 'hnsw_search_ef', fallback=10),
+            'hnsw:M': self.config.getint('Database', 'hnsw_m', fallback=16)
+        }
+
+    def get_search_mode(self) -> str:
+        """获取检索方式：vector / keyword / hybrid"""
+        mode = self.config.get('Database', 'search_mode', fallback='hybrid').strip().lower()
+        return mode if mode in ('vector', 'keyword', 'hybrid') else 'hybrid'
+
+    def get_search_page_size(self) -> int:
+        """获取搜索结果每页数量"""
+        return max(1, self.config.getint('Database', 'search_page_size', fallback=30))
+
+    def get_search_max_distance(self) -> Optional[float]:
+        """获取描述向量结果的余弦距离上限，0 表示不限制"""
+        distance = self.config.getfloat('Database', 'search_max_distance', fallback=0.8)
+        return distance if distance > 0 else None
+
+    def get_search_max_image_distance(self) -> Optional[float]:
+        """获取 CLIP 图片向量结果的余弦距离上限，0 表示不限制
+
+        文本与图片向量的余弦距离普遍高于文本之间的距离，不能沿用描述向量的上限。
+        """
+        distance = self.config.getfloat('Database', 'search_max_image_distance', fallback=0)
+        return distance if distance > 0 else None
+
+    def get_clip_model(self) -> str:
+        """获取图片向量使用的 CLIP 模型"""
+        return self.config.get('Database', 'clip_model', fallback='openai/clip-vit-base-patch32').strip()
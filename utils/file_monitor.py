@@ -26,8 +26,8 @@ class ImageFileHandler(FileSystemEventHandler):
             return
         if self.is_valid_image(event.src_path):
             try:
-                self.image_scanner.process_single_image(event.src_path)
-                self.logger.info(f"新增图片: {event.src_path}")
+                if self.image_scanner.submit_image(event.src_path):
+                    self.logger.info(f"新增图片: {event.src_path}")
             except Exception as e:
                 self.logger.error(f"处理新增图片时出错: {e}")
 
@@ -37,6 +37,10 @@ class ImageFileHandler(FileSystemEventHandler):
             return
         if self.is_valid_image(event.src_path):
             try:
+                if not self.image_scanner.caption_ready:
+                    # 模型未就绪：排队重新处理，写入时会覆盖旧记录
+                    self.image_scanner.submit_image(event.src_path)
+                    return
                 with self.db.transaction():
                     self.db.delete_image(event.src_path)
                     self.image_scanner.process_single_image(event.src_path)
@@ -62,6 +66,18 @@ class ImageFileHandler(FileSystemEventHandler):
             return
         if self.is_valid_image(event.dest_path):
             try:
+                # 已入库的图片只更新路径，描述和向量保留
+                with self.db.transaction():
+                    image_id = self.db.rename_image(event.src_path, event.dest_path)
+                if image_id is not None:
+                    self.logger.info(f"移动/重命名图片: {event.src_path} -> {event.dest_path}")
+                    return
+                if not self.image_scanner.caption_ready:
+                    # 模型未就绪：先删除旧记录，新路径排队处理
+                    with self.db.transaction():
+                        self.db.delete_image(event.src_path)
+                    self.image_scanner.submit_image(event.dest_path)
+                    return
                 with self.db.transaction():
                     self.db.delete_image(event.src_path)
                     self.image_scanner.process_single_image(event.dest_path)
@@ -0,0 +1,104 @@
+import threading
+import numpy as np
+import torch
+from transformers import CLIPModel, CLIPProcessor
+from utils.ImageToText import decode_image
+from utils.config_manager import ConfigManager
+from utils.logger import Logger
+
+
+class ClipImageEmbedder:
+    """CLIP 图文联合向量
+
+    图片和查询文本映射到同一向量空间，一张图片只需一次视觉编码器前向计算，
+    无需先生成描述。向量均已归一化，可直接用余弦距离检索。
+    """
+
+    DEFAULT_MODEL = "openai/clip-vit-base-patch32"
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, model_name=DEFAULT_MODEL):
+        self.model_name = model_name
+        self.processor = None
+        self.model = None
+        self.max_decode_pixels = ConfigManager().get_max_decode_pixels()
+        self._load_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls, model_name=None):
+        """获取按模型名共享的实例，模型名为空时读取配置"""
+        if model_name is None:
+            model_name = ConfigManager().get_clip_model()
+        with cls._instances_lock:
+            if model_name not in cls._instances:
+                cls._instances[model_name] = cls(model_name)
+            return cls._instances[model_name]
+
+    def load_model(self):
+        """首次使用时加载模型"""
+        with self._load_lock:
+            if self.processor is None or self.model is None:
+                self.processor = CLIPProcessor.from_pretrained(self.model_name)
+                self.model = CLIPModel.from_pretrained(self.model_name)
+                self.model.eval()
+                Logger().info(f"[ClipImageEmbedder.load_model] CLIP 模型已加载: {self.model_name}")
+
+    def get_input_size(self):
+        """视觉编码器输入尺寸 (宽, 高)"""
+        if self.processor is not None:
+            size = getattr(self.processor.image_processor, 'crop_size', None)
+            if isinstance(size, dict) and 'width' in size and 'height' in size:
+                return size['width'], size['height']
+        return 224, 224
+
+    def load_image(self, image_path):
+        """解码图片，短边不小于输入尺寸，缩放和中心裁剪交给 CLIP 处理器"""
+        return decode_image(image_path, self.get_input_size(), self.max_decode_pixels, resize=False)
+
+    @staticmethod
+    def _normalize(features) -> list:
+        features = features / features.norm(dim=-1, keepdim=True)
+        return features.cpu().numpy().astype(np.float32).tolist()
+
+    def embed_images(self, images):
+        """批量计算图片向量
+
+        Args:
+            images: PIL 图片列表，解码失败的位置为 None
+
+        Returns:
+            list: 与 images 一一对应的向量，None 图片对应 None
+        """
+        self.load_model()
+        vectors = [None] * len(images)
+        positions = [i for i, image in enumerate(images) if image is not None]
+        if not positions:
+            return vectors
+
+        inputs = self.processor(images=[images[i] for i in positions], return_tensors="pt")
+        with torch.inference_mode():
+            features = self.model.get_image_features(**inputs)
+        for position, vector in zip(positions, self._normalize(features)):
+            vectors[position] = vector
+        return vectors
+
+    def embed_image_paths(self, image_paths):
+        """解码并批量计算图片向量，无法读取的图片对应 None"""
+        images = []
+        for image_path in image_paths:
+            try:
+                images.append(self.load_image(image_path))
+            except Exception as e:
+                Logger().error(f"[ClipImageEmbedder.embed_image_paths] 解码图片失败 {image_path}: {str(e)}")
+                images.append(None)
+        return self.embed_images(images)
+
+    def embed_texts(self, texts):
+        """批量计算查询文本向量"""
+        self.load_model()
+        inputs = self.processor(text=list(texts), return_tensors="pt", padding=True, truncation=True)
+        with torch.inference_mode():
+            features = self.model.get_text_features(**inputs)
+        return self._normalize(features)
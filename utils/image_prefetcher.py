@@ -0,0 +1,91 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from utils.logger import Logger
+
+
+class ImagePrefetcher:
+    """图片预取器
+
+    在线程池中提前解码、摆正并缩小图片，模型处理上一批时下一批已在解码。
+    预取队列有上限，避免解码速度远超推理时占满内存。
+
+    通过 queue_depth 观察瓶颈：长期接近上限说明推理是瓶颈，
+    长期为 0 且 wait_seconds 持续增长说明磁盘读取/解码是瓶颈。
+    """
+
+    def __init__(self, loader, max_workers: int = 2, max_pending: int = 64):
+        """
+        Args:
+            loader: 解码函数，参数为图片路径，返回 PIL 图片
+            max_workers: 解码线程数
+            max_pending: 已提交但尚未被取走的图片数上限
+        """
+        self.logger = Logger()
+        self.loader = loader
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(1, max_pending)
+        self._pending = deque()
+        self.wait_seconds = 0.0  # 消费者等待解码的累计时间
+        self.batches = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """已解码完成、等待模型处理的图片数"""
+        return sum(1 for _, future in self._pending if future.done())
+
+    def get_stats(self) -> dict:
+        """获取预取统计信息"""
+        return {
+            'queue_depth': self.queue_depth,
+            'pending': len(self._pending),
+            'max_pending': self.max_pending,
+            'wait_seconds': self.wait_seconds,
+            'batches': self.batches
+        }
+
+    def _load(self, image_path: str):
+        try:
+            return self.loader(image_path)
+        except Exception as e:
+            self.logger.error(f"[ImagePrefetcher._load] 解码图片失败 {image_path}: {str(e)}")
+            return None
+
+    def iter_batches(self, image_paths, batch_size):
+        """按批产出已解码的图片
+
+        Args:
+            image_paths: 图片路径列表
+            batch_size: 批大小，或每批调用一次的函数（用于自适应批大小）
+
+        Yields:
+            tuple: (路径列表, 图片列表)，解码失败的位置为 None
+        """
+        paths = iter(image_paths)
+        self._pending.clear()
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix='image_prefetch') as executor:
+            def fill(target):
+                while len(self._pending) < target:
+                    path = next(paths, None)
+                    if path is None:
+                        return
+                    self._pending.append((path, executor.submit(self._load, path)))
+
+            size = batch_size() if callable(batch_size) else batch_size
+            fill(max(self.max_pending, size))
+            while self._pending:
+                size = max(1, batch_size() if callable(batch_size) else batch_size)
+                depth = self.queue_depth
+                batch = [self._pending.popleft() for _ in range(min(size, len(self._pending)))]
+
+                start_time = time.time()
+                images = [future.result() for _, future in batch]
+                self.wait_seconds += time.time() - start_time
+                self.batches += 1
+
+                # 先补满队列再交出本批，解码与推理重叠进行
+                fill(max(self.max_pending, size))
+                self.logger.info(f"[ImagePrefetcher.iter_batches] 预取队列深度: {depth}/{self.max_pending}, "
+                                 f"累计等待解码: {self.wait_seconds:.2f} 秒")
+                yield [path for path, _ in batch], images
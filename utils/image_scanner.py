@@ -1,23 +1,56 @@
 import os
 import time
 import hashlib
+import threading
 from datetime import datetime
 from PIL import Image
 from database.transaction_manager import TransactionManager
+from database.caption_cache import CaptionCache
 from .ImageToText import ImageToText
 from .config_manager import ConfigManager
+from .image_prefetcher import ImagePrefetcher
+from .caption_pool import CaptionWorkerPool
+from .image_embedder import ClipImageEmbedder
 from utils.logger import Logger
 import random
 import string
 
 
 class ImageScanner:
+    # 最近一次索引活动的时间，后台升级描述据此判断是否空闲；从程序启动时算起
+    last_activity = time.time()
+
     def __init__(self):
         self.transaction_manager = TransactionManager()  # 更清晰的变量命名
-        self.supported_formats = ConfigManager().get_supported_formats()
-        self.image_to_text = ImageToText()
-        self.image_to_text.load_model()
+        config_manager = ConfigManager()
+        self.supported_formats = config_manager.get_supported_formats()
+        # 索引方式：caption 生成描述后向量化，clip 直接计算图片向量
+        self.engines = config_manager.get_index_engines()
+        self.clip_embedder = ClipImageEmbedder.get_instance() if 'clip' in self.engines else None
+        # 共享模型实例，首次使用或后台预热时才加载
+        self.image_to_text = ImageToText.get_instance()
+        # 新图片先用快速档位生成描述，空闲时再升级
+        self.index_profile = config_manager.get_index_profile()
+        self.caption_workers = config_manager.get_caption_workers()
+        self.caption_pool = None
+        if self.caption_workers > 1 and 'caption' in self.engines:
+            # 多进程模式下模型只在工作进程中加载，各扫描器共享同一组工作进程
+            self.caption_pool = CaptionWorkerPool.get_instance(
+                self.image_to_text.model_name,
+                self.caption_workers,
+                config_manager.get_caption_threads_per_worker(),
+                self.image_to_text.backend_name
+            )
         self.logger = Logger()
+        self.caption_cache = CaptionCache()
+        self.vector_store = self.transaction_manager.vector_store
+        # 批量描述阶段算出的 MD5 和描述向量（向量或 Future），写库时直接使用
+        self._file_md5s = {}
+        self._embeddings = {}
+        self._image_embeddings = {}
+        # 模型预热完成前提交的图片
+        self._waiting = []
+        self._waiting_lock = threading.Lock()
     
     def get_file_md5(self, filepath):
         """计算文件的MD5值"""
@@ -27,22 +60,309 @@ class ImageScanner:
                 md5_hash.update(chunk)
         return md5_hash.hexdigest()
     
-    def get_image_description(self, image_path):
+    def get_file_md5_cached(self, file_path):
+        """计算文件 MD5，文件未变化时复用描述阶段已算出的值"""
+        file_stats = os.stat(file_path)
+        key = (file_stats.st_size, file_stats.st_mtime_ns)
+        cached = self._file_md5s.get(file_path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        md5 = self.get_file_md5(file_path)
+        self._file_md5s[file_path] = (key, md5)
+        return md5
+
+    def lookup_cached_descriptions(self, image_paths, profile: str = None):
+        """按文件内容哈希查询描述缓存
+
+        Returns:
+            dict: 文件路径 -> 描述，只包含缓存命中的图片
+        """
+        if 'caption' not in self.engines:
+            return {}
+        profile = profile or self.index_profile
+        md5s = {}
+        for path in image_paths:
+            try:
+                md5s[path] = self.get_file_md5_cached(path)
+            except OSError as e:
+                self.logger.error(f"[ImageScanner.lookup_cached_descriptions] 读取文件失败 {path}: {str(e)}")
+        cached = self.caption_cache.lookup(list(md5s.values()), self.image_to_text.model_id, profile)
+
+        descriptions = {}
+        for path, md5 in md5s.items():
+            if md5 in cached:
+                caption, embedding, embedding_model = cached[md5]
+                descriptions[path] = caption
+                # 只复用同一向量模型计算的向量
+                if embedding is not None and embedding_model == self.vector_store.embedding_model:
+                    self._embeddings[path] = CaptionCache.decode_embedding(embedding)
+                else:
+                    self._embeddings.pop(path, None)
+        return descriptions
+
+    def get_capture_time(self, file_path):
+        """读取 EXIF 拍摄时间（DateTimeOriginal，缺失时用 DateTime），没有时返回 None"""
+        try:
+            with Image.open(file_path) as image:
+                exif = image.getexif()
+                value = exif.get_ifd(0x8769).get(36867) or exif.get(306)
+            if not value:
+                return None
+            capture_time = datetime.strptime(str(value).strip()[:19], '%Y:%m:%d %H:%M:%S')
+            return capture_time.strftime('%Y-%m-%d %H:%M:%S')
+        except Exception:
+            return None
+
+    @classmethod
+    def mark_activity(cls):
+        """记录一次索引活动"""
+        cls.last_activity = time.time()
+
+    def get_image_description(self, image_path, profile: str = None):
         """获取图片描述"""
-        return self.image_to_text.caption_image(image_path)
+        description = self.get_image_descriptions([image_path], profile=profile).get(image_path)
+        if description is None:
+            raise RuntimeError(f"无法生成图片描述: {image_path}")
+        return description
         #生成一段随机的字符串，长度30个字符的英文，便于测试
         # return ''.join(random.choices(string.ascii_letters + string.digits, k=30))
 
+    def get_image_descriptions(self, image_paths, images=None, profile: str = None):
+        """批量获取图片描述
+
+        Args:
+            image_paths: 图片路径列表
+            images: 预取阶段已解码的图片（可选），与 image_paths 一一对应，
+                多进程模式下忽略，由工作进程自行解码
+            profile: 生成参数档位，为空时使用入库档位
+
+        Returns:
+            dict: 文件路径 -> 描述，无法生成描述的图片不在结果中；
+                只建图片向量索引时描述为 None
+        """
+        if 'caption' not in self.engines:
+            # 预取器按 CLIP 输入尺寸解码，直接计算图片向量
+            self.embed_images(image_paths, images)
+            return {path: None for path in image_paths if path in self._image_embeddings}
+
+        profile = profile or self.index_profile
+        descriptions = self.lookup_cached_descriptions(image_paths, profile)
+        misses = [i for i, path in enumerate(image_paths) if path not in descriptions]
+
+        if misses:
+            miss_paths = [image_paths[i] for i in misses]
+            if self.caption_pool is not None:
+                captions = self.caption_pool.caption_images(miss_paths, profile)
+            elif images is None:
+                captions = self.image_to_text.caption_images(miss_paths, profile=profile)
+            else:
+                captions = self.image_to_text.caption_loaded_images([images[i] for i in misses], profile=profile)
+            for path, caption in zip(miss_paths, captions):
+                # 丢弃该路径此前描述对应的向量
+                self._embeddings.pop(path, None)
+                if caption is not None:
+                    descriptions[path] = caption
+
+        self.embed_descriptions(descriptions, profile)
+        if self.clip_embedder is not None:
+            # 预取的图片按描述模型尺寸缩放过，CLIP 重新解码
+            self.embed_images(list(descriptions))
+        return descriptions
+
+    def embed_images(self, image_paths, images=None):
+        """批量计算 CLIP 图片向量，写库时直接使用
+
+        Args:
+            image_paths: 图片路径列表
+            images: 已按 CLIP 输入尺寸解码的图片（可选），与 image_paths 一一对应
+        """
+        if images is None:
+            embeddings = self.clip_embedder.embed_image_paths(image_paths)
+        else:
+            embeddings = self.clip_embedder.embed_images(images)
+        for path, embedding in zip(image_paths, embeddings):
+            if embedding is None:
+                self._image_embeddings.pop(path, None)
+            else:
+                self._image_embeddings[path] = embedding
+
+    def embed_descriptions(self, descriptions: dict, profile: str = None):
+        """整批计算尚无向量的描述，并连同向量写入描述缓存
+
+        启用向量工作线程时异步计算，写库时再取结果。
+        """
+        profile = profile or self.index_profile
+        paths = [path for path in descriptions if path not in self._embeddings]
+        if not paths:
+            return
+        texts = [descriptions[path] for path in paths]
+        # 回调可能在向量工作线程中执行，此时主线程可能已移除 _file_md5s 中的条目，提交前先取出
+        md5s = {path: self._file_md5s[path][1] for path in paths if path in self._file_md5s}
+        future = self.vector_store.embed_documents_async(texts)
+        for index, path in enumerate(paths):
+            self._embeddings[path] = (future, index)
+
+        model_id = self.image_to_text.model_id
+        embedding_model = self.vector_store.embedding_model
+
+        def store_cache(done):
+            if done.exception() is not None:
+                self.logger.error(f"[ImageScanner.embed_descriptions] 计算描述向量失败: {str(done.exception())}")
+                embeddings = [None] * len(paths)
+            else:
+                embeddings = done.result()
+            entries = [(md5s[path], text, embedding)
+                       for path, text, embedding in zip(paths, texts, embeddings)
+                       if path in md5s]
+            self.caption_cache.store(entries, model_id, profile, embedding_model)
+
+        future.add_done_callback(store_cache)
+
+    def discard(self, file_paths):
+        """丢弃批量阶段为这些文件算出的 MD5 和向量
+
+        写库后 build_image_record 会自行清理；描述生成失败、写库失败或跳过的文件由调用方在每批结束时清理，
+        避免这些缓存随扫描器一直增长。
+        """
+        for file_path in file_paths:
+            self._file_md5s.pop(file_path, None)
+            self._embeddings.pop(file_path, None)
+            self._image_embeddings.pop(file_path, None)
+
+    def _pop_embedding(self, file_path: str):
+        """取出批量阶段算好的向量，计算失败时返回 None 由向量库现场计算"""
+        embedding = self._embeddings.pop(file_path, None)
+        if isinstance(embedding, tuple):
+            # (整批 Future, 批内位置)
+            future, index = embedding
+            try:
+                embedding = future.result()[index]
+            except Exception:
+                return None
+        return embedding
+
+    @property
+    def caption_ready(self) -> bool:
+        """描述模型是否可立即使用（多进程模式下由工作进程自行加载，不生成描述时无需等待）"""
+        return ('caption' not in self.engines or self.caption_pool is not None or
+                self.image_to_text.is_ready)
+
+    def submit_image(self, file_path: str) -> bool:
+        """提交单张图片处理，模型未就绪时排队而不阻塞调用方
+
+        Returns:
+            bool: True 表示已立即处理，False 表示已排队等待模型预热完成
+        """
+        self.mark_activity()
+        if self.caption_ready:
+            self.process_single_image(file_path)
+            return True
+
+        with self._waiting_lock:
+            self._waiting.append(file_path)
+        self.logger.info(f"[ImageScanner.submit_image] 模型尚未就绪，排队等待: {file_path}")
+        self.image_to_text.start_warmup(self._process_waiting, self._on_warmup_failed)
+        return False
+
+    def _on_warmup_failed(self, error: Exception):
+        """模型预热失败：排队的图片保留，下次提交图片时重新预热"""
+        with self._waiting_lock:
+            waiting = len(self._waiting)
+        self.logger.error(f"[ImageScanner._on_warmup_failed] 描述模型加载失败，{waiting} 张排队图片等待重试: {str(error)}")
+
+    def _process_waiting(self):
+        """模型就绪后处理排队的图片"""
+        while True:
+            with self._waiting_lock:
+                if not self._waiting:
+                    return
+                # 同一文件多次提交只处理一次
+                file_paths = list(dict.fromkeys(self._waiting))
+                self._waiting.clear()
+
+            self.logger.info(f"[ImageScanner._process_waiting] 开始处理排队图片: {len(file_paths)} 张")
+            self.mark_activity()
+            batch_size = ConfigManager().get_caption_batch_size()
+            for i in range(0, len(file_paths), batch_size):
+                batch_paths = file_paths[i:i + batch_size]
+                try:
+                    descriptions = self.get_image_descriptions(batch_paths)
+                except Exception as e:
+                    self.logger.error(f"[ImageScanner._process_waiting] 批量生成描述失败: {str(e)}")
+                    self.discard(batch_paths)
+                    continue
+                for file_path in batch_paths:
+                    if file_path not in descriptions:
+                        self.logger.error(f"[ImageScanner._process_waiting] 无法生成图片描述: {file_path}")
+                        continue
+                    try:
+                        self.process_single_image(file_path, descriptions[file_path])
+                    except Exception as e:
+                        self.logger.error(f"[ImageScanner._process_waiting] 处理文件 {file_path} 时出错: {str(e)}")
+                self.discard(batch_paths)
+
+    def create_prefetcher(self) -> ImagePrefetcher:
+        """创建与描述模型配套的图片预取器"""
+        config_manager = ConfigManager()
+        loader = self.image_to_text.load_image
+        if 'caption' not in self.engines:
+            loader = self.clip_embedder.load_image
+        return ImagePrefetcher(
+            loader,
+            max_workers=config_manager.get_prefetch_workers(),
+            max_pending=config_manager.get_prefetch_depth()
+        )
+
+    def iter_image_batches(self, image_paths, batch_size):
+        """按批产出待生成描述的图片
+
+        单进程模式下经预取器提前解码；多进程模式下工作进程自行解码，
+        批大小按进程数放大，让每个进程分到 batch_size 张。
+
+        Args:
+            image_paths: 图片路径列表
+            batch_size: 批大小，或每批调用一次的函数
+
+        Yields:
+            tuple: (路径列表, 已解码图片列表或 None)
+        """
+        if self.caption_pool is None:
+            yield from self.create_prefetcher().iter_batches(image_paths, batch_size)
+            return
+
+        done = 0
+        while done < len(image_paths):
+            size = batch_size() if callable(batch_size) else batch_size
+            size = max(1, size) * self.caption_workers
+            yield image_paths[done:done + size], None
+            done += size
+
     def scan_directory(self, directory):
         """扫描指定目录下的所有图片"""
+        file_paths = []
         for root, dirs, files in os.walk(directory):
             for file in files:
                 if any(file.lower().endswith(fmt) for fmt in self.supported_formats):
-                    file_path = os.path.join(root, file)
-                    try:
-                        self.process_single_image(file_path)
-                    except Exception as e:
-                        self.logger.error(f"[ImageScanner.scan_directory] 处理文件 {file_path} 时出错: {str(e)}")
+                    file_paths.append(os.path.join(root, file))
+
+        batch_size = ConfigManager().get_caption_batch_size()
+        for batch_paths, images in self.iter_image_batches(file_paths, batch_size):
+            self.mark_activity()
+            try:
+                descriptions = self.get_image_descriptions(batch_paths, images)
+            except Exception as e:
+                self.logger.error(f"[ImageScanner.scan_directory] 批量生成描述失败: {str(e)}")
+                self.discard(batch_paths)
+                continue
+            for file_path in batch_paths:
+                if file_path not in descriptions:
+                    self.logger.error(f"[ImageScanner.scan_directory] 无法生成图片描述: {file_path}")
+                    continue
+                try:
+                    self.process_single_image(file_path, descriptions[file_path])
+                except Exception as e:
+                    self.logger.error(f"[ImageScanner.scan_directory] 处理文件 {file_path} 时出错: {str(e)}")
+            self.discard(batch_paths)
     
     def start_scan(self):
         """开始扫描系统中的图片"""
@@ -54,8 +374,14 @@ class ImageScanner:
             if os.path.exists(directory):
                 self.scan_directory(directory) 
     
-    def process_single_image(self, file_path: str):
-        """处理单个图片文件"""
+    def process_single_image(self, file_path: str, description: str = None, profile: str = None):
+        """处理单个图片文件
+
+        Args:
+            file_path: 图片文件路径
+            description: 已批量生成的图片描述（可选），为空时现场生成；只建图片向量索引时忽略
+            profile: 生成描述所用的档位，为空时使用入库档位
+        """
         try:
             import psutil
             process = psutil.Process()
@@ -64,32 +390,11 @@ class ImageScanner:
             self.logger.info(f"[ImageScanner.process_single_image] 开始处理图片: {file_path}")
             self.logger.info(f"[ImageScanner.process_single_image] 当前内存使用: {memory_before:.2f} MB")
             
-            # 获取文件信息
-            file_stats = os.stat(file_path)
-            file_name = os.path.basename(file_path)
-            created_time = datetime.fromtimestamp(file_stats.st_ctime)
-            modified_time = datetime.fromtimestamp(file_stats.st_mtime)
-            
-            # 生成图片描述
-            start_time = time.time()
-            description = self.get_image_description(file_path)
-            end_time = time.time()
-            print(f"获取图片 {file_name} 描述耗时: {end_time - start_time} 秒")
-            print(f"图片描述: {description}")
-            
-            # 构建图片数据
-            image_data = {
-                'file_path': file_path,
-                'file_name': file_name,
-                'file_size': file_stats.st_size,
-                'md5': self.get_file_md5(file_path),
-                'created_time': created_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'modified_time': modified_time.strftime('%Y-%m-%d %H:%M:%S')
-            }
+            record = self.build_image_record(file_path, description, profile)
             
             # 使用事务添加图片信息到数据库
             with self.transaction_manager.transaction():
-                image_id = self.transaction_manager.add_image(image_data, description)
+                image_id = self.transaction_manager.add_image(*record)
                 self.logger.info(f"[ImageScanner.process_single_image] 成功处理图片: {file_path}")  
             
             memory_after = process.memory_info().rss / 1024 / 1024
@@ -101,3 +406,61 @@ class ImageScanner:
             import traceback
             self.logger.error(f"[ImageScanner.process_single_image] 错误详情: {traceback.format_exc()}")
             raise 
+
+    def build_image_record(self, file_path: str, description: str = None, profile: str = None) -> tuple:
+        """读取文件信息并准备写入数据库的内容，不写库
+
+        Args:
+            file_path: 图片文件路径
+            description: 已批量生成的图片描述（可选），为空时现场生成；只建图片向量索引时忽略
+            profile: 生成描述所用的档位，为空时使用入库档位
+
+        Returns:
+            tuple: (图片基本信息, 描述, 描述向量或 None, 图片向量或 None)，即 TransactionManager.add_image 的参数
+        """
+        try:
+            # 获取文件信息
+            file_stats = os.stat(file_path)
+            file_name = os.path.basename(file_path)
+            created_time = datetime.fromtimestamp(file_stats.st_ctime)
+            modified_time = datetime.fromtimestamp(file_stats.st_mtime)
+        
+            # 生成图片描述，内容相同的图片直接复用缓存
+            profile = profile or self.index_profile
+            if 'caption' not in self.engines:
+                description = None
+                profile = None
+            elif description is None:
+                start_time = time.time()
+                description = self.get_image_description(file_path, profile)
+                end_time = time.time()
+                print(f"获取图片 {file_name} 描述耗时: {end_time - start_time} 秒")
+            print(f"图片描述: {description}")
+
+            # CLIP 图片向量，批量阶段未算出时现场计算
+            image_embedding = None
+            if self.clip_embedder is not None:
+                image_embedding = self._image_embeddings.pop(file_path, None)
+                if image_embedding is None:
+                    image_embedding = self.clip_embedder.embed_image_paths([file_path])[0]
+                if image_embedding is None and description is None:
+                    raise RuntimeError(f"无法计算图片向量: {file_path}")
+        
+            # 构建图片数据
+            image_data = {
+                'file_path': file_path,
+                'file_name': file_name,
+                'file_size': file_stats.st_size,
+                'md5': self.get_file_md5_cached(file_path),
+                'created_time': created_time.strftime('%Y-%m-%d %H:%M:%S'),
+                'modified_time': modified_time.strftime('%Y-%m-%d %H:%M:%S'),
+                'caption_profile': profile,
+                'caption_model': self.image_to_text.model_id if description is not None else None,
+                'capture_time': self.get_capture_time(file_path)
+            }
+        
+            embedding = self._pop_embedding(file_path)
+            return image_data, description, embedding, image_embedding
+        finally:
+            # 不论成功与否都清理该文件在批量阶段留下的 MD5 和向量
+            self.discard([file_path])
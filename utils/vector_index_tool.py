@@ -0,0 +1,126 @@
+"""向量索引离线工具
+
+rebuild    按 settings.ini 中的 HNSW 参数重建向量集合（大量删除、重写后也可用于清理索引）
+reindex    用 SQLite 中保存的描述重新计算描述向量（向量库损坏或更换向量模型后使用）
+benchmark  对比近似检索与精确检索，报告 recall@k 和查询延迟 p50 / p99
+
+用法:
+    python -m utils.vector_index_tool rebuild
+    python -m utils.vector_index_tool reindex
+    python -m utils.vector_index_tool benchmark --queries 200 --k 10
+    python -m utils.vector_index_tool benchmark --search-ef 50 --search-ef 100 --search-ef 200
+"""
+import time
+import random
+import argparse
+import numpy as np
+from database.vector_store import VectorStore
+from utils.logger import Logger
+
+
+def _load_vectors(index, chunk_size: int = 1000):
+    """分页读出集合全部向量，返回 (ID列表, 归一化矩阵)"""
+    ids, vectors = [], []
+    for chunk_ids, chunk_vectors in index.iter_vectors(chunk_size):
+        ids.extend(chunk_ids)
+        vectors.extend(chunk_vectors)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if len(matrix):
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+    return ids, matrix
+
+
+def run_benchmark(index, num_queries: int = 100, k: int = 10, seed: int = 0) -> dict:
+    """以集合中随机抽取的向量为查询，对比近似检索与精确检索
+
+    Args:
+        index: 向量集合（VectorIndex）
+        num_queries: 查询数
+        k: 比较的 top-k
+        seed: 抽样随机种子
+
+    Returns:
+        dict: recall_at_k 平均召回率，p50_ms / p99_ms 查询延迟
+    """
+    ids, matrix = _load_vectors(index)
+    if not ids:
+        raise RuntimeError(f"集合 {index.name} 为空")
+
+    rng = random.Random(seed)
+    query_rows = rng.sample(range(len(ids)), min(num_queries, len(ids)))
+    k = min(k, len(ids))
+    recalls, latencies = [], []
+    for row in query_rows:
+        query = matrix[row]
+        scores = matrix @ query
+        expected = {ids[i] for i in np.argpartition(-scores, k - 1)[:k]}
+
+        start = time.perf_counter()
+        result = index.query(query.tolist(), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(expected & set(result['ids'][0])) / k)
+
+    return {
+        'collection': index.name,
+        'vectors': len(ids),
+        'queries': len(query_rows),
+        'k': k,
+        'search_ef': index.metadata.get('hnsw:search_ef'),
+        'recall_at_k': float(np.mean(recalls)),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量索引重建和召回率/延迟基准")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rebuild', help="按当前配置的 HNSW 参数重建集合")
+    reindex = subparsers.add_parser('reindex', help="用 SQLite 中的描述重新计算描述向量")
+    reindex.add_argument('--keep', action='store_true', help="不清空描述向量集合，只覆盖已有记录")
+    bench = subparsers.add_parser('benchmark', help="对比近似检索与精确检索")
+    bench.add_argument('--collection', choices=['caption', 'clip'], default='caption')
+    bench.add_argument('--queries', type=int, default=100, help="查询数")
+    bench.add_argument('--k', type=int, default=10)
+    bench.add_argument('--search-ef', type=int, action='append', default=[],
+                       help="依次测试的 hnsw:search_ef，可重复；每个值复制一份临时集合测试，不改动原集合")
+    args = parser.parse_args()
+
+    if args.command == 'reindex':
+        from database import db
+        start = time.time()
+        total = db.reindex_vectors(clear=not args.keep)
+        Logger().info(f"[vector_index_tool] 重建 {total} 条描述向量，耗时 {time.time() - start:.1f} 秒")
+        return
+
+    vector_store = VectorStore()
+    if args.command == 'rebuild':
+        start = time.time()
+        vector_store.rebuild_collections()
+        Logger().info(f"[vector_index_tool] 重建完成，耗时 {time.time() - start:.1f} 秒")
+        return
+
+    index = vector_store.collection if args.collection == 'caption' else vector_store.image_collection
+    if not args.search_ef:
+        _print_result(run_benchmark(index, args.queries, args.k))
+        return
+    if not hasattr(index, 'copy_to'):
+        raise SystemExit("--search-ef 只适用于 ChromaDB 集合")
+    # HNSW 参数只在建集合时生效，每个取值在临时集合上测试
+    for search_ef in args.search_ef:
+        scratch = index.copy_to(f"{index.name}_bench", {**index.metadata, 'hnsw:search_ef': search_ef})
+        try:
+            _print_result(run_benchmark(scratch, args.queries, args.k))
+        finally:
+            scratch.client.delete_collection(scratch.name)
+
+
+def _print_result(result: dict):
+    print(' '.join(f"{key}={value:.4f}" if isinstance(value, float) else f"{key}={value}"
+                   for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()